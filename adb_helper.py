@@ -1,26 +1,312 @@
 # adb_helper.py
 import subprocess
 import os
-from typing import Optional
+import asyncio
+import queue
+import threading
+import atexit
+import uuid
+import shlex
+import base64
+import io
+from typing import Callable, Optional
+from step_timing import timed
 
-def _run_adb(cmd: list[str]) -> tuple[bool, str]:
+# Route `adb shell ...` calls through one long-lived shell per device.
+# Set ADB_PERSISTENT_SHELL=0 to fall back to one adb process per command.
+USE_PERSISTENT_SHELL = os.getenv("ADB_PERSISTENT_SHELL", "1") != "0"
+SHELL_TIMEOUT = float(os.getenv("ADB_SHELL_TIMEOUT", "30"))
+# adb executable (may include arguments, e.g. "python3 fake_adb.py" for offline benchmarks)
+ADB_PATH = os.getenv("ADB_PATH", "adb")
+# ADBKeyBoard (com.android.adbkeyboard) types a whole base64 broadcast in one shot, Unicode
+# included. ADB_FAST_TEXT: "auto" = use it for long or non-ASCII text when it's installed,
+# "always" = for all text, "never" = always `input text`
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+FAST_TEXT = os.getenv("ADB_FAST_TEXT", "auto")
+FAST_TEXT_MIN_LENGTH = int(os.getenv("ADB_FAST_TEXT_MIN_LENGTH", "24"))
+
+
+class ShellSessionError(Exception):
+    pass
+
+
+class ShellTimeout(ShellSessionError):
+    pass
+
+
+class AdbNotFound(ShellSessionError):
+    pass
+
+
+class AdbShellSession:
+    """One `adb shell` pipe; each command's output is framed by a unique end marker."""
+
+    def __init__(self, serial: Optional[str] = None):
+        self.serial = serial
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self):
+        cmd = _adb_prefix(self.serial) + ["shell"]
+        try:
+            self._proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1
+            )
+        except FileNotFoundError:
+            raise AdbNotFound("ADB not found in PATH")
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, lines: queue.Queue):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)  # EOF: shell died
+
+    def _send(self, command: str) -> str:
+        marker = f"__ADB_END_{uuid.uuid4().hex}__"
+        # stdin from /dev/null so the command can't swallow the next framed command;
+        # braces make the redirections (and $?) cover a whole `a; b && c` chain
+        self._proc.stdin.write(f"{{ {command}; }} </dev/null 2>&1; echo {marker}$?\n")
+        self._proc.stdin.flush()
+        return marker
+
+    def _receive(self, command: str, marker: str, timeout: float) -> tuple[bool, str]:
+        output = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                raise ShellTimeout(f"timed out after {timeout}s: {command}")
+            if line is None:
+                raise ShellSessionError("shell session closed")
+            idx = line.find(marker)
+            if idx == -1:
+                output.append(line)
+                continue
+            output.append(line[:idx])
+            code = line[idx + len(marker):].strip()
+            return code == "0", "".join(output).strip()
+
+    def run(self, args: list[str], timeout: float = SHELL_TIMEOUT) -> tuple[bool, str]:
+        """Run a shell command, reconnecting once if the session died before it was sent.
+
+        Once the command is written it is never replayed: an `input tap` that ran
+        before the connection dropped would otherwise run twice.
+        """
+        command = " ".join(args)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if not self.alive:
+                        self._start()
+                    marker = self._send(command)
+                except AdbNotFound:
+                    raise
+                except (OSError, ShellSessionError) as e:
+                    # Nothing reached the device yet, so a fresh session can safely send it
+                    self.close()
+                    if attempt == 1:
+                        raise ShellSessionError(str(e))
+                    continue
+                try:
+                    return self._receive(command, marker, timeout)
+                except ShellTimeout as e:
+                    # The command may still be running; don't replay it, just drop the session
+                    self.close()
+                    return False, str(e)
+                except (OSError, ShellSessionError) as e:
+                    # Sent and maybe executed; report the failure rather than resending
+                    self.close()
+                    return False, f"shell session lost after sending: {e}"
+        raise ShellSessionError("unreachable")
+
+    def close(self):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            self._proc.kill()
+            self._proc.wait(timeout=2)
+        except Exception:
+            pass
+        self._proc = None
+
+
+def _adb_args(serial: Optional[str] = None) -> list[str]:
+    return ["-s", serial] if serial else []
+
+
+def _adb_prefix(serial: Optional[str] = None) -> list[str]:
+    return shlex.split(ADB_PATH) + _adb_args(serial)
+
+
+# In-process stand-in for one-shot adb calls: runner(argv) -> (returncode, stdout, stderr),
+# argv being everything after the adb executable. None = spawn ADB_PATH per call.
+_adb_runner: Optional[Callable[[list[str]], tuple[int, bytes, bytes]]] = None
+
+
+def set_adb_runner(runner: Optional[Callable[[list[str]], tuple[int, bytes, bytes]]]):
+    """Serve one-shot adb calls from `runner` instead of spawning ADB_PATH.
+
+    Offline benchmarks use it so fake-device latency isn't buried under
+    process startup. The persistent shell session still runs ADB_PATH.
+    """
+    global _adb_runner
+    _adb_runner = runner
+
+
+def _exec_adb(cmd: list[str], serial: Optional[str] = None) -> tuple[int, bytes, bytes]:
+    if _adb_runner is not None:
+        return _adb_runner(_adb_args(serial) + cmd)
+    result = subprocess.run(_adb_prefix(serial) + cmd, capture_output=True, check=False)
+    return result.returncode, result.stdout, result.stderr
+
+
+async def _exec_adb_async(cmd: list[str], serial: Optional[str] = None) -> tuple[int, bytes, bytes]:
+    if _adb_runner is not None:
+        return await asyncio.to_thread(_adb_runner, _adb_args(serial) + cmd)
+    proc = await asyncio.create_subprocess_exec(
+        *(_adb_prefix(serial) + cmd),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout, stderr
+
+
+class _FinishedAdbProcess:
+    """Popen-shaped result of an adb_runner call, for open_adb_stream consumers."""
+
+    def __init__(self, returncode: int, stdout: bytes):
+        self.returncode = returncode
+        self.stdout = io.BytesIO(stdout)
+
+    def poll(self) -> int:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        return self.returncode
+
+
+_sessions: dict[Optional[str], AdbShellSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(serial: Optional[str] = None) -> AdbShellSession:
+    with _sessions_lock:
+        session = _sessions.get(serial)
+        if session is None:
+            session = _sessions[serial] = AdbShellSession(serial)
+        return session
+
+
+def use_persistent_shell(enabled: bool = True):
+    global USE_PERSISTENT_SHELL
+    USE_PERSISTENT_SHELL = enabled
+    if not enabled:
+        close_shell_sessions()
+
+
+def close_shell_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+atexit.register(close_shell_sessions)
+
+
+def _run_adb_process(cmd: list[str], serial: Optional[str] = None) -> tuple[bool, str]:
     try:
-        result = subprocess.run(
-            ["adb"] + cmd,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        if result.returncode == 0:
-            return True, result.stdout.strip()
+        code, stdout, stderr = _exec_adb(cmd, serial)
+        stdout = stdout.decode("utf-8", errors="replace").strip()
+        if code == 0:
+            return True, stdout
         else:
-            return False, result.stderr.strip() or result.stdout.strip()
+            return False, stderr.decode("utf-8", errors="replace").strip() or stdout
     except FileNotFoundError:
         return False, "ADB not found in PATH"
     except Exception as e:
         return False, f"ADB exception: {str(e)}"
 
-def device_check() -> bool:
+
+@timed("adb")
+def _run_adb_bytes(cmd: list[str], serial: Optional[str] = None) -> tuple[bool, bytes]:
+    """Like _run_adb but returns raw stdout bytes (for exec-out binary streams)."""
+    try:
+        code, stdout, stderr = _exec_adb(cmd, serial)
+        if code == 0:
+            return True, stdout
+        return False, stderr.strip() or stdout.strip()
+    except FileNotFoundError:
+        return False, b"ADB not found in PATH"
+    except Exception as e:
+        return False, f"ADB exception: {str(e)}".encode()
+
+
+@timed("adb")
+async def _run_adb_bytes_async(cmd: list[str], serial: Optional[str] = None) -> tuple[bool, bytes]:
+    """asyncio variant of _run_adb_bytes: the event loop keeps running while adb works."""
+    try:
+        code, stdout, stderr = await _exec_adb_async(cmd, serial)
+    except FileNotFoundError:
+        return False, b"ADB not found in PATH"
+    except Exception as e:
+        return False, f"ADB exception: {str(e)}".encode()
+    if code == 0:
+        return True, stdout
+    return False, stderr.strip() or stdout.strip()
+
+
+async def _run_adb_async(cmd: list[str], serial: Optional[str] = None) -> tuple[bool, str]:
+    success, output = await _run_adb_bytes_async(cmd, serial)
+    return success, output.decode("utf-8", errors="replace").strip()
+
+
+@timed("adb")
+def _run_adb(cmd: list[str], serial: Optional[str] = None) -> tuple[bool, str]:
+    """Run an adb command; `serial` targets one device (adb -s) when several are attached."""
+    if USE_PERSISTENT_SHELL and len(cmd) > 1 and cmd[0] == "shell":
+        try:
+            return _get_session(serial).run(cmd[1:])
+        except AdbNotFound as e:
+            # No adb binary: the per-call fallback would fail the same way
+            return False, str(e)
+        except ShellSessionError as e:
+            print(f"ADB shell session failed ({e}), falling back to per-call adb")
+    return _run_adb_process(cmd, serial)
+
+def list_devices() -> list[str]:
+    """Serials of all attached devices in the `device` state (skips offline/unauthorized)."""
+    success, output = _run_adb(["devices"])
+    if not success:
+        print(f"ADB devices failed: {output}")
+        return []
+    serials = []
+    for line in output.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            serials.append(parts[0])
+    return serials
+
+def device_check(serial: Optional[str] = None) -> bool:
+    if serial:
+        return serial in list_devices()
     success, output = _run_adb(["devices"])
     if not success:
         print(f"ADB devices failed: {output}")
@@ -28,9 +314,9 @@ def device_check() -> bool:
     lines = [line.strip() for line in output.splitlines() if line.strip()]
     return any("device" in line and not line.endswith("offline") for line in lines)
 
-def tap(x: int, y: int) -> bool:
+def tap(x: int, y: int, serial: Optional[str] = None) -> bool:
     x, y = int(x), int(y)
-    success, output = _run_adb(["shell", "input", "tap", str(x), str(y)])
+    success, output = _run_adb(["shell", "input", "tap", str(x), str(y)], serial)
     if success:
         print(f"Tap ({x}, {y})")
         return True
@@ -38,19 +324,72 @@ def tap(x: int, y: int) -> bool:
         print(f"Failed to tap ({x}, {y}): {output}")
         return False
 
-def type_text(text: str) -> bool:
+def _escape_input_text(text: str) -> str:
+    return (text
+            .replace("\\", "\\\\")
+            .replace(" ", "%s")
+            .replace("&", "\\&")
+            .replace("'", "\\'")
+            .replace('"', '\\"')
+            .replace(";", "\\;")
+            .replace("(", "\\(")
+            .replace(")", "\\)"))
+
+# serial → IME that was active before ADBKeyBoard took over ("" = already active),
+# or None when ADBKeyBoard isn't installed
+_previous_ime: dict[Optional[str], Optional[str]] = {}
+_ime_lock = threading.Lock()
+
+def _wants_fast_text(text: str) -> bool:
+    if FAST_TEXT == "never":
+        return False
+    return FAST_TEXT == "always" or not text.isascii() or len(text) >= FAST_TEXT_MIN_LENGTH
+
+def _adb_keyboard_ready(serial: Optional[str] = None) -> bool:
+    """Make ADBKeyBoard the active IME (once per device); False when it isn't installed."""
+    with _ime_lock:
+        if serial not in _previous_ime:
+            success, output = _run_adb(["shell", "ime", "list", "-s"], serial)
+            if not success or ADB_KEYBOARD_IME not in output:
+                _previous_ime[serial] = None
+            else:
+                _, current = _run_adb(["shell", "settings", "get", "secure", "default_input_method"], serial)
+                current = current.strip()
+                if current != ADB_KEYBOARD_IME:
+                    _run_adb(["shell", "ime", "set", ADB_KEYBOARD_IME], serial)
+                _previous_ime[serial] = "" if current == ADB_KEYBOARD_IME else current
+        return _previous_ime[serial] is not None
+
+def restore_input_method(serial: Optional[str] = None):
+    """Switch back to the IME that was active before the fast text path took over."""
+    with _ime_lock:
+        previous = _previous_ime.pop(serial, None)
+    if previous:
+        _run_adb_process(["shell", "ime", "set", previous], serial)
+
+def _restore_input_methods():
+    for serial in list(_previous_ime):
+        restore_input_method(serial)
+
+atexit.register(_restore_input_methods)
+
+def _text_command(text: str, serial: Optional[str] = None) -> tuple[str, bool]:
+    """Shell command that types `text`; second value is True for the ADBKeyBoard path."""
+    if _wants_fast_text(text) and _adb_keyboard_ready(serial):
+        msg = base64.b64encode(text.encode("utf-8")).decode("ascii")
+        return f"am broadcast -a ADB_INPUT_B64 --es msg {msg}", True
+    if not text.isascii():
+        print("Non-ASCII text without ADBKeyBoard: `input text` may drop characters")
+    return f"input text {_escape_input_text(text)}", False
+
+def type_text(text: str, serial: Optional[str] = None) -> bool:
     if not text:
         return True
-    safe_text = (text
-                 .replace("\\", "\\\\")
-                 .replace(" ", "%s")
-                 .replace("&", "\\&")
-                 .replace("'", "\\'")
-                 .replace('"', '\\"')
-                 .replace(";", "\\;")
-                 .replace("(", "\\(")
-                 .replace(")", "\\)"))
-    success, output = _run_adb(["shell", "input", "text", safe_text])
+    command, fast = _text_command(text, serial)
+    success, output = _run_adb(["shell", command], serial)
+    if not success and fast:
+        print(f"ADBKeyBoard input failed ({output}) → input text")
+        success, output = _run_adb(["shell", "input", "text", _escape_input_text(text)], serial)
     if success:
         print(f"Typed: {text}")
         return True
@@ -58,9 +397,9 @@ def type_text(text: str) -> bool:
         print(f"Failed to type '{text}': {output}")
         return False
 
-def swipe(x1: int, y1: int, x2: int, y2: int, duration: int = 300) -> bool:
+def swipe(x1: int, y1: int, x2: int, y2: int, duration: int = 300, serial: Optional[str] = None) -> bool:
     coords = [int(x1), int(y1), int(x2), int(y2), int(duration)]
-    success, output = _run_adb(["shell", "input", "swipe", *map(str, coords)])
+    success, output = _run_adb(["shell", "input", "swipe", *map(str, coords)], serial)
     if success:
         print(f"Swipe {coords[:-1]} over {duration}ms")
         return True
@@ -68,8 +407,8 @@ def swipe(x1: int, y1: int, x2: int, y2: int, duration: int = 300) -> bool:
         print(f"Swipe failed: {output}")
         return False
 
-def keyevent(keycode: str) -> bool:
-    success, output = _run_adb(["shell", "input", "keyevent", str(keycode)])
+def keyevent(keycode: str, serial: Optional[str] = None) -> bool:
+    success, output = _run_adb(["shell", "input", "keyevent", str(keycode)], serial)
     key_names = {"3": "HOME", "4": "BACK", "66": "ENTER"}
     name = key_names.get(str(keycode), keycode)
     if success:
@@ -79,58 +418,249 @@ def keyevent(keycode: str) -> bool:
         print(f"Keyevent {name} failed: {output}")
         return False
 
-def press_back() -> bool:
-    return keyevent("4")
+class InputBatch:
+    """Queue several input actions and send them in ONE shell invocation.
 
-def press_enter() -> bool:
-    return keyevent("66")
+    Commands are chained with && so the batch stops at the first failure:
+        InputBatch(serial).text("Meeting Notes").tap(640, 1200).text("Daily Standup").send()
+    """
 
-def launch_app(package_name: str) -> bool:
+    def __init__(self, serial: Optional[str] = None):
+        self.serial = serial
+        self._commands: list[str] = []
+        self._labels: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def _add(self, command: str, label: str) -> "InputBatch":
+        self._commands.append(command)
+        self._labels.append(label)
+        return self
+
+    def tap(self, x: int, y: int) -> "InputBatch":
+        return self._add(f"input tap {int(x)} {int(y)}", f"tap ({int(x)}, {int(y)})")
+
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 300) -> "InputBatch":
+        coords = " ".join(str(int(v)) for v in (x1, y1, x2, y2, duration))
+        return self._add(f"input swipe {coords}", f"swipe {coords}")
+
+    def keyevent(self, keycode: str) -> "InputBatch":
+        return self._add(f"input keyevent {keycode}", f"key {keycode}")
+
+    def text(self, text: str) -> "InputBatch":
+        if not text:
+            return self
+        command, _ = _text_command(text, self.serial)
+        return self._add(command, f"type {text!r}")
+
+    def pause(self, seconds: float) -> "InputBatch":
+        """Device-side sleep between two actions (e.g. let a field take focus)."""
+        return self._add(f"sleep {seconds:g}", f"pause {seconds:g}s")
+
+    def send(self) -> bool:
+        if not self._commands:
+            return True
+        commands, labels = self._commands, self._labels
+        self._commands, self._labels = [], []
+        line = " && ".join(commands)
+        success, output = _run_adb(["shell", line], self.serial)
+        if success:
+            print(f"Input batch ({len(commands)}): {', '.join(labels)}")
+        else:
+            print(f"Input batch failed ({', '.join(labels)}): {output}")
+        return success
+
+def press_back(serial: Optional[str] = None) -> bool:
+    return keyevent("4", serial)
+
+def press_enter(serial: Optional[str] = None) -> bool:
+    return keyevent("66", serial)
+
+def launch_app(package_name: str, serial: Optional[str] = None) -> bool:
     success, output = _run_adb([
         "shell", "monkey",
         "-p", package_name,
         "-c", "android.intent.category.LAUNCHER",
         "1"
-    ])
+    ], serial)
     if success:
         print(f"Launched: {package_name}")
         return True
-    success2, _ = _run_adb(["shell", "pidof", package_name])
+    success2, _ = _run_adb(["shell", "pidof", package_name], serial)
     if success2:
         print(f"Launched (fallback): {package_name}")
         return True
     print(f"Failed to launch {package_name}: {output}")
     return False
 
-def take_screenshot(path: str) -> bool:
+def force_stop(package_name: str, serial: Optional[str] = None) -> bool:
+    success, _ = _run_adb(["shell", "am", "force-stop", package_name], serial)
+    return success
+
+def clear_app_data(package_name: str, serial: Optional[str] = None) -> bool:
+    """`pm clear`: wipe the app's data and caches, as on a fresh install."""
+    success, output = _run_adb(["shell", "pm", "clear", package_name], serial)
+    if not success or "Success" not in output:
+        print(f"pm clear {package_name} failed: {output}")
+        return False
+    return True
+
+_launch_activities: dict[tuple[Optional[str], str], str] = {}
+
+def resolve_launch_activity(package_name: str, serial: Optional[str] = None) -> Optional[str]:
+    """Launcher component (pkg/.Activity) of an installed app, cached per device."""
+    key = (serial, package_name)
+    if key not in _launch_activities:
+        success, output = _run_adb([
+            "shell", "cmd", "package", "resolve-activity", "--brief",
+            "-c", "android.intent.category.LAUNCHER", package_name
+        ], serial)
+        lines = [line.strip() for line in output.splitlines() if "/" in line]
+        if not success or not lines:
+            print(f"No launcher activity for {package_name}: {output}")
+            return None
+        _launch_activities[key] = lines[-1]
+    return _launch_activities[key]
+
+@timed("launch")
+def start_app(package_name: str, serial: Optional[str] = None) -> Optional[dict]:
+    """`am start -W`: returns once the first frame is drawn, with the measured launch times
+    ({"total_ms", "wait_ms"}), or None on failure."""
+    component = resolve_launch_activity(package_name, serial)
+    if component is None:
+        return None
+    success, output = _run_adb(["shell", "am", "start", "-W", "-n", component], serial)
+    if not success or "Error" in output:
+        print(f"am start {component} failed: {output}")
+        return None
+    times = {}
+    for line in output.splitlines():
+        name, _, value = line.partition(":")
+        if name.strip() in ("TotalTime", "WaitTime") and value.strip().isdigit():
+            times["total_ms" if name.strip() == "TotalTime" else "wait_ms"] = int(value.strip())
+    print(f"Started {component} in {times.get('total_ms', '?')} ms")
+    return times
+
+def enable_root(serial: Optional[str] = None) -> bool:
+    """Restart adbd as root (emulator/userdebug images only) so /data/data is reachable."""
+    success, output = _run_adb(["shell", "id", "-u"], serial)
+    if success and output.strip() == "0":
+        return True
+    _run_adb_process(["root"], serial)
+    _run_adb_process(["wait-for-device"], serial)
+    # adbd restarted under the persistent session; it reconnects on next use
+    success, output = _run_adb(["shell", "id", "-u"], serial)
+    if not (success and output.strip() == "0"):
+        print(f"adb root unavailable: {output}")
+        return False
+    return True
+
+def push_path(local_path: str, device_path: str, serial: Optional[str] = None) -> bool:
+    success, output = _run_adb(["push", local_path, device_path], serial)
+    if not success:
+        print(f"adb push {local_path} failed: {output}")
+    return success
+
+def pull_path(device_path: str, local_path: str, serial: Optional[str] = None) -> bool:
+    success, output = _run_adb(["pull", device_path, local_path], serial)
+    if not success:
+        print(f"adb pull {device_path} failed: {output}")
+    return success
+
+@timed("screenshot")
+def take_screenshot(path: str, serial: Optional[str] = None) -> bool:
     if not path:
         return False
     os.makedirs(os.path.dirname(path), exist_ok=True)
     try:
+        code, png, stderr = _exec_adb(["exec-out", "screencap", "-p"], serial)
+        if code != 0:
+            print(f"Screenshot failed: {stderr.decode(errors='replace').strip()}")
+            return False
         with open(path, "wb") as f:
-            subprocess.run(
-                ["adb", "exec-out", "screencap", "-p"],
-                stdout=f,
-                stderr=subprocess.PIPE,
-                check=True
-            )
+            f.write(png)
         print(f"Screenshot saved: {path}")
         return True
     except Exception as e:
         print(f"Screenshot exception: {e}")
         return False
 
+@timed("screencap")
+def capture_raw_screencap(serial: Optional[str] = None) -> Optional[bytes]:
+    """Raw framebuffer from `screencap` (no -p): header + RGBA pixels, no device-side PNG encode."""
+    success, data = _run_adb_bytes(["exec-out", "screencap"], serial)
+    if not success or not data:
+        print(f"Raw screencap failed: {data.decode(errors='replace')}")
+        return None
+    return data
+
+def get_focused_window(serial: Optional[str] = None) -> Optional[str]:
+    """Current focused window/activity from `dumpsys window` (changes while transitions run)."""
+    success, output = _run_adb(["shell", "dumpsys", "window", "|", "grep", "-E", "'mCurrentFocus|mFocusedApp'"], serial)
+    if not success:
+        return None
+    return output.strip()
+
+@timed("ui.dump")
+def dump_ui_hierarchy_bytes(serial: Optional[str] = None) -> tuple[bool, bytes]:
+    """Dump UI hierarchy straight to stdout (`exec-out uiautomator dump /dev/tty`).
+
+    One adb call, no device-side or host-side file. The XML is followed by
+    uiautomator's "dumped to: /dev/tty" status line, which the parser skips.
+    Returns (True, xml) or (False, uiautomator's error output).
+    """
+    success, data = _run_adb_bytes(["exec-out", "uiautomator", "dump", "/dev/tty"], serial)
+    if not success or b"<hierarchy" not in data:
+        print(f"UI dump to /dev/tty failed: {data[-200:].decode(errors='replace').strip()}")
+        return False, data
+    return True, data
+
+def open_adb_stream(cmd: list[str], serial: Optional[str] = None) -> Optional[subprocess.Popen]:
+    """Start an adb command with stdout as a binary pipe, for consumers that parse while adb writes."""
+    if _adb_runner is not None:
+        code, stdout, _ = _adb_runner(_adb_args(serial) + cmd)
+        return _FinishedAdbProcess(code, stdout)
+    try:
+        return subprocess.Popen(
+            _adb_prefix(serial) + cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        print("ADB not found in PATH")
+        return None
+
+def stream_ui_hierarchy(
+    device_path: str = "/sdcard/ui.xml",
+    serial: Optional[str] = None
+) -> Optional[subprocess.Popen]:
+    """Dump UI hierarchy on device and stream it back over `exec-out cat` (no pull, no local file).
+
+    The caller reads proc.stdout and then waits on the process.
+    """
+    success, _ = _run_adb(["shell", "uiautomator", "dump", device_path], serial)
+    if not success:
+        print("UI dump failed on device")
+        return None
+    return open_adb_stream(["exec-out", "cat", device_path], serial)
+
 # NEW: Dump UI hierarchy
-def dump_ui_hierarchy(device_path: str = "/sdcard/ui.xml", local_path: str = "current_ui.xml") -> Optional[str]:
+@timed("ui.dump")
+def dump_ui_hierarchy(
+    device_path: str = "/sdcard/ui.xml",
+    local_path: str = "current_ui.xml",
+    serial: Optional[str] = None
+) -> Optional[str]:
     """Dump UI hierarchy via uiautomator and pull to local."""
     try:
         # Dump on device
-        success, _ = _run_adb(["shell", "uiautomator", "dump", device_path])
+        success, _ = _run_adb(["shell", "uiautomator", "dump", device_path], serial)
         if not success:
             print("UI dump failed on device")
             return None
         # Pull to local
-        success, _ = _run_adb(["pull", device_path, local_path])
+        success, _ = _run_adb(["pull", device_path, local_path], serial)
         if success and os.path.exists(local_path):
             print(f"UI hierarchy saved: {local_path}")
             return local_path
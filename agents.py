@@ -1,8 +1,23 @@
 import json
-from typing import List, Dict, Any
-from gemini_helper import analyze_image_with_prompt
-from adb_helper import tap, type_text, dump_ui_hierarchy
-from ui_parser import get_clickable_elements
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from gemini_helper import (
+    analyze_image_with_prompt,
+    analyze_image_with_prompt_async,
+    locate_with_prompt,
+    to_device_point,
+    AnswerFormat,
+)
+from adb_helper import tap, type_text, press_back, InputBatch
+from settle import wait_for_settle
+from ui_parser import capture_ui_snapshot, diff_snapshots, UISnapshot, UIDiff, ElementStore
+from screen_classifier import classify_snapshot, CLASSIFIER_THRESHOLD
+
+
+# Joins actions the Executor sends to the device in a single adb shell call
+BATCH_SEPARATOR = " && "
+# Device-side pause after tapping a text field so it has focus before the text arrives
+FOCUS_PAUSE = 0.4
 
 
 def is_vault_goal(goal: str) -> bool:
@@ -26,47 +41,219 @@ def is_settings_appearance_goal(goal: str) -> bool:
     return "go to settings" in g and "navigate to the appearance tab" in g
 
 
+def goal_target_screen(goal: str) -> Optional[str]:
+    """Screen label the ScreenNavigator can reach for this goal before the planner takes over."""
+    if is_settings_appearance_goal(goal):
+        return "appearance"
+    if is_note_creation_goal(goal):
+        return "new_tab"
+    return None
+
+
+SCREEN_LABELS = [
+    "welcome", "sync", "config", "folder_select", "permission",
+    "new_tab", "editor", "file_browser", "vault_open", "loading", "settings", "appearance",
+]
+
+# Streamed answers stop at the first complete label / JSON verdict
+SCREEN_LABEL_ANSWER = AnswerFormat.label(SCREEN_LABELS)
+VERIFY_ANSWER = AnswerFormat.json_object(("completed", "pass"), max_output_tokens=192)
+ASSESS_ANSWER = AnswerFormat.json_object(("screen", "completed", "pass"), max_output_tokens=256)
+
+SCREEN_DEFINITIONS = """
+DEFINITIONS:
+- "editor": A note is open. You see a title field at the top (often 'Untitled')
+  and a large empty body area below. There may be formatting icons or a cursor.
+- "new_tab": This is the screen that appears after tapping the 3-dots menu.
+  It shows actions like "Create new note (Ctrl + N)" and "Open another vault".
+- "file_browser": Shows the vault name at the top, file list, and icons like
+  pencil, plus, upload, folder, download.
+- "settings": The main Settings screen is visible, with a list of categories like "Appearance", "Editor", "Files & links", etc.
+- "appearance": The Appearance settings tab is open, showing options like Theme, Accent color, Font, etc.
+"""
+
+SCREEN_CLASSIFY_PROMPT = """
+You are classifying an Obsidian Android screen.
+Return EXACTLY one label from this list:
+"welcome", "sync", "config", "folder_select", "permission",
+"new_tab", "editor", "file_browser", "vault_open", "loading", "settings", "appearance"
+""" + SCREEN_DEFINITIONS + """Return ONLY the label.
+"""
+
+
+THREE_DOTS_PROMPT = """
+This is the top toolbar of an Obsidian Android screen.
+Identify the pixel coordinate of the three-dots (more options) button.
+Return ONLY:
+{"x": <int>, "y": <int>}
+"""
+
+
+def parse_json_response(response: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not response:
+        return None
+    try:
+        text = response.strip().strip("```json").strip("```").strip()
+        return json.loads(text[text.find("{"):text.rfind("}")+1])
+    except Exception:
+        return None
+
+
 class Planner:
-    def __init__(self):
+    def __init__(self, serial: Optional[str] = None):
+        self.serial = serial
         self.field_tapped = False
         self.name_typed = False
         self.title_typed = False
         self.body_tap_done = False
         self.body_typed = False
         self.three_dots_tapped = False
+        self.three_dots_located = False
         self.tap_attempts = 0
         # T3 state
         self.gear_tapped = False
         self.appearance_row_tapped = False
+        self.last_screen: Optional[str] = None
+        # Flags the last planned action sets once it has actually run (see action_result)
+        self.pending_flags: Tuple[str, ...] = ()
+        # Previous step's snapshot and what changed since (see observe)
+        self.last_snapshot: Optional[UISnapshot] = None
+        self.last_diff: Optional[UIDiff] = None
+        # Screen-label sources, for the "served without a vision call" ratio
+        self.xml_classified = 0
+        self.vision_classified = 0
 
-    def decide_next_action(self, goal: str, screenshot_path: str, history: List[str]) -> str:
-        dump_ui_hierarchy()
-        elements = get_clickable_elements()
-        vision_prompt = """
-You are classifying an Obsidian Android screen.
-Return EXACTLY one label from this list:
-"welcome", "sync", "config", "folder_select", "permission",
-"new_tab", "editor", "file_browser", "vault_open", "loading", "settings", "appearance"
-DEFINITIONS:
-- "editor": A note is open. You see a title field at the top (often 'Untitled')
-  and a large empty body area below. There may be formatting icons or a cursor.
-- "new_tab": This is the screen that appears after tapping the 3-dots menu.
-  It shows actions like "Create new note (Ctrl + N)" and "Open another vault".
-- "file_browser": Shows the vault name at the top, file list, and icons like
-  pencil, plus, upload, folder, download.
-- "settings": The main Settings screen is visible, with a list of categories like "Appearance", "Editor", "Files & links", etc.
-- "appearance": The Appearance settings tab is open, showing options like Theme, Accent color, Font, etc.
-Return ONLY the label.
-"""
-        vision_desc = analyze_image_with_prompt(screenshot_path, vision_prompt) or "unknown"
-        vision_desc = vision_desc.lower().strip()
+    def xml_screen(self, snapshot: Optional[UISnapshot]) -> Optional[str]:
+        """Label from the UI hierarchy alone, or None when the rules aren't confident."""
+        if snapshot is None:
+            return None
+        label, confidence = classify_snapshot(snapshot)
+        return label if confidence >= CLASSIFIER_THRESHOLD else None
+
+    def observe(self, snapshot: UISnapshot) -> Optional[UIDiff]:
+        """Diff a new step's snapshot against the previous one; None on the first step."""
+        if snapshot is self.last_snapshot:
+            return self.last_diff
+        self.last_diff = diff_snapshots(self.last_snapshot, snapshot) if self.last_snapshot is not None else None
+        self.last_snapshot = snapshot
+        if self.last_diff is not None:
+            print(f"UI delta: {self.last_diff.summary()}")
+        return self.last_diff
+
+    def action_result(self, success: bool):
+        """Report how the last planned action went; a batched plan's flags are only set on success."""
+        flags, self.pending_flags = self.pending_flags, ()
+        if success:
+            for flag in flags:
+                setattr(self, flag, True)
+
+    def absorb(self, goal: str, action: str, screen: Optional[str], success: bool = True):
+        """Update the flags for an action the planner didn't plan (trace replay, graph navigation),
+        so it picks up where that action left off instead of redoing the work."""
+        if not success or not screen:
+            return
+        self.last_screen = screen
+        for part in action.split(BATCH_SEPARATOR):
+            kind = part.strip().split("|")[0]
+            is_tap = kind in ("tap_index", "tap_xy")
+            if is_vault_goal(goal):
+                if "config" in screen:
+                    if kind == "type":
+                        self.name_typed = True
+                    elif is_tap and not self.field_tapped:
+                        self.field_tapped = True
+            elif is_note_creation_goal(goal):
+                if "file_browser" in screen and is_tap:
+                    self.three_dots_tapped = True
+                elif "new_tab" in screen and kind == "tap_xy":
+                    self.tap_attempts += 1
+                elif "editor" in screen:
+                    if kind == "type":
+                        if self.title_typed:
+                            self.body_typed = True
+                        self.title_typed = True
+                    elif is_tap and self.title_typed:
+                        self.body_tap_done = True
+            elif is_settings_appearance_goal(goal):
+                if "file_browser" in screen and is_tap:
+                    self.gear_tapped = True
+                elif "settings" in screen and is_tap:
+                    self.appearance_row_tapped = True
+
+    @staticmethod
+    def _body_hint(tap_hint: Optional[Tuple[int, int]], store: ElementStore) -> Optional[Tuple[int, int]]:
+        """tap_hint if it can be the editor body: below the title field when the hierarchy shows one."""
+        if tap_hint is None:
+            return None
+        titles = store.find_text("untitled")
+        if titles and tap_hint[1] <= titles[0].bounds[3]:
+            return None
+        return tap_hint
+
+    @property
+    def last_action_effective(self) -> Optional[bool]:
+        """Whether the previous action changed the UI hierarchy (None = unknown)."""
+        if self.last_diff is None or self.last_snapshot is None or self.last_snapshot.nodes is None:
+            return None
+        return self.last_diff.changed
+
+    def classification_stats(self) -> Dict[str, Any]:
+        total = self.xml_classified + self.vision_classified
+        return {
+            "xml": self.xml_classified,
+            "vision": self.vision_classified,
+            "xml_fraction": self.xml_classified / total if total else 0.0,
+        }
+
+    def classify_screen(self, screenshot: Any) -> str:
+        vision_desc = analyze_image_with_prompt(
+            screenshot, SCREEN_CLASSIFY_PROMPT, preset="classify", answer=SCREEN_LABEL_ANSWER
+        ) or "unknown"
+        return vision_desc.lower().strip()
+
+    async def classify_screen_async(self, screenshot: Any) -> str:
+        vision_desc = await analyze_image_with_prompt_async(
+            screenshot, SCREEN_CLASSIFY_PROMPT, preset="classify", answer=SCREEN_LABEL_ANSWER
+        ) or "unknown"
+        return vision_desc.lower().strip()
+
+    def decide_next_action(
+        self,
+        goal: str,
+        screenshot: Any = None,
+        history: Optional[List[str]] = None,
+        snapshot: Optional[UISnapshot] = None,
+        screen_label: Optional[str] = None,
+        tap_hint: Optional[Tuple[int, int]] = None
+    ) -> str:
+        """Pick the next action. A confident XML classification wins; otherwise
+        `screen_label`/`tap_hint` from a combined Supervisor.assess_step call are
+        used, and without them the Planner asks the model itself."""
+        if snapshot is None:
+            snapshot = capture_ui_snapshot(screenshot, serial=self.serial)
+        if screenshot is None:
+            screenshot = snapshot.screenshot
+        self.observe(snapshot)
+        self.pending_flags = ()
+        store = snapshot.store
+        xml_label = self.xml_screen(snapshot)
+        if xml_label is not None:
+            vision_desc = xml_label
+            self.xml_classified += 1
+        elif screen_label is not None:
+            vision_desc = screen_label.lower().strip()
+            self.vision_classified += 1
+        else:
+            vision_desc = self.classify_screen(screenshot)
+            self.vision_classified += 1
         # Heuristic override: if UI hierarchy contains "untitled", force editor
-        try:
-            ui_xml = open("current_ui.xml", "r", encoding="utf-8").read().lower()
-            if "untitled" in ui_xml:
-                vision_desc = "editor"
-        except:
-            pass
+        if snapshot.contains_text("untitled"):
+            vision_desc = "editor"
+        # tap_hint locates an element of the screen the combined call labelled; on any other
+        # screen (XML label or "untitled" override disagreeing) it points at the wrong thing
+        if tap_hint is not None and (screen_label is None or vision_desc != screen_label.lower().strip()):
+            tap_hint = None
+        self.last_screen = vision_desc
         print(f"Vision detected: {vision_desc}")
 
         # -------------------------
@@ -84,9 +271,9 @@ Return ONLY the label.
                 if not self.name_typed:
                     self.name_typed = True
                     return "type|InternVault"
-                for i, e in enumerate(elements):
-                    if "create a vault" in (e.get("text", "") or "").lower():
-                        return f"tap_index|{i}"
+                matches = store.find_text("create a vault", clickable_only=True)
+                if matches:
+                    return f"tap_index|{matches[0].clickable_index}"
                 return "tap_index|1"
             elif "folder_select" in vision_desc:
                 return "tap_index|5"
@@ -104,20 +291,31 @@ Return ONLY the label.
             if "file_browser" in vision_desc:
                 if not self.three_dots_tapped:
                     self.three_dots_tapped = True
-                    for i, e in enumerate(elements):
-                        bounds = e.get("bounds", [0, 0, 0, 0])
-                        x1, y1, x2, y2 = bounds
-                        width = x2 - x1
-                        height = y2 - y1
-                        if y1 < 250 and width < 200 and height < 200 and x1 > 850:
-                            return f"tap_index|{i}"
+                    # Small clickable in the top-right toolbar corner
+                    for node in store.find_in_region(851, 0, 1 << 16, 250, clickable_only=True):
+                        if node.bounds[0] > 850 and node.bounds[1] < 250 and node.width < 200 and node.height < 200:
+                            return f"tap_index|{node.clickable_index}"
+                    # The combined call already located the button
+                    if tap_hint is not None:
+                        return f"tap_xy|{tap_hint[0]}|{tap_hint[1]}"
                     return "tap_xy|1020|150"
+                if self.last_action_effective is False and not self.three_dots_located:
+                    # The tap above missed → only now pay for a locate call.
+                    # Only the top toolbar is sent; the answer is mapped back to device pixels
+                    self.three_dots_located = True
+                    point = locate_with_prompt(screenshot, THREE_DOTS_PROMPT, preset="toolbar")
+                    if point is not None:
+                        return f"tap_xy|{point[0]}|{point[1]}"
                 return "wait|2"
             # Step 2: Tap "Create new note"
             elif "new_tab" in vision_desc:
-                for i, e in enumerate(elements):
-                    if "create new note" in (e.get("text", "") or "").lower():
-                        return f"tap_index|{i}"
+                matches = store.find_text("create new note", clickable_only=True)
+                if matches:
+                    return f"tap_index|{matches[0].clickable_index}"
+                # A hint that already missed (no UI change) would be the same cached point again
+                if tap_hint is not None and self.tap_attempts < 4 and self.last_action_effective is not False:
+                    self.tap_attempts += 1
+                    return f"tap_xy|{tap_hint[0]}|{tap_hint[1]}"
                 if self.tap_attempts < 4:
                     tap_prompt = """
 Identify EXACT pixel coordinate to tap:
@@ -128,15 +326,10 @@ Return ONLY:
   "y": <int>
 }}
 """
-                    resp = analyze_image_with_prompt(screenshot_path, tap_prompt)
-                    try:
-                        text = resp.strip().strip("```json").strip("```").strip()
-                        coord = json.loads(text[text.find("{"):text.rfind("}")+1])
-                        x, y = int(coord["x"]), int(coord["y"])
-                        self.tap_attempts += 1
-                        return f"tap_xy|{x}|{y}"
-                    except:
-                        self.tap_attempts += 1
+                    point = locate_with_prompt(screenshot, tap_prompt)
+                    self.tap_attempts += 1
+                    if point is not None:
+                        return f"tap_xy|{point[0]}|{point[1]}"
                 if self.tap_attempts < 7:
                     offsets = [(0,20),(0,-20),(20,0),(-20,0),(20,20),(-20,-20)]
                     dx, dy = offsets[self.tap_attempts % len(offsets)]
@@ -147,9 +340,23 @@ Return ONLY:
                 return "FAILED"
             # Step 3: Editor — type title + body
             elif "editor" in vision_desc:
+                # A batch that failed halfway may have typed the title already
+                if not self.title_typed and snapshot.contains_text("meeting notes"):
+                    self.title_typed = True
+                body_hint = self._body_hint(tap_hint, store)
+                if not self.title_typed and body_hint is not None:
+                    # Body location already known: title, body tap and body in one round trip
+                    self.pending_flags = ("title_typed", "body_tap_done", "body_typed")
+                    return BATCH_SEPARATOR.join([
+                        "type|Meeting Notes", f"tap_xy|{body_hint[0]}|{body_hint[1]}",
+                        f"pause|{FOCUS_PAUSE}", "type|Daily Standup"
+                    ])
                 if not self.title_typed:
                     self.title_typed = True
                     return "type|Meeting Notes"
+                if not self.body_tap_done and body_hint is not None:
+                    self.body_tap_done = True
+                    return f"tap_xy|{body_hint[0]}|{body_hint[1]}"
                 if not self.body_tap_done:
                     body_prompt = """
 Identify pixel coordinate to tap the BODY area.
@@ -159,16 +366,11 @@ Return ONLY:
   "y": <int>
 }}
 """
-                    resp = analyze_image_with_prompt(screenshot_path, body_prompt)
-                    try:
-                        text = resp.strip().strip("```json").strip("```").strip()
-                        coord = json.loads(text[text.find("{"):text.rfind("}")+1])
-                        x, y = int(coord["x"]), int(coord["y"])
-                        self.body_tap_done = True
-                        return f"tap_xy|{x}|{y}"
-                    except:
-                        self.body_tap_done = True
-                        return "tap_xy|640|1200"
+                    point = locate_with_prompt(screenshot, body_prompt)
+                    self.body_tap_done = True
+                    if point is not None:
+                        return f"tap_xy|{point[0]}|{point[1]}"
+                    return "tap_xy|640|1200"
                 if not self.body_typed:
                     self.body_typed = True
                     return "type|Daily Standup"
@@ -186,10 +388,9 @@ Return ONLY:
             elif "settings" in vision_desc:
                 if not self.appearance_row_tapped:
                     self.appearance_row_tapped = True
-                    for i, e in enumerate(elements):
-                        text = (e.get("text", "") or "").lower()
-                        if "appearance" in text:
-                            return f"tap_index|{i}"
+                    matches = store.find_text("appearance", clickable_only=True)
+                    if matches:
+                        return f"tap_index|{matches[0].clickable_index}"
                     return "tap_xy|540|580"
             elif "appearance" in vision_desc:
                 return "DONE"
@@ -200,16 +401,7 @@ Return ONLY:
 
 class Supervisor:
     def __init__(self):
-        self.base_prompt = """
-You are a strict verifier for Obsidian Android.
-Goal: {goal}
-Return ONLY JSON:
-{{
-  "completed": true/false,
-  "pass": true/false,
-  "reason": "short explanation"
-}}
-
+        rules = """
 RULES:
 1) Vault goal:
    Pass ONLY IF:
@@ -230,10 +422,157 @@ RULES:
      - Accent color swatch is RED or reddish-purple
    Fail if accent color is not red
 """
+        self.base_prompt = """
+You are a strict verifier for Obsidian Android.
+Goal: {goal}
+Return ONLY JSON:
+{{
+  "completed": true/false,
+  "pass": true/false,
+  "reason": "short explanation"
+}}
+""" + rules
+        # Verify + classify + locate in one request (see assess_step)
+        self.combined_prompt = """
+You are a strict verifier and screen classifier for Obsidian Android.
+Goal: {goal}
+Return ONLY JSON:
+{{
+  "screen": "<EXACTLY one label from: welcome, sync, config, folder_select, permission, new_tab, editor, file_browser, vault_open, loading, settings, appearance>",
+  "completed": true/false,
+  "pass": true/false,
+  "reason": "short explanation",
+  "tap": {{"x": <int>, "y": <int>}} or null
+}}
+
+"tap" is required ONLY when:
+- screen is "file_browser": center of the three-dots (more options) button in the top toolbar
+- screen is "new_tab": center of "Create new note (Ctrl + N)"
+- screen is "editor": a point inside the BODY area below the title
+Otherwise "tap" is null.
+""" + rules + SCREEN_DEFINITIONS
+
+    def assess_step(
+        self,
+        goal: str,
+        screenshot: Any = None,
+        snapshot: Optional[UISnapshot] = None,
+        last_change: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Verify, classify and locate in ONE vision call.
+
+        Returns None when the combined answer is missing or malformed so the
+        caller can fall back to verify_state + Planner classification.
+        """
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        prompt, cache_prompt = self._with_change(self.combined_prompt.format(goal=goal), last_change)
+        response = analyze_image_with_prompt(
+            screenshot, prompt, temperature=0.0, preset="locate", answer=ASSESS_ANSWER,
+            exact_key=self._exact_key(snapshot), cache_prompt=cache_prompt
+        )
+        return self._parse_assessment(response, screenshot)
+
+    async def assess_step_async(
+        self,
+        goal: str,
+        screenshot: Any = None,
+        snapshot: Optional[UISnapshot] = None,
+        last_change: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        prompt, cache_prompt = self._with_change(self.combined_prompt.format(goal=goal), last_change)
+        response = await analyze_image_with_prompt_async(
+            screenshot, prompt, temperature=0.0, preset="locate", answer=ASSESS_ANSWER,
+            exact_key=self._exact_key(snapshot), cache_prompt=cache_prompt
+        )
+        return self._parse_assessment(response, screenshot)
+
+    @staticmethod
+    def _exact_key(snapshot: Optional[UISnapshot]) -> str:
+        """Verdicts are cached per exact screen: typed text must not hit another screen's answer."""
+        if snapshot is None or snapshot.nodes is None:
+            return ""
+        return snapshot.structure_hash
+
+    @staticmethod
+    def _change_key(last_change: str) -> str:
+        """`last_change` without its per-step details (coordinates, text, element names):
+        action kinds, outcome and whether the UI moved."""
+        action, _, rest = last_change.partition(" → ")
+        kinds = "+".join(part.strip().split("|")[0] for part in action.split(BATCH_SEPARATOR))
+        status, _, ui = rest.partition(" | UI: ")
+        moved = "" if not ui else ("unchanged" if ui.strip() == "no change" else "changed")
+        return f"{kinds} {status.strip()} {moved}".strip()
+
+    @classmethod
+    def _with_change(cls, prompt: str, last_change: Optional[str]) -> Tuple[str, str]:
+        """Append the previous action and its compact UI delta so the model needn't re-derive it.
 
-    def verify_state(self, goal: str, screenshot_path: str) -> Dict[str, Any]:
-        prompt = self.base_prompt.format(goal=goal)
-        response = analyze_image_with_prompt(screenshot_path, prompt, temperature=0.0)
+        Returns (prompt, cache_prompt): the cache key only sees the normalised
+        change, so it doesn't differ on every step.
+        """
+        if not last_change:
+            return prompt, prompt
+        return (prompt + f"\nPrevious action and UI change: {last_change}\n",
+                prompt + f"\nPrevious action: {cls._change_key(last_change)}\n")
+
+    @staticmethod
+    def _parse_assessment(response: Optional[str], screenshot: Any) -> Optional[Dict[str, Any]]:
+        parsed = parse_json_response(response)
+        if not parsed or not isinstance(parsed.get("screen"), str):
+            return None
+        tap = None
+        coord = parsed.get("tap")
+        if isinstance(coord, dict):
+            try:
+                # Model saw the "locate"-preset upload → map back to device pixels
+                tap = to_device_point(screenshot, (float(coord["x"]), float(coord["y"])), "locate")
+            except (KeyError, TypeError, ValueError):
+                tap = None
+        return {
+            "completed": parsed.get("completed", False),
+            "pass": parsed.get("pass", False),
+            "reason": parsed.get("reason", ""),
+            "screen": parsed["screen"].lower().strip(),
+            "tap": tap
+        }
+
+    def verify_state(
+        self,
+        goal: str,
+        screenshot: Any = None,
+        snapshot: Optional[UISnapshot] = None,
+        last_change: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        prompt, cache_prompt = self._with_change(self.base_prompt.format(goal=goal), last_change)
+        response = analyze_image_with_prompt(
+            screenshot, prompt, temperature=0.0, preset="verify", answer=VERIFY_ANSWER,
+            exact_key=self._exact_key(snapshot), cache_prompt=cache_prompt
+        )
+        return self._parse_verification(response)
+
+    async def verify_state_async(
+        self,
+        goal: str,
+        screenshot: Any = None,
+        snapshot: Optional[UISnapshot] = None,
+        last_change: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        prompt, cache_prompt = self._with_change(self.base_prompt.format(goal=goal), last_change)
+        response = await analyze_image_with_prompt_async(
+            screenshot, prompt, temperature=0.0, preset="verify", answer=VERIFY_ANSWER,
+            exact_key=self._exact_key(snapshot), cache_prompt=cache_prompt
+        )
+        return self._parse_verification(response)
+
+    @staticmethod
+    def _parse_verification(response: Optional[str]) -> Dict[str, Any]:
         if not response:
             return {"completed": False, "pass": False, "reason": "No response"}
         try:
@@ -249,34 +588,79 @@ RULES:
 
 
 class Executor:
-    def execute(self, action_str: str) -> bool:
+    def __init__(self, serial: Optional[str] = None):
+        self.serial = serial
+
+    def _tap_point(self, action_str: str, snapshot: Optional[UISnapshot]) -> Optional[Tuple[int, int]]:
+        """Screen point of a tap_index|N or tap_xy|X|Y action (None if invalid)."""
+        if action_str.startswith("tap_xy|"):
+            _, x, y = action_str.split("|")
+            return int(x), int(y)
+        index = int(action_str.split("|")[1])
+        if snapshot is not None:
+            elements = snapshot.elements
+        else:
+            elements = capture_ui_snapshot(serial=self.serial).elements
+        if index == -1:
+            index = len(elements) - 1
+        if 0 <= index < len(elements):
+            return elements[index]["center"]
+        print("Invalid tap_index")
+        return None
+
+    def execute(self, action_str: str, snapshot: Optional[UISnapshot] = None) -> bool:
         if not action_str or "DONE" in action_str.upper():
             print("Goal completed.")
             return True
+        if BATCH_SEPARATOR in action_str:
+            return self.execute_batch(action_str.split(BATCH_SEPARATOR), snapshot)
         if action_str.startswith("wait|"):
-            import time
             seconds = int(action_str.split("|")[1])
-            time.sleep(seconds)
+            wait_for_settle(timeout=seconds, serial=self.serial)
             return True
-        if action_str.startswith("tap_index|"):
-            index = int(action_str.split("|")[1])
-            elements = get_clickable_elements()
-            if index == -1:
-                index = len(elements) - 1
-            if 0 <= index < len(elements):
-                x, y = elements[index]["center"]
-                print(f"Tapping index {index} at ({x},{y})")
-                return tap(x, y)
-            print("Invalid tap_index")
-            return False
-        if action_str.startswith("tap_xy|"):
-            _, x, y = action_str.split("|")
-            x, y = int(x), int(y)
+        if action_str.startswith("pause|"):
+            time.sleep(float(action_str.split("|")[1]))
+            return True
+        if action_str == "back":
+            print("Pressing back")
+            return press_back(self.serial)
+        if action_str.startswith(("tap_index|", "tap_xy|")):
+            point = self._tap_point(action_str, snapshot)
+            if point is None:
+                return False
+            x, y = point
             print(f"Tapping at ({x},{y})")
-            return tap(x, y)
+            return tap(x, y, self.serial)
         if action_str.startswith("type|"):
             text = action_str.split("|", 1)[1]
             print(f"Typing: {text}")
-            return type_text(text)
+            return type_text(text, self.serial)
         print(f"Unsupported action: {action_str}")
-        return False
\ No newline at end of file
+        return False
+
+    def execute_batch(self, actions: List[str], snapshot: Optional[UISnapshot] = None) -> bool:
+        """Send consecutive tap/type/pause actions in one adb shell call; a wait| flushes and settles.
+
+        tap_index resolves against `snapshot`, i.e. the screen before the batch started.
+        """
+        batch = InputBatch(self.serial)
+        for action in (a.strip() for a in actions):
+            if not action:
+                continue
+            if action.startswith("wait|"):
+                if not batch.send():
+                    return False
+                wait_for_settle(timeout=int(action.split("|")[1]), serial=self.serial)
+            elif action.startswith(("tap_index|", "tap_xy|")):
+                point = self._tap_point(action, snapshot)
+                if point is None:
+                    return False
+                batch.tap(*point)
+            elif action.startswith("type|"):
+                batch.text(action.split("|", 1)[1])
+            elif action.startswith("pause|"):
+                batch.pause(float(action.split("|")[1]))
+            else:
+                print(f"Unsupported action in batch: {action}")
+                return False
+        return batch.send()
\ No newline at end of file
@@ -0,0 +1,241 @@
+# artifact_store.py
+import io
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageChops
+from image_utils import dhash, hamming
+
+# Write step frames into a content-addressed store instead of one PNG per step.
+# `python artifact_store.py export` recreates the artifacts/<test>/step_NN.png layout.
+USE_ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "0") == "1"
+ARTIFACT_ROOT = "artifacts"
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", os.path.join(ARTIFACT_ROOT, "store"))
+# Near-duplicates (dHash distance <= this, changed area <= DELTA_MAX_AREA of the frame)
+# are stored as a patch over the previous full frame; -1 disables deltas
+DELTA_DISTANCE = int(os.getenv("ARTIFACT_DELTA_DISTANCE", "10"))
+DELTA_MAX_AREA = 0.25
+
+
+def frame_id(img: Image.Image) -> str:
+    """Content address of a frame: hash of its decoded RGBA pixels (independent of PNG encoding)."""
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{img.width}x{img.height}".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def _safe_key(key: str) -> str:
+    """Relative "a/b" manifest key with no absolute or parent components (export stays under out_dir)."""
+    parts = [p for p in key.replace(os.sep, "/").split("/") if p not in ("", ".", "..")]
+    return "/".join(parts) or "."
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _png_bytes(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ArtifactStore:
+    """Content-addressed frame store with per-directory step manifests.
+
+    Layout under `root`:
+      objects/ab/<id>.png         full frame
+      objects/ab/<id>.delta.json  near-duplicate: {"base": <id>, "box": [l, t, r, b]}
+      objects/ab/<id>.patch.png   changed rectangle pasted over the base
+      manifests/<dir>.json        {"dir": "T1", "steps": {"step_01.png": <id>, ...}}
+
+    A byte-identical frame is stored once no matter how many steps show it.
+    Deltas always point at a full frame, so reading one never chains.
+    """
+
+    def __init__(self, root: str = ARTIFACT_STORE_DIR, delta_distance: int = DELTA_DISTANCE):
+        self.root = root
+        self.delta_distance = delta_distance
+        self._lock = threading.Lock()
+        self._manifests: Dict[str, Dict] = {}
+        # Last full frame per artifact directory: (id, RGBA image, dhash)
+        self._bases: Dict[str, Tuple[str, Image.Image, int]] = {}
+
+    # ---- paths ----
+    def _object_path(self, object_id: str, suffix: str) -> str:
+        return os.path.join(self.root, "objects", object_id[:2], f"{object_id}{suffix}")
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.root, "manifests", key.replace("/", "__") + ".json")
+
+    @staticmethod
+    def split_path(path: str, artifact_root: str = ARTIFACT_ROOT) -> Tuple[str, str]:
+        """artifacts/emulator-5554/T1/step_01.png → ("emulator-5554/T1", "step_01.png")."""
+        directory, name = os.path.split(os.path.normpath(path))
+        key = os.path.relpath(directory or ".", artifact_root)
+        if key.startswith(".."):
+            # Outside the artifact root: keep the path, minus anything that could escape on export
+            key = directory
+        return _safe_key(key), name
+
+    def has(self, object_id: str) -> bool:
+        return (os.path.exists(self._object_path(object_id, ".png"))
+                or os.path.exists(self._object_path(object_id, ".delta.json")))
+
+    # ---- write ----
+    def put(self, img: Image.Image, path: str, artifact_root: str = ARTIFACT_ROOT) -> str:
+        """Store a frame for artifact `path` (e.g. artifacts/T1/step_01.png); returns its id."""
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        key, name = self.split_path(path, artifact_root)
+        object_id = frame_id(img)
+        with self._lock:
+            if not self.has(object_id):
+                self._store_object(key, object_id, img)
+            manifest = self._load_manifest(key)
+            manifest["steps"][name] = object_id
+            manifest["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            _write_atomic(self._manifest_path(key), json.dumps(manifest, indent=2, sort_keys=True).encode())
+        return object_id
+
+    def _store_object(self, key: str, object_id: str, img: Image.Image):
+        frame_hash = dhash(img)
+        base = self._bases.get(key)
+        if base is not None and self.delta_distance >= 0:
+            base_id, base_img, base_hash = base
+            if base_img.size == img.size and hamming(frame_hash, base_hash) <= self.delta_distance:
+                # RGB diff: getbbox() on an RGBA image only looks at alpha
+                box = ImageChops.difference(base_img.convert("RGB"), img.convert("RGB")).getbbox()
+                if box is not None:
+                    area = (box[2] - box[0]) * (box[3] - box[1])
+                    if area <= DELTA_MAX_AREA * img.width * img.height:
+                        _write_atomic(self._object_path(object_id, ".patch.png"), _png_bytes(img.crop(box)))
+                        _write_atomic(
+                            self._object_path(object_id, ".delta.json"),
+                            json.dumps({"base": base_id, "box": list(box)}).encode()
+                        )
+                        return
+        _write_atomic(self._object_path(object_id, ".png"), _png_bytes(img))
+        self._bases[key] = (object_id, img, frame_hash)
+
+    def _load_manifest(self, key: str) -> Dict:
+        manifest = self._manifests.get(key)
+        if manifest is None:
+            manifest = self.read_manifest(key) or {"dir": key, "steps": {}}
+            self._manifests[key] = manifest
+        return manifest
+
+    # ---- read ----
+    def read_manifest(self, key: str) -> Optional[Dict]:
+        path = self._manifest_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def manifests(self) -> List[Dict]:
+        found = []
+        for path in sorted(glob.glob(os.path.join(self.root, "manifests", "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                found.append(json.load(f))
+        return found
+
+    def load(self, object_id: str) -> Image.Image:
+        full = self._object_path(object_id, ".png")
+        if os.path.exists(full):
+            with Image.open(full) as img:
+                return img.convert("RGBA")
+        with open(self._object_path(object_id, ".delta.json"), "r", encoding="utf-8") as f:
+            delta = json.load(f)
+        img = self.load(delta["base"])
+        with Image.open(self._object_path(object_id, ".patch.png")) as patch:
+            img.paste(patch.convert("RGBA"), tuple(delta["box"][:2]))
+        return img
+
+    # ---- maintenance ----
+    def export(self, out_dir: str = ARTIFACT_ROOT, keys: Optional[List[str]] = None) -> int:
+        """Materialize manifests as <out_dir>/<dir>/step_NN.png; returns the number of files written."""
+        written = 0
+        for manifest in self.manifests():
+            if keys and manifest["dir"] not in keys:
+                continue
+            target = os.path.join(out_dir, _safe_key(manifest["dir"]))
+            os.makedirs(target, exist_ok=True)
+            for name, object_id in sorted(manifest["steps"].items()):
+                self.load(object_id).save(os.path.join(target, name), "PNG")
+                written += 1
+        return written
+
+    def ingest(self, artifact_root: str = ARTIFACT_ROOT) -> int:
+        """Import an existing <root>/**/step_NN.png tree; returns the number of frames stored."""
+        count = 0
+        store_root = os.path.abspath(self.root)
+        for path in sorted(glob.glob(os.path.join(artifact_root, "**", "*.png"), recursive=True)):
+            if os.path.abspath(path).startswith(store_root + os.sep):
+                continue
+            with Image.open(path) as img:
+                self.put(img.convert("RGBA"), path, artifact_root)
+            count += 1
+        return count
+
+    def gc(self) -> int:
+        """Delete objects no manifest references (directly or as a delta base); returns files removed."""
+        live = set()
+        for manifest in self.manifests():
+            for object_id in manifest["steps"].values():
+                live.add(object_id)
+                delta_path = self._object_path(object_id, ".delta.json")
+                if os.path.exists(delta_path):
+                    with open(delta_path, "r", encoding="utf-8") as f:
+                        live.add(json.load(f)["base"])
+        removed = 0
+        with self._lock:
+            for path in glob.glob(os.path.join(self.root, "objects", "*", "*")):
+                if os.path.basename(path).split(".")[0] not in live:
+                    os.remove(path)
+                    removed += 1
+            self._bases = {k: v for k, v in self._bases.items() if v[0] in live}
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        objects = glob.glob(os.path.join(self.root, "objects", "*", "*"))
+        return {
+            "manifests": len(self.manifests()),
+            "steps": sum(len(m["steps"]) for m in self.manifests()),
+            "full": sum(1 for p in objects if p.endswith(".png") and not p.endswith(".patch.png")),
+            "deltas": sum(1 for p in objects if p.endswith(".delta.json")),
+            "bytes": sum(os.path.getsize(p) for p in objects),
+        }
+
+
+artifact_store = ArtifactStore()
+
+
+if __name__ == "__main__":
+    # python artifact_store.py export [out_dir] [dir ...] | ingest [artifact_root] | gc | stats
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "export":
+        out = sys.argv[2] if len(sys.argv) > 2 else ARTIFACT_ROOT
+        print(f"Exported {artifact_store.export(out, sys.argv[3:] or None)} frames → {out}")
+    elif command == "ingest":
+        source = sys.argv[2] if len(sys.argv) > 2 else ARTIFACT_ROOT
+        print(f"Ingested {artifact_store.ingest(source)} frames from {source}")
+    elif command == "gc":
+        print(f"Removed {artifact_store.gc()} unreferenced objects")
+    elif command == "stats":
+        print(json.dumps(artifact_store.stats(), indent=2))
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,288 @@
+# async_agent.py
+import os
+import asyncio
+import warnings
+from typing import List, Optional, Tuple
+from adb_helper import _run_adb_async, _run_adb_bytes_async, list_devices
+from agents import Planner, Supervisor, Executor
+from frame_capture import decode_screencap, save_artifact, artifact_writer
+from settle import wait_for_settle_async, frame_signature_async
+from screen_change import ScreenChangeDetector, capture_until_changed_async
+from ui_parser import (
+    load_ui_snapshot, ui_xml_path, save_ui_xml, tty_dump_supported, note_tty_dump,
+    UISnapshot, UISource, UI_DUMP_MODE, UI_DUMP_SAVE
+)
+from mobileagent import TESTS
+from scheduler import test_chains, dependency_failure
+from step_timing import step_timer, span
+from fixtures import FIXTURES, USE_FIXTURES, apply_fixture
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+
+class AsyncMobileQAAgent:
+    """asyncio variant of MobileQAAgent.run_test.
+
+    Per step, screencap and the uiautomator dump run concurrently, verify and
+    classify requests are in flight together, and artifact PNGs are written by
+    the background writer. Actions still go through Executor (persistent adb
+    shell) on a worker thread. One event loop can drive many devices.
+    """
+
+    def __init__(
+        self,
+        combined_vision: bool = True,
+        unchanged_retries: int = 3,
+        serial: Optional[str] = None,
+        fixtures: bool = USE_FIXTURES
+    ):
+        self.fixtures = fixtures
+        self.combined_vision = combined_vision
+        self.unchanged_retries = unchanged_retries
+        self.serial = serial
+        self.planner = Planner(serial)
+        self.supervisor = Supervisor()
+        self.executor = Executor(serial)
+
+    async def _adb(self, cmd: List[str]) -> Tuple[bool, str]:
+        return await _run_adb_async(cmd, self.serial)
+
+    async def _device_ready(self) -> bool:
+        success, output = await _run_adb_async(["devices"])
+        if not success:
+            return False
+        for line in output.splitlines()[1:]:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] == "device" and (self.serial is None or parts[0] == self.serial):
+                return True
+        return False
+
+    async def _is_obsidian_running(self) -> bool:
+        success, output = await self._adb(["shell", "pidof", "md.obsidian"])
+        return success and output.strip() != ""
+
+    async def _launch(self) -> bool:
+        success, output = await self._adb([
+            "shell", "monkey",
+            "-p", "md.obsidian",
+            "-c", "android.intent.category.LAUNCHER",
+            "1"
+        ])
+        if not success:
+            print(f"Failed to launch md.obsidian: {output}")
+        return success
+
+    async def _screencap(self):
+        success, data = await _run_adb_bytes_async(["exec-out", "screencap"], self.serial)
+        if not success or not data:
+            print(f"Raw screencap failed: {data.decode(errors='replace')}")
+            return None
+        return decode_screencap(data)
+
+    async def _dump_ui(self) -> Optional[UISource]:
+        local_path = ui_xml_path(self.serial)
+        if UI_DUMP_MODE == "tty" and tty_dump_supported(self.serial):
+            # One exec-out call, parsed from memory
+            success, data = await _run_adb_bytes_async(["exec-out", "uiautomator", "dump", "/dev/tty"], self.serial)
+            success = success and b"<hierarchy" in data
+            note_tty_dump(self.serial, success, data)
+            if success:
+                if UI_DUMP_SAVE:
+                    save_ui_xml(data, local_path)
+                return data
+            print("UI dump to /dev/tty failed → dump and pull")
+        success, _ = await self._adb(["shell", "uiautomator", "dump", "/sdcard/ui.xml"])
+        if not success:
+            print("UI dump failed on device")
+            return None
+        success, _ = await self._adb(["pull", "/sdcard/ui.xml", local_path])
+        return local_path if success and os.path.exists(local_path) else None
+
+    async def _capture(self):
+        # screencap and uiautomator dump are independent → run them together
+        frame, dump = await asyncio.gather(self._screencap(), self._dump_ui())
+        if dump is None:
+            return frame, UISnapshot(None, frame)
+        return frame, load_ui_snapshot(dump, frame)
+
+    async def _settle_poll(self) -> tuple:
+        frame, (success, focus) = await asyncio.gather(
+            self._screencap(),
+            self._adb(["shell", "dumpsys", "window", "|", "grep", "-E", "'mCurrentFocus|mFocusedApp'"])
+        )
+        return await frame_signature_async(frame), focus.strip() if success else None
+
+    async def _assess(self, goal: str, snapshot: UISnapshot, last_change: Optional[str] = None):
+        """Returns (verification, screen_label, tap_hint) with the fewest sequential model round-trips."""
+        if self.planner.xml_screen(snapshot) is not None:
+            # Screen already known from the hierarchy → only the verdict needs the model
+            verification = await self.supervisor.verify_state_async(goal, snapshot=snapshot, last_change=last_change)
+            return verification, None, None
+        if self.combined_vision:
+            assessment = await self.supervisor.assess_step_async(goal, snapshot=snapshot, last_change=last_change)
+            if assessment is not None:
+                return assessment, assessment["screen"], assessment["tap"]
+            print("Combined vision call failed → separate verify/classify")
+        # Verify and classify are independent requests → fire both at once
+        verification, label = await asyncio.gather(
+            self.supervisor.verify_state_async(goal, snapshot=snapshot, last_change=last_change),
+            self.planner.classify_screen_async(snapshot.screenshot)
+        )
+        return verification, label, None
+
+    async def run_test(self, test_id: str, test_goal: str, max_steps: int = 20) -> dict:
+        print(f"\nSTARTING TEST {test_id}: {test_goal}")
+
+        if not await self._device_ready():
+            return {"result": "FAIL", "reason": "No emulator/device connected"}
+        step_timer.begin_test(test_id)
+
+        artifacts_dir = f"artifacts/{test_id}"
+        if self.serial:
+            artifacts_dir = f"artifacts/{self.serial.replace(':', '_')}/{test_id}"
+        os.makedirs(artifacts_dir, exist_ok=True)
+
+        fixture = FIXTURES.get(test_id) if self.fixtures else None
+        setup = None
+        if fixture is not None:
+            with span("fixture"):
+                setup = await asyncio.to_thread(apply_fixture, fixture, self.serial)
+            if not setup["ok"]:
+                reason = f"Fixture {fixture.name} failed"
+                if setup.get("error"):
+                    reason += f": {setup['error']}"
+                return {"result": "FAIL", "reason": reason, "setup": setup}
+        elif not await self._is_obsidian_running():
+            print("Obsidian not running → launching...")
+            if not await self._launch():
+                return {"result": "FAIL", "reason": "Failed to launch Obsidian"}
+            await wait_for_settle_async(self._settle_poll, timeout=10, min_wait=1.0, label="Launch")
+        else:
+            print("Obsidian already running → no relaunch.")
+
+        history = []
+        step = 0
+        settle_time = 0.0
+        detector = ScreenChangeDetector()
+
+        while step < max_steps:
+            step_timer.end_step()
+            step += 1
+            step_timer.begin_step(test_id, step)
+            screenshot_path = f"{artifacts_dir}/step_{step:02d}.png"
+            with span("step.capture"):
+                screenshot, snapshot, _ = await capture_until_changed_async(
+                    self._capture, detector, retries=self.unchanged_retries
+                )
+            save_artifact(screenshot, screenshot_path)
+            print(f"Step {step}: Screenshot captured → {screenshot_path}")
+            # Annotate the previous action with what it changed on screen
+            diff = self.planner.observe(snapshot)
+            if diff is not None and history:
+                history[-1] += f" | UI: {diff.summary()}"
+
+            verification, screen_label, tap_hint = await self._assess(
+                test_goal, snapshot, history[-1] if history else None
+            )
+            if verification.get("completed"):
+                result = "PASS" if verification.get("pass") else "FAIL"
+                reason = verification.get("reason", "Goal achieved")
+                print(f"TEST {result}: {reason}")
+                await asyncio.to_thread(artifact_writer.flush)
+                step_timer.end_step()
+                step_timer.save(test_id, artifacts_dir)
+                return {
+                    "result": result,
+                    "reason": reason,
+                    "artifacts": artifacts_dir,
+                    "steps_taken": step,
+                    "settle_time": round(settle_time, 2),
+                    "setup": setup,
+                    "classification": self.planner.classification_stats()
+                }
+
+            # Planner may still issue its own coordinate prompts → keep it off the event loop
+            with span("step.plan"):
+                action = await asyncio.to_thread(
+                    self.planner.decide_next_action,
+                    test_goal,
+                    None,
+                    history,
+                    snapshot,
+                    screen_label,
+                    tap_hint
+                )
+            if not action or action.strip().lower() == "done":
+                print("Agent stopped (DONE or no action)")
+                break
+
+            print(f"Planned action: {action}")
+            with span("step.execute"):
+                success = await asyncio.to_thread(self.executor.execute, action, snapshot)
+            self.planner.action_result(success)
+            status = "success" if success else "failed"
+            history.append(f"{action} → {status}")
+            print(f"Executed → {status}")
+
+            settled = await wait_for_settle_async(self._settle_poll, timeout=6)
+            settle_time += settled["elapsed"]
+
+        await asyncio.to_thread(artifact_writer.flush)
+        step_timer.end_step()
+        step_timer.save(test_id, artifacts_dir)
+        return {
+            "result": "FAIL",
+            "reason": f"Max steps ({max_steps}) reached",
+            "artifacts": artifacts_dir,
+            "steps_taken": step,
+            "settle_time": round(settle_time, 2),
+            "setup": setup,
+            "classification": self.planner.classification_stats()
+        }
+
+
+async def run_parallel_async(
+    tests: List[Tuple[str, str]],
+    serials: Optional[List[str]] = None,
+    max_steps: int = 20,
+    fixtures: bool = USE_FIXTURES
+) -> List[dict]:
+    """Drive every device from one event loop; each device pulls test chains
+    (scheduler.test_chains) from a shared asyncio.Queue."""
+    serials = serials or list_devices()
+    if not serials:
+        print("No devices found for scheduling")
+        return []
+    work: asyncio.Queue = asyncio.Queue()
+    for chain in test_chains(tests, fixtures=fixtures):
+        work.put_nowait(chain)
+    results = []
+
+    async def worker(serial: str):
+        while not work.empty():
+            failed = set()
+            for order, test_id, goal in work.get_nowait():
+                result = None if fixtures else dependency_failure(test_id, failed)
+                if result is None:
+                    try:
+                        result = await AsyncMobileQAAgent(serial=serial, fixtures=fixtures).run_test(
+                            test_id, goal, max_steps=max_steps
+                        )
+                    except Exception as e:
+                        result = {"result": "FAIL", "reason": f"Worker exception: {e}"}
+                if result.get("result") != "PASS":
+                    failed.add(test_id)
+                result.update({"test_id": test_id, "device": serial, "order": order})
+                results.append(result)
+
+    await asyncio.gather(*(worker(serial) for serial in serials))
+    results.sort(key=lambda r: r["order"])
+    for r in results:
+        del r["order"]
+    return results
+
+
+if __name__ == "__main__":
+    for r in asyncio.run(run_parallel_async(TESTS)):
+        print(f"{r['test_id']} [{r['device']}] → {r['result']} | {r.get('reason', '')}")
+    step_timer.print_summary()
@@ -1,59 +1,96 @@
 # autonomous_qa.py
 import os
-import time
+from typing import Optional
 from agents import Planner, Supervisor, Executor
-from adb_helper import take_screenshot, device_check, launch_app, _run_adb
+from adb_helper import device_check, launch_app, _run_adb
+from frame_capture import capture_screenshot, save_artifact, artifact_writer
+from settle import wait_for_settle
+from screen_change import ScreenChangeDetector, capture_until_changed
+from ui_parser import capture_ui_snapshot
 
 
-def is_obsidian_running() -> bool:
-    success, output = _run_adb(["shell", "pidof", "md.obsidian"])
+def is_obsidian_running(serial: Optional[str] = None) -> bool:
+    success, output = _run_adb(["shell", "pidof", "md.obsidian"], serial)
     return success and output.strip() != ""
 
 
-def should_relaunch() -> bool:
-    return not is_obsidian_running()
+def should_relaunch(serial: Optional[str] = None) -> bool:
+    return not is_obsidian_running(serial)
 
 
-def run_test(test_id: str, goal: str, max_steps: int = 20):
+def capture_step(screenshot_path: str, serial: Optional[str] = None):
+    screenshot = capture_screenshot(screenshot_path, save=False, serial=serial)
+    return screenshot, capture_ui_snapshot(screenshot, serial=serial)
+
+
+def run_test(
+    test_id: str,
+    goal: str,
+    max_steps: int = 20,
+    combined_vision: bool = True,
+    serial: Optional[str] = None
+) -> dict:
     print(f"\nSTARTING {test_id}: {goal}")
 
-    if not device_check():
+    if not device_check(serial):
         print("No device found")
-        return
+        return {"result": "FAIL", "reason": "No device found"}
 
     artifacts_dir = f"artifacts/{test_id}"
+    if serial:
+        artifacts_dir = f"artifacts/{serial.replace(':', '_')}/{test_id}"
     os.makedirs(artifacts_dir, exist_ok=True)
 
-    planner = Planner()
+    planner = Planner(serial)
     supervisor = Supervisor()
-    executor = Executor()
+    executor = Executor(serial)
 
     history = []
     step = 0
+    detector = ScreenChangeDetector()
 
     # Relaunch only if Obsidian is NOT running
-    if should_relaunch():
+    if should_relaunch(serial):
         print("Obsidian not running → launching...")
-        launch_app("md.obsidian")
-        time.sleep(10)
+        launch_app("md.obsidian", serial)
+        wait_for_settle(timeout=10, min_wait=1.0, label="Launch", serial=serial)
     else:
         print("Obsidian already running → no relaunch.")
 
     while step < max_steps:
         step += 1
         screenshot_path = f"{artifacts_dir}/step_{step:02d}.png"
-        take_screenshot(screenshot_path)
-
-        # Check if done
-        verification = supervisor.verify_state(goal, screenshot_path)
+        # Skip verify/plan while the last action hasn't moved the screen yet
+        screenshot, snapshot, _ = capture_until_changed(lambda: capture_step(screenshot_path, serial), detector)
+        save_artifact(screenshot, screenshot_path)
+        # Annotate the previous action with what it changed on screen
+        diff = planner.observe(snapshot)
+        if diff is not None and history:
+            history[-1] += f" | UI: {diff.summary()}"
+        last_change = history[-1] if history else None
+
+        # Check if done (one combined verify + classify call, separate calls as fallback)
+        assessment = None
+        if combined_vision and planner.xml_screen(snapshot) is None:
+            assessment = supervisor.assess_step(goal, snapshot=snapshot, last_change=last_change)
+        verification = assessment or supervisor.verify_state(goal, snapshot=snapshot, last_change=last_change)
         if verification.get("completed"):
             result = "PASS" if verification.get("pass") else "FAIL"
             print(f"RESULT: {result} | {verification['reason']}")
-            return
+            artifact_writer.flush()
+            return {"result": result, "reason": verification.get("reason", ""),
+                    "artifacts": artifacts_dir, "steps_taken": step}
 
         # Plan & execute
-        action = planner.decide_next_action(goal, screenshot_path, history)
-        success = executor.execute(action)
+        action = planner.decide_next_action(
+            goal,
+            history=history,
+            snapshot=snapshot,
+            screen_label=assessment["screen"] if assessment else None,
+            tap_hint=assessment["tap"] if assessment else None
+        )
+        success = executor.execute(action, snapshot)
+        planner.action_result(success)
 
         status = "success" if success else "failed"
         history.append(f"{action} → {status}")
@@ -62,12 +99,19 @@ def run_test(test_id: str, goal: str, max_steps: int = 20):
         if action.lower() == "done":
             break
 
-        time.sleep(3)
+        wait_for_settle(timeout=3, serial=serial)
 
+    artifact_writer.flush()
     print("Max steps reached")
+    print(f"Screen classification: {planner.classification_stats()}")
+    return {"result": "FAIL", "reason": f"Max steps ({max_steps}) reached", "artifacts": artifacts_dir,
+            "steps_taken": step, "classification": planner.classification_stats()}
 
 
 if __name__ == "__main__":
+    import sys
+    from scheduler import run_parallel
+
     tests = [
         ("T1", "Create a new vault named 'InternVault' and open it"),
         ("T2", "Create a new note titled 'Meeting Notes' with body 'Daily standup'"),
@@ -75,5 +119,12 @@ if __name__ == "__main__":
         ("T4", "Open a note, tap three-dot menu, scroll if needed, and confirm 'Print to PDF' is visible"),
     ]
 
-    for tid, goal in tests:
-        run_test(tid, goal)
\ No newline at end of file
+    # One run_test (fresh Planner) per test, spread over every attached device; no
+    # fixtures here, so dependent tests (T1 → T2/T3 → T4) stay in order on one device
+    report = run_parallel(
+        tests, serials=sys.argv[1:] or None, fixtures=False,
+        run_test=lambda test_id, goal, serial, max_steps: run_test(test_id, goal, max_steps=max_steps, serial=serial)
+    )
+    for r in report["results"]:
+        print(f"{r['test_id']} [{r['device']}] → {r['result']} | {r.get('reason', '')}")
+    print(f"{report['passed']} passed, {report['failed']} failed in {report.get('wall_time', 0)}s")
\ No newline at end of file
@@ -0,0 +1,252 @@
+# benchmark.py
+"""Offline benchmark suite: fake adb device + stub vision backend, no emulator or API key.
+
+    python benchmark.py [--steps 8] [--tests 2] [--iterations 200] [--out bench.json]
+                        [--compare baseline.json] [--tolerance 0.2] [--spawn-adb]
+
+Measures the parsers, the capture path and the sync/async agent loops, and
+reports throughput plus per-stage cost. With --compare, any throughput more
+than --tolerance below the baseline is reported and the exit code is 1.
+The stub streams answers with a per-token delay (STUB_VISION_TOKEN_LATENCY);
+run once more with VISION_STREAM=0 to see what early stream cancellation saves.
+One-shot adb calls are served by fake_adb.run inside this process, so the
+FAKE_ADB_*_LATENCY settings dominate; the cost of spawning an adb process is
+measured on its own (adb_spawn) and --spawn-adb runs everything through it.
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import asyncio
+import subprocess
+import argparse
+import tempfile
+import warnings
+import contextlib
+from typing import Callable, Dict
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Must be in place before adb_helper / gemini_helper / settle read them at import
+os.environ.setdefault("ADB_PATH", f"{shlex.quote(sys.executable)} {shlex.quote(os.path.join(REPO_DIR, 'fake_adb.py'))}")
+os.environ.setdefault("VISION_BACKEND", "stub")
+os.environ.setdefault("VISION_CACHE", "0")
+os.environ.setdefault("SETTLE_INTERVAL", "0.05")
+os.environ.setdefault("FAKE_ADB_HOME", tempfile.mkdtemp(prefix="fake_adb_"))
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+from step_timing import step_timer  # noqa: E402
+from ui_parser import (  # noqa: E402
+    UISnapshot, capture_ui_snapshot, diff_snapshots, load_ui_snapshot, parse_ui_nodes, UI_DUMP_MODES
+)
+from screen_classifier import classify_snapshot  # noqa: E402
+from frame_capture import capture_screenshot, artifact_writer  # noqa: E402
+from mobileagent import MobileQAAgent, TESTS  # noqa: E402
+from async_agent import AsyncMobileQAAgent  # noqa: E402
+from gemini_helper import get_vision_backend  # noqa: E402
+from adb_helper import set_adb_runner  # noqa: E402
+import fake_adb  # noqa: E402
+
+SERIAL = os.getenv("FAKE_ADB_SERIALS", "emulator-5554").split(",")[0]
+
+
+@contextlib.contextmanager
+def _quiet(verbose: bool):
+    """The agent prints a lot; keep it out of the report unless --verbose."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _rate(func: Callable[[], None], iterations: int) -> Dict[str, float]:
+    func()  # warm-up: imports, caches, first fake-adb frame conversion
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    return {"per_sec": round(iterations / elapsed, 2), "ms": round(elapsed / iterations * 1000, 3)}
+
+
+def bench_parsers(iterations: int) -> Dict[str, Dict[str, float]]:
+    with open(os.path.join(REPO_DIR, "current_ui.xml"), "rb") as f:
+        data = f.read()
+    snapshot = load_ui_snapshot(data)
+    nodes = snapshot.nodes
+
+    def store_queries():
+        store = UISnapshot(nodes).store
+        store.find_text("create a vault", clickable_only=True)
+        store.find_in_region(851, 0, 1 << 16, 250, clickable_only=True)
+        store.nearest_to(640, 1200)
+
+    other = load_ui_snapshot(data)
+    return {
+        "parse.stream": _rate(lambda: parse_ui_nodes(data), iterations),
+        "parse.snapshot": _rate(lambda: load_ui_snapshot(data), iterations),
+        "parse.store_queries": _rate(store_queries, iterations),
+        "parse.diff": _rate(lambda: diff_snapshots(snapshot, other), iterations),
+        "parse.classify": _rate(lambda: classify_snapshot(UISnapshot(nodes)), iterations),
+    }
+
+
+def bench_capture(iterations: int) -> Dict[str, Dict[str, float]]:
+    results = {"capture.screencap": _rate(lambda: capture_screenshot("unused.png", save=False, serial=SERIAL), iterations)}
+    for mode in UI_DUMP_MODES:
+        results[f"capture.ui_{mode}"] = _rate(lambda: capture_ui_snapshot(serial=SERIAL, mode=mode), iterations)
+    return results
+
+
+def bench_adb_spawn(iterations: int) -> Dict[str, float]:
+    """Host cost of one adb process (interpreter startup for fake_adb, no simulated latency)."""
+    cmd = shlex.split(os.environ["ADB_PATH"]) + ["devices"]
+    return _rate(lambda: subprocess.run(cmd, capture_output=True, check=False), iterations)
+
+
+def _vision_stats() -> Dict[str, int]:
+    backend = get_vision_backend()
+    return backend.stats() if hasattr(backend, "stats") else {}
+
+
+def _loop_result(steps: int, elapsed: float, vision_before: Dict[str, int]) -> Dict:
+    vision = {name: value - vision_before.get(name, 0) for name, value in _vision_stats().items()}
+    return {
+        "steps": steps,
+        "seconds": round(elapsed, 3),
+        "steps_per_sec": round(steps / elapsed, 3) if elapsed else 0.0,
+        "vision": vision,
+        "stages": step_timer.summary()
+    }
+
+
+def bench_loop(tests: int, max_steps: int) -> Dict:
+    step_timer.reset()
+    vision_before = _vision_stats()
+    steps = 0
+    start = time.perf_counter()
+    for test_id, goal in TESTS[:tests]:
+        agent = MobileQAAgent(serial=SERIAL, replay=False, record=False, unchanged_retries=0)
+        steps += agent.run_test(test_id, goal, max_steps=max_steps).get("steps_taken", 0)
+    artifact_writer.flush()
+    return _loop_result(steps, time.perf_counter() - start, vision_before)
+
+
+def bench_async_loop(tests: int, max_steps: int) -> Dict:
+    step_timer.reset()
+
+    async def run() -> int:
+        steps = 0
+        for test_id, goal in TESTS[:tests]:
+            agent = AsyncMobileQAAgent(serial=SERIAL, unchanged_retries=0)
+            steps += (await agent.run_test(test_id, goal, max_steps=max_steps)).get("steps_taken", 0)
+        return steps
+
+    vision_before = _vision_stats()
+    start = time.perf_counter()
+    steps = asyncio.run(run())
+    artifact_writer.flush()
+    return _loop_result(steps, time.perf_counter() - start, vision_before)
+
+
+def throughput_metrics(report: Dict) -> Dict[str, float]:
+    """Flat {name: higher-is-better number} view used by --compare."""
+    metrics = {}
+    for name, value in report.get("micro", {}).items():
+        metrics[name] = value["per_sec"]
+    for name in ("loop", "async_loop"):
+        if name in report:
+            metrics[f"{name}.steps_per_sec"] = report[name]["steps_per_sec"]
+    return metrics
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> list:
+    current, previous = throughput_metrics(report), throughput_metrics(baseline)
+    regressions = []
+    for name, before in previous.items():
+        after = current.get(name)
+        if after is not None and before > 0 and after < before * (1 - tolerance):
+            regressions.append(f"{name}: {after:.2f}/s vs baseline {before:.2f}/s ({after / before - 1:+.0%})")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(f"\n{'benchmark':<26}{'ops/s':>10}{'ms/op':>10}")
+    for name, value in report["micro"].items():
+        print(f"{name:<26}{value['per_sec']:>10.1f}{value['ms']:>10.2f}")
+    spawn = report.get("adb_spawn")
+    if spawn:
+        included = "included in every adb call" if report["adb"] == "spawn" else "not included"
+        print(f"\nadb calls: {report['adb']}; spawning one adb process costs {spawn['ms']:.1f} ms ({included} above)")
+    for name in ("loop", "async_loop"):
+        result = report.get(name)
+        if not result:
+            continue
+        print(f"\n{name}: {result['steps']} steps in {result['seconds']:.2f}s → {result['steps_per_sec']:.2f} steps/s")
+        vision = result.get("vision")
+        if vision:
+            print(f"  vision: {vision['calls']} calls, {vision['tokens_streamed']} tokens streamed, "
+                  f"{vision['streams_cancelled']} streams stopped early")
+        print(f"  {'stage':<22}{'count':>7}{'total s':>10}{'p50 s':>9}{'p95 s':>9}")
+        for stage, s in result["stages"].items():
+            print(f"  {stage:<22}{s['count']:>7}{s['total']:>10.2f}{s['p50']:>9.3f}{s['p95']:>9.3f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a fake adb device and stub vision backend")
+    parser.add_argument("--iterations", type=int, default=200, help="iterations per parser benchmark")
+    parser.add_argument("--capture-iterations", type=int, default=10, help="iterations per capture benchmark")
+    parser.add_argument("--tests", type=int, default=2, help="how many TESTS to run through the agent loops")
+    parser.add_argument("--steps", type=int, default=8, help="max steps per test")
+    parser.add_argument("--skip-loops", action="store_true")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the agents' own output")
+    parser.add_argument("--spawn-adb", action="store_true",
+                        help="spawn fake_adb.py per adb call instead of serving it in-process")
+    args = parser.parse_args()
+    if not args.spawn_adb:
+        set_adb_runner(fake_adb.run)
+
+    # Artifacts, UI dumps and traces from the loops go to a scratch directory
+    launch_dir = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="qa_bench_"))
+    report: Dict = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "adb": "spawn" if args.spawn_adb else "in-process",
+        "micro": {}
+    }
+    with _quiet(args.verbose):
+        report["adb_spawn"] = bench_adb_spawn(args.capture_iterations)
+        report["micro"].update(bench_parsers(args.iterations))
+        report["micro"].update(bench_capture(args.capture_iterations))
+        if not args.skip_loops:
+            report["loop"] = bench_loop(args.tests, args.steps)
+            report["async_loop"] = bench_async_loop(args.tests, args.steps)
+    print_report(report)
+
+    if args.out:
+        out = os.path.join(launch_dir, args.out)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved: {out}")
+    if args.compare:
+        path = os.path.join(launch_dir, args.compare)
+        with open(path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("adb", "spawn") != report["adb"]:
+            print(f"\nNote: baseline ran with {baseline.get('adb', 'spawn')} adb calls, this run with {report['adb']}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# fake_adb.py
+"""Offline stand-in for the `adb` binary, for benchmarks and runs without an emulator.
+
+Point adb_helper at it with ADB_PATH="python3 /path/to/fake_adb.py", or serve
+it from the calling process with adb_helper.set_adb_runner(fake_adb.run) so no
+interpreter is spawned per call (the shell session still runs the script). The
+fake device replays recorded screenshots (FAKE_ADB_FRAMES, a directory of
+step_NN.png) and a canned UI dump (FAKE_ADB_XML); every `input` command
+advances to the next frame. Each call sleeps for a configurable latency so
+device cost can be simulated:
+
+  FAKE_ADB_LATENCY            base per-command latency (default 0.01s)
+  FAKE_ADB_SCREENCAP_LATENCY  extra for screencap (default 0.03s)
+  FAKE_ADB_DUMP_LATENCY       extra for uiautomator dump (default 0.05s)
+  FAKE_ADB_SERIALS            comma-separated serials reported by `devices`
+  FAKE_ADB_HOME               per-device state and "device" files (default <tmp>/fake_adb)
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shlex
+import shutil
+import struct
+import tempfile
+import threading
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAMES_DIR = os.getenv("FAKE_ADB_FRAMES", os.path.join(REPO_DIR, "artifacts", "T1"))
+UI_XML = os.getenv("FAKE_ADB_XML", os.path.join(REPO_DIR, "current_ui.xml"))
+LATENCY = float(os.getenv("FAKE_ADB_LATENCY", "0.01"))
+SCREENCAP_LATENCY = float(os.getenv("FAKE_ADB_SCREENCAP_LATENCY", "0.03"))
+DUMP_LATENCY = float(os.getenv("FAKE_ADB_DUMP_LATENCY", "0.05"))
+SERIALS = [s for s in os.getenv("FAKE_ADB_SERIALS", "emulator-5554").split(",") if s]
+HOME = os.getenv("FAKE_ADB_HOME", os.path.join(tempfile.gettempdir(), "fake_adb"))
+PACKAGE = "md.obsidian"
+IME = "com.android.adbkeyboard/.AdbIME"
+
+
+def _tmp_suffix() -> str:
+    # run() may be called from several threads of one process
+    return f".{os.getpid()}.{threading.get_ident()}"
+
+
+class FakeDevice:
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.home = os.path.join(HOME, serial.replace(":", "_"))
+        os.makedirs(self.home, exist_ok=True)
+        self.frames = sorted(glob.glob(os.path.join(FRAMES_DIR, "*.png")))
+        if not self.frames:
+            raise SystemExit(f"fake_adb: no frames in {FRAMES_DIR}")
+        # Screen bytes per file; only useful when the device outlives one call (run())
+        self._files: dict[str, bytes] = {}
+
+    # ---- state (shared with spawned adb processes, so it lives on disk) ----
+    def _state_path(self) -> str:
+        return os.path.join(self.home, "state.json")
+
+    def frame_index(self) -> int:
+        try:
+            with open(self._state_path(), "r") as f:
+                return json.load(f)["frame"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def advance(self):
+        tmp = self._state_path() + _tmp_suffix()
+        with open(tmp, "w") as f:
+            json.dump({"frame": (self.frame_index() + 1) % len(self.frames)}, f)
+        os.replace(tmp, self._state_path())
+
+    def device_file(self, path: str) -> str:
+        return os.path.join(self.home, "fs", path.lstrip("/"))
+
+    # ---- screen ----
+    def _read(self, path: str) -> bytes:
+        data = self._files.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = self._files[path] = f.read()
+        return data
+
+    def png(self) -> bytes:
+        return self._read(self.frames[self.frame_index()])
+
+    def raw(self) -> bytes:
+        """`screencap` without -p: 16-byte header + RGBA pixels (converted once per frame, then cached)."""
+        frame = self.frames[self.frame_index()]
+        cache = os.path.join(self.home, "raw", os.path.basename(frame) + ".raw")
+        if not os.path.exists(cache):
+            from PIL import Image
+            with Image.open(frame) as img:
+                rgba = img.convert("RGBA")
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            tmp = cache + _tmp_suffix()
+            with open(tmp, "wb") as f:
+                f.write(struct.pack("<IIII", rgba.width, rgba.height, 1, 0) + rgba.tobytes())
+            os.replace(tmp, cache)
+        return self._read(cache)
+
+    def ui_xml(self) -> bytes:
+        # Per-frame dump (step_03.xml next to step_03.png) when recorded, else the canned one
+        per_frame = os.path.splitext(self.frames[self.frame_index()])[0] + ".xml"
+        return self._read(per_frame if os.path.exists(per_frame) else UI_XML)
+
+    # ---- shell ----
+    def shell(self, command: str) -> tuple[int, bytes]:
+        """Run one shell line (`a; b && c` chains allowed). Returns (exit code, output)."""
+        # Strip the redirections and `{ ...; }` grouping the session framing adds
+        command = command.replace("</dev/null", "").replace("2>&1", "").strip()
+        if command.startswith("{") and command.endswith("}"):
+            command = command[1:-1]
+        output = b""
+        code = 0
+        for part in re.split(r"(?<!\\);|&&", command):
+            part = part.strip()
+            if part:
+                code, out = self._shell_one(part)
+                output += out
+        return code, output
+
+    def _shell_one(self, command: str) -> tuple[int, bytes]:
+        time.sleep(LATENCY)
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            args = command.split()
+        if not args:
+            return 0, b""
+        name = args[0]
+        if name == "input":
+            self.advance()
+            return 0, b""
+        if name == "uiautomator":
+            time.sleep(DUMP_LATENCY)
+            target = args[2] if len(args) > 2 else "/sdcard/window_dump.xml"
+            if target == "/dev/tty":
+                return 0, self.ui_xml() + b"UI hierchary dumped to: /dev/tty\n"
+            path = self.device_file(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.ui_xml())
+            return 0, f"UI hierchary dumped to: {target}\n".encode()
+        if name == "screencap":
+            time.sleep(SCREENCAP_LATENCY)
+            return 0, self.png() if "-p" in args else self.raw()
+        if name == "pidof":
+            return (0, b"4242\n") if PACKAGE in args else (1, b"")
+        if name == "dumpsys":
+            return 0, f"  mCurrentFocus=Window{{1 u0 {PACKAGE}/.MainActivity}}\n  mFocusedApp=frame{self.frame_index()}\n".encode()
+        if name == "monkey":
+            return 0, b"Events injected: 1\n"
+        if name == "ime":
+            if args[1:2] == ["list"]:
+                return 0, f"{IME}\ncom.android.inputmethod.latin/.LatinIME\n".encode()
+            return 0, f"Input method {args[-1]} selected for user #0\n".encode()
+        if name == "settings" and args[1:2] == ["get"]:
+            return 0, b"com.android.inputmethod.latin/.LatinIME\n"
+        if name == "am" and args[1:2] == ["force-stop"]:
+            return 0, b""
+        if name == "cmd" and "resolve-activity" in args:
+            return 0, f"priority=0 preferredOrder=0 match=0x108000 specificIndex=-1 isDefault=true\n{PACKAGE}/.MainActivity\n".encode()
+        if name == "id":
+            return 0, b"0\n"
+        if name == "stat":
+            return 0, b"10123:10123\n"
+        if name == "tar" and args[1:2] == ["-czf"]:
+            path = self.device_file(args[2])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"fake app state")
+            return 0, b""
+        if "=" in name:
+            # Shell variable assignment
+            return 0, b""
+        if name == "am" and args[1:2] == ["broadcast"]:
+            self.advance()
+            return 0, b"Broadcasting: Intent { act=ADB_INPUT_B64 flg=0x400000 }\nBroadcast completed: result=0\n"
+        if name == "am":
+            return 0, f"Status: ok\nActivity: {PACKAGE}/.MainActivity\nTotalTime: 480\nWaitTime: 500\nComplete\n".encode()
+        if name == "pm":
+            return 0, b"Success\n"
+        if name == "cat":
+            path = self.device_file(args[1]) if len(args) > 1 else ""
+            if not os.path.exists(path):
+                return 1, f"cat: {args[1] if len(args) > 1 else ''}: No such file or directory\n".encode()
+            with open(path, "rb") as f:
+                return 0, f.read()
+        if name in ("echo", "printf"):
+            return 0, (" ".join(args[1:]) + "\n").encode()
+        if name in ("rm", "mkdir", "settings", "svc", "wm", "true", "sleep", "grep", "getprop",
+                    "tar", "chown", "restorecon", "appops"):
+            return 0, b""
+        return 127, f"/system/bin/sh: {name}: inaccessible or not found\n".encode()
+
+    def interactive_shell(self):
+        """`adb shell` with commands on stdin, as AdbShellSession drives it."""
+        out = sys.stdout.buffer
+        for line in sys.stdin:
+            line = line.rstrip("\n")
+            # "{ <command>; } </dev/null 2>&1; echo <marker>$?"
+            command, sep, tail = line.rpartition("; echo ")
+            if not sep:
+                command, tail = line, ""
+            code, output = self.shell(command)
+            if output:
+                out.write(output if output.endswith(b"\n") else output + b"\n")
+            if tail:
+                out.write(tail.replace("$?", str(code)).encode() + b"\n")
+            out.flush()
+
+
+_devices: dict[str, FakeDevice] = {}
+
+
+def _device(serial: str) -> FakeDevice:
+    device = _devices.get(serial)
+    if device is None:
+        device = _devices[serial] = FakeDevice(serial)
+    return device
+
+
+def run(argv: list[str]) -> tuple[int, bytes, bytes]:
+    """One non-interactive adb call: argv after the executable → (exit code, stdout, stderr).
+
+    The signature adb_helper.set_adb_runner expects. Devices are kept between
+    calls, so frames and dumps are read from disk once per process.
+    """
+    serial = SERIALS[0] if SERIALS else "emulator-5554"
+    if len(argv) >= 2 and argv[0] == "-s":
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        return 1, b"", b"fake_adb: no command\n"
+    command, args = argv[0], argv[1:]
+    if command == "devices":
+        listing = "List of devices attached\n" + "".join(f"{s}\tdevice\n" for s in SERIALS)
+        return 0, listing.encode(), b""
+    if serial not in SERIALS:
+        return 1, b"", f"adb: device '{serial}' not found\n".encode()
+    device = _device(serial)
+    if command in ("shell", "exec-out") and args:
+        code, output = device.shell(" ".join(args))
+        return code, output, b""
+    if command == "pull" and len(args) >= 2:
+        time.sleep(LATENCY)
+        source = device.device_file(args[0])
+        if not os.path.exists(source):
+            return 1, b"", f"adb: error: remote object '{args[0]}' does not exist\n".encode()
+        shutil.copyfile(source, args[1])
+        return 0, b"", b""
+    if command == "push" and len(args) >= 2:
+        time.sleep(LATENCY)
+        target = device.device_file(args[1])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.isdir(args[0]):
+            shutil.copytree(args[0], os.path.join(target, os.path.basename(args[0].rstrip("/"))), dirs_exist_ok=True)
+        else:
+            shutil.copyfile(args[0], target)
+        return 0, b"", b""
+    if command in ("root", "wait-for-device"):
+        return 0, b"", b""
+    return 1, b"", f"fake_adb: unsupported command {command}\n".encode()
+
+
+def main(argv: list[str]) -> int:
+    serial_args = argv[:2] if len(argv) >= 2 and argv[0] == "-s" else []
+    if argv[len(serial_args):] == ["shell"]:
+        serial = serial_args[1] if serial_args else (SERIALS[0] if SERIALS else "emulator-5554")
+        if serial not in SERIALS:
+            print(f"adb: device '{serial}' not found", file=sys.stderr)
+            return 1
+        FakeDevice(serial).interactive_shell()
+        return 0
+    code, stdout, stderr = run(argv)
+    sys.stdout.buffer.write(stdout)
+    sys.stderr.buffer.write(stderr)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,173 @@
+# fixtures.py
+import os
+import sys
+import time
+import shutil
+import tempfile
+from typing import Dict, Optional
+from adb_helper import (
+    _run_adb, force_stop, clear_app_data, start_app, enable_root, push_path, pull_path
+)
+from settle import wait_for_settle
+
+# Reset and seed Obsidian's state directly before each test (pm clear, pushed vault,
+# restored app data) instead of reaching it through planned UI steps
+USE_FIXTURES = os.getenv("APP_FIXTURES", "0") == "1"
+FIXTURE_DIR = os.getenv("FIXTURE_DIR", "fixtures")
+DEVICE_VAULT_ROOT = os.getenv("FIXTURE_VAULT_ROOT", "/sdcard/Documents")
+APP_PACKAGE = "md.obsidian"
+DEVICE_TMP = "/data/local/tmp"
+
+
+class Fixture:
+    """App state a test starts from.
+
+    notes:     None = no vault folder on the device; a dict = vault pushed with these
+               {relative path: markdown} files ({} = empty vault)
+    app_state: name of an app-data snapshot (fixtures/app_state/<name>.tgz, taken with
+               `python fixtures.py snapshot <name>`) restored over /data/data; None = pm clear.
+               A missing snapshot fails the fixture rather than falling back to pm clear
+    """
+
+    def __init__(self, name: str, notes: Optional[Dict[str, str]] = None,
+                 app_state: Optional[str] = None, vault: str = "InternVault"):
+        self.name = name
+        self.notes = notes
+        self.app_state = app_state
+        self.vault = vault
+
+
+FIXTURES: Dict[str, Fixture] = {
+    "T1": Fixture("fresh_install"),
+    "T2": Fixture("vault_open", notes={}, app_state="vault_open"),
+    "T3": Fixture("vault_open", notes={}, app_state="vault_open"),
+    "T4": Fixture("vault_with_note", notes={"Meeting Notes.md": "Daily Standup\n"}, app_state="vault_open"),
+}
+
+
+def app_state_path(name: str, fixture_dir: str = FIXTURE_DIR) -> str:
+    return os.path.join(fixture_dir, "app_state", f"{name}.tgz")
+
+
+def build_vault(name: str, notes: Dict[str, str]) -> str:
+    """Local vault folder with the given notes; returns its path (caller removes the parent)."""
+    vault = os.path.join(tempfile.mkdtemp(prefix="vault_"), name)
+    os.makedirs(os.path.join(vault, ".obsidian"))
+    for relative, content in notes.items():
+        path = os.path.join(vault, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return vault
+
+
+def seed_vault(fixture: Fixture, serial: Optional[str] = None) -> bool:
+    """Replace the device's vault folder with the fixture's notes (or just remove it)."""
+    device_vault = f"{DEVICE_VAULT_ROOT}/{fixture.vault}"
+    _run_adb(["shell", "rm", "-rf", f"'{device_vault}'"], serial)
+    if fixture.notes is None:
+        return True
+    vault = build_vault(fixture.vault, fixture.notes)
+    try:
+        _run_adb(["shell", "mkdir", "-p", DEVICE_VAULT_ROOT], serial)
+        return push_path(vault, DEVICE_VAULT_ROOT, serial)
+    finally:
+        shutil.rmtree(os.path.dirname(vault), ignore_errors=True)
+
+
+def snapshot_app_state(name: str, serial: Optional[str] = None, package: str = APP_PACKAGE) -> Optional[str]:
+    """Save the app's /data/data directory (needs adb root) as a named app-state snapshot."""
+    if not enable_root(serial):
+        return None
+    force_stop(package, serial)
+    remote = f"{DEVICE_TMP}/{package}.{name}.tgz"
+    success, output = _run_adb(["shell", f"tar -czf {remote} -C /data/data {package}"], serial)
+    if not success:
+        print(f"App-state snapshot failed: {output}")
+        return None
+    local = app_state_path(name)
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    ok = pull_path(remote, local, serial)
+    _run_adb(["shell", "rm", "-f", remote], serial)
+    if not ok:
+        return None
+    print(f"App state saved: {local}")
+    return local
+
+
+def restore_app_state(name: str, serial: Optional[str] = None, package: str = APP_PACKAGE) -> bool:
+    """pm clear, then unpack a snapshot over /data/data/<package> with the app's own uid and SELinux labels."""
+    local = app_state_path(name)
+    if not os.path.exists(local) or not enable_root(serial):
+        return False
+    remote = f"{DEVICE_TMP}/{package}.{name}.tgz"
+    if not push_path(local, remote, serial):
+        return False
+    data_dir = f"/data/data/{package}"
+    success, output = _run_adb(["shell", " && ".join([
+        f"pm clear {package} >/dev/null",
+        f"owner=$(stat -c %u:%g {data_dir})",
+        f"tar -xzf {remote} -C /data/data",
+        f"chown -R $owner {data_dir}",
+        f"restorecon -R {data_dir}",
+        f"rm -f {remote}"
+    ])], serial)
+    if not success:
+        print(f"App-state restore failed: {output}")
+    return success
+
+
+def apply_fixture(fixture: Fixture, serial: Optional[str] = None, package: str = APP_PACKAGE) -> Dict:
+    """Bring the app into the fixture's state and start it; returns what was done and how long it took."""
+    start = time.monotonic()
+    force_stop(package, serial)
+    restored = False
+    if fixture.app_state is not None:
+        restored = restore_app_state(fixture.app_state, serial, package)
+        if not restored:
+            # A pm-cleared app starts at the welcome screen, which the test's steps don't handle
+            error = (f"App state '{fixture.app_state}' not restored (no snapshot or no root); "
+                     f"save one with `python fixtures.py snapshot {fixture.app_state}`")
+            print(f"Fixture {fixture.name}: FAILED, {error}")
+            return {"fixture": fixture.name, "ok": False, "app_state_restored": False, "error": error,
+                    "seconds": round(time.monotonic() - start, 2)}
+    elif not clear_app_data(package, serial):
+        return {"fixture": fixture.name, "ok": False, "seconds": round(time.monotonic() - start, 2)}
+    seeded = seed_vault(fixture, serial)
+    # Pushed vaults live in shared storage: grant "all files access" up front
+    _run_adb(["shell", "appops", "set", package, "MANAGE_EXTERNAL_STORAGE", "allow"], serial)
+    launch = start_app(package, serial)
+    settle = wait_for_settle(timeout=10, label="Fixture launch", serial=serial) if launch is not None else None
+    result = {
+        "fixture": fixture.name,
+        "ok": launch is not None and seeded,
+        "app_state_restored": restored,
+        "launch_ms": launch.get("total_ms") if launch else None,
+        "settle": round(settle["elapsed"], 2) if settle else None,
+        "seconds": round(time.monotonic() - start, 2)
+    }
+    print(f"Fixture {fixture.name}: {'ready' if result['ok'] else 'FAILED'} in {result['seconds']}s")
+    return result
+
+
+if __name__ == "__main__":
+    # python fixtures.py apply <test_id> [serial] | snapshot <name> [serial] | list
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "apply" and len(sys.argv) > 2:
+        fixture = FIXTURES.get(sys.argv[2])
+        if fixture is None:
+            print(f"No fixture for {sys.argv[2]}")
+            sys.exit(1)
+        sys.exit(0 if apply_fixture(fixture, sys.argv[3] if len(sys.argv) > 3 else None)["ok"] else 1)
+    elif command == "snapshot" and len(sys.argv) > 2:
+        sys.exit(0 if snapshot_app_state(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None) else 1)
+    elif command == "list":
+        for test_id, fixture in FIXTURES.items():
+            state = fixture.app_state or "pm clear"
+            if fixture.app_state and not os.path.exists(app_state_path(fixture.app_state)):
+                state += " (missing snapshot)"
+            notes = "no vault" if fixture.notes is None else f"{len(fixture.notes)} notes"
+            print(f"{test_id}: {fixture.name:<16} {state}, {notes}")
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,139 @@
+# frame_capture.py
+import os
+import queue
+import struct
+import threading
+from typing import Optional, Union
+from PIL import Image
+from adb_helper import capture_raw_screencap, take_screenshot
+from artifact_store import artifact_store, USE_ARTIFACT_STORE
+
+# screencap pixel formats (android PixelFormat)
+_RAW_MODES = {
+    1: "RGBA",  # RGBA_8888
+    2: "RGBX",  # RGBX_8888
+}
+
+
+class Frame:
+    """One framebuffer capture held in memory; pixels are a view over the adb stdout bytes."""
+
+    def __init__(self, width: int, height: int, raw_mode: str, pixels: memoryview):
+        self.width = width
+        self.height = height
+        self.raw_mode = raw_mode
+        self.pixels = pixels
+        self._image: Optional[Image.Image] = None
+        self._rgb: Optional[Image.Image] = None
+
+    @property
+    def image(self) -> Image.Image:
+        # frombuffer with the "raw" decoder shares memory with `pixels` (no copy)
+        if self._image is None:
+            self._image = Image.frombuffer(
+                "RGBA", (self.width, self.height), self.pixels, "raw", self.raw_mode, 0, 1
+            )
+        return self._image
+
+    def to_image(self) -> Image.Image:
+        """RGB image for the vision model (converted once, then cached)."""
+        if self._rgb is None:
+            self._rgb = self.image.convert("RGB")
+        return self._rgb
+
+
+def decode_screencap(data: bytes) -> Optional[Frame]:
+    if len(data) < 12:
+        return None
+    width, height, fmt = struct.unpack_from("<III", data)
+    raw_mode = _RAW_MODES.get(fmt)
+    if raw_mode is None:
+        print(f"Unsupported screencap pixel format: {fmt}")
+        return None
+    # Header is 12 bytes on older Android, 16 (extra colorspace word) on Android 9+
+    header = len(data) - width * height * 4
+    if header not in (12, 16):
+        print(f"Unexpected screencap size: {len(data)} bytes for {width}x{height}")
+        return None
+    return Frame(width, height, raw_mode, memoryview(data)[header:])
+
+
+def capture_frame(serial: Optional[str] = None) -> Optional[Frame]:
+    data = capture_raw_screencap(serial)
+    if data is None:
+        return None
+    return decode_screencap(data)
+
+
+class ArtifactWriter:
+    """Encodes and writes frames to disk on a background thread, off the step's critical path.
+
+    With ARTIFACT_STORE=1 frames go into the deduplicating artifact_store
+    instead of one PNG file per step.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                frame, path = item
+                if USE_ARTIFACT_STORE:
+                    artifact_store.put(frame.image, path)
+                    continue
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                frame.image.save(path, "PNG")
+            except Exception as e:
+                print(f"Artifact write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, frame: Frame, path: str):
+        self._ensure_started()
+        self._queue.put((frame, path))
+
+    def flush(self):
+        """Block until every submitted frame is on disk."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+
+artifact_writer = ArtifactWriter()
+
+
+def save_artifact(screenshot: Union[Frame, str, None], path: str):
+    """Queue the PNG write for an in-memory frame (path captures are already on disk)."""
+    if isinstance(screenshot, Frame):
+        artifact_writer.submit(screenshot, path)
+
+
+def capture_screenshot(path: str, save: bool = True, serial: Optional[str] = None) -> Union[Frame, str, None]:
+    """Capture the screen in memory and queue the PNG artifact; falls back to `screencap -p` straight to disk.
+
+    With save=False the caller decides later (see save_artifact), e.g. to skip unchanged frames.
+    """
+    frame = capture_frame(serial)
+    if frame is not None:
+        if save:
+            artifact_writer.submit(frame, path)
+        return frame
+    if take_screenshot(path, serial):
+        return path
+    return None
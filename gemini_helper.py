@@ -1,62 +1,710 @@
 # gemini_helper.py
 import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import inspect
+import sqlite3
+import threading
+from collections import OrderedDict
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from PIL import Image
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Union, Any, Callable, Iterable
+from image_utils import dhash, content_digest, load_image, preprocess_image, get_transform
+from image_service import image_service
+from step_timing import timed
 
 load_dotenv()
 
+# "stub" answers from vision_stub.StubVisionBackend instead of the API (offline runs, benchmarks)
+VISION_BACKEND = os.getenv("VISION_BACKEND", "gemini")
+
 api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
+if not api_key and VISION_BACKEND == "gemini":
     raise ValueError("GEMINI_API_KEY not found")
 
-genai.configure(api_key=api_key)
+if api_key:
+    genai.configure(api_key=api_key)
 
 # MOST RELIABLE vision model as of Dec 28, 2025 (avoids empty response bug in 2.5 series)
 MODEL_NAME = "gemini-2.0-flash"  # Stable, consistent vision output
 
-_vision_model = genai.GenerativeModel(
-    MODEL_NAME,
-    generation_config=genai.GenerationConfig(
-        temperature=0.1,
-        max_output_tokens=1024,
+# Ordered fallback pool: when a model keeps returning 429/quota errors the next one takes over
+MODEL_POOL = [m.strip() for m in os.getenv(
+    "GEMINI_MODEL_POOL", f"{MODEL_NAME},gemini-2.0-flash-lite,gemini-1.5-flash"
+).split(",") if m.strip()]
+
+# Free-tier (requests/min, tokens/min) per model; unknown models get DEFAULT_LIMITS
+MODEL_LIMITS = {
+    "gemini-2.0-flash": (15, 1_000_000),
+    "gemini-2.0-flash-lite": (30, 1_000_000),
+    "gemini-1.5-flash": (15, 1_000_000),
+}
+DEFAULT_LIMITS = (10, 250_000)
+QUOTA_RETRIES = int(os.getenv("GEMINI_QUOTA_RETRIES", "3"))
+QUOTA_COOLDOWN = float(os.getenv("GEMINI_QUOTA_COOLDOWN", "60"))
+# Longest total wait for a cooldown to expire when every model in the pool is exhausted
+QUOTA_MAX_WAIT = float(os.getenv("GEMINI_QUOTA_MAX_WAIT", str(QUOTA_COOLDOWN)))
+IMAGE_TOKENS = 258  # Gemini bills one image as ~258 input tokens
+MAX_OUTPUT_TOKENS = 1024
+# Stream answers that have an AnswerFormat and stop reading once they're complete;
+# VISION_STREAM=0 waits for the whole response (the token caps still apply)
+VISION_STREAM = os.getenv("VISION_STREAM", "1") != "0"
+
+_models: dict = {}
+_models_lock = threading.Lock()
+
+# Object with generate(prompt, payload, temperature, answer=None, stream=False) /
+# generate_async(...) returning a response shaped like generate_content's (an iterable
+# of chunks when stream=True) and a model_name for cache keys;
+# None = Gemini through the rate limiter
+_vision_backend: Any = None
+
+
+def set_vision_backend(backend: Any):
+    """Route every vision request to `backend` (None restores Gemini)."""
+    global _vision_backend
+    _vision_backend = backend
+
+def get_vision_backend() -> Any:
+    return _vision_backend
+
+def _current_model() -> str:
+    """Model the next request would go to (cache lookups are keyed on it)."""
+    if _vision_backend is not None:
+        return getattr(_vision_backend, "model_name", type(_vision_backend).__name__)
+    available = rate_limiter.available_models()
+    return available[0] if available else MODEL_NAME
+
+def get_vision_model(name: str = MODEL_NAME):
+    with _models_lock:
+        model = _models.get(name)
+        if model is None:
+            model = _models[name] = genai.GenerativeModel(
+                name,
+                generation_config=genai.GenerationConfig(
+                    temperature=0.1,
+                    max_output_tokens=MAX_OUTPUT_TOKENS,
+                )
+            )
+        return model
+
+class TokenBucket:
+    """Thread-safe token bucket. reserve() never blocks: it books the tokens and
+    returns how long the caller must wait, so sync and asyncio callers share it."""
+
+    def __init__(self, capacity: float, per_second: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.per_second)
+            self._updated = now
+            self._level -= min(amount, self.capacity)
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.per_second
+
+class RateLimiter:
+    """Per-model requests/min and tokens/min buckets plus quota bookkeeping for the fallback pool."""
+
+    def __init__(self):
+        self._buckets: dict = {}
+        self._exhausted_until: dict = {}
+        self._lock = threading.Lock()
+        self.throttle_seconds: dict = {}
+        self.quota_errors: dict = {}
+        self.fallbacks = 0
+
+    def _buckets_for(self, model: str) -> tuple:
+        with self._lock:
+            if model not in self._buckets:
+                rpm, tpm = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+                self._buckets[model] = (TokenBucket(rpm, rpm / 60.0), TokenBucket(tpm, tpm / 60.0))
+            return self._buckets[model]
+
+    def reserve(self, model: str, tokens: int) -> float:
+        requests, token_bucket = self._buckets_for(model)
+        wait = max(requests.reserve(1), token_bucket.reserve(tokens))
+        if wait > 0:
+            with self._lock:
+                self.throttle_seconds[model] = self.throttle_seconds.get(model, 0.0) + wait
+        return wait
+
+    def acquire(self, model: str, tokens: int):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, model: str, tokens: int):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def mark_exhausted(self, model: str):
+        with self._lock:
+            self._exhausted_until[model] = time.monotonic() + QUOTA_COOLDOWN
+            self.fallbacks += 1
+        print(f"Quota exhausted on {model} → cooling down {QUOTA_COOLDOWN:.0f}s")
+
+    def record_quota_error(self, model: str):
+        with self._lock:
+            self.quota_errors[model] = self.quota_errors.get(model, 0) + 1
+
+    def available_models(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [m for m in MODEL_POOL if self._exhausted_until.get(m, 0.0) <= now]
+
+    def next_available_in(self) -> float:
+        """Seconds until the first model in the pool leaves its cooldown (0 = one is available)."""
+        now = time.monotonic()
+        with self._lock:
+            return max(0.0, min(self._exhausted_until.get(m, 0.0) - now for m in MODEL_POOL))
+
+    def pool_wait(self, waited: float, max_wait: Optional[float] = None) -> Optional[float]:
+        """How long to sleep before trying the pool again, or None once `max_wait`
+        (default QUOTA_MAX_WAIT) would be exceeded."""
+        if not MODEL_POOL:
+            return None
+        wait = self.next_available_in()
+        if waited + wait > (QUOTA_MAX_WAIT if max_wait is None else max_wait):
+            return None
+        print(f"All models cooling down → waiting {wait:.1f}s for the first to recover")
+        return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "throttle_seconds": {m: round(s, 2) for m, s in self.throttle_seconds.items()},
+                "quota_errors": dict(self.quota_errors),
+                "fallbacks": self.fallbacks,
+            }
+
+rate_limiter = RateLimiter()
+
+if VISION_BACKEND == "stub":
+    from vision_stub import StubVisionBackend
+    set_vision_backend(StubVisionBackend.from_env())
+
+def _first_json_object(text: str) -> Optional[str]:
+    """First complete top-level {...} in `text` (braces inside strings ignored), else None."""
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+class AnswerFormat:
+    """Shape of a short answer: an output-token cap plus a completeness test for streamed text.
+
+    complete(text) gets everything received so far and returns the final answer
+    once it is there (None = keep reading).
+    """
+
+    def __init__(self, max_output_tokens: int, complete: Callable[[str], Optional[str]]):
+        self.max_output_tokens = max_output_tokens
+        self.complete = complete
+
+    @classmethod
+    def label(cls, labels: Iterable[str], max_output_tokens: int = 8) -> "AnswerFormat":
+        """One label from `labels`; done as soon as the text is a label no other label extends."""
+        allowed = [label.lower() for label in labels]
+
+        def complete(text: str) -> Optional[str]:
+            candidate = text.strip().strip("`'\".").strip().lower()
+            if candidate in allowed and not any(a != candidate and a.startswith(candidate) for a in allowed):
+                return candidate
+            return None
+        return cls(max_output_tokens, complete)
+
+    @classmethod
+    def json_object(cls, required: Iterable[str] = (), max_output_tokens: int = 256) -> "AnswerFormat":
+        """One JSON object with the `required` keys; done when its closing brace arrives."""
+        required = tuple(required)
+
+        def complete(text: str) -> Optional[str]:
+            candidate = _first_json_object(text)
+            if candidate is None:
+                return None
+            try:
+                parsed = json.loads(candidate)
+            except ValueError:
+                return None
+            if not isinstance(parsed, dict) or any(key not in parsed for key in required):
+                return None
+            return candidate
+        return cls(max_output_tokens, complete)
+
+# {"x": .., "y": ..} tap targets
+POINT_ANSWER = AnswerFormat.json_object(("x", "y"), max_output_tokens=48)
+
+def _generation_config(temperature: float, answer: Optional[AnswerFormat]):
+    return genai.GenerationConfig(
+        temperature=temperature,
+        max_output_tokens=answer.max_output_tokens if answer is not None else MAX_OUTPUT_TOKENS
     )
-)
 
-def get_vision_model():
-    return _vision_model
+def _chunk_text(chunk) -> str:
+    try:
+        return "".join(part.text for part in chunk.parts if hasattr(part, "text"))
+    except Exception:
+        return ""
+
+def _stream_targets(response) -> list:
+    # The SDK has no public cancel: the underlying gRPC call / HTTP generator sits in
+    # response._iterator; a response without one (e.g. the stub) is its own stream
+    iterator = getattr(response, "_iterator", None)
+    return [iterator, response] if iterator is not None else [response]
+
+def _cancel_stream(response, chunks):
+    """Stop a sync stream: close our chunk iterator, then cancel()/close() the call."""
+    close = getattr(chunks, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+    for target in _stream_targets(response):
+        for name in ("cancel", "close"):
+            method = getattr(target, name, None)
+            if callable(method):
+                try:
+                    method()
+                except Exception:
+                    pass
+                return
+
+async def _cancel_stream_async(response, chunks):
+    """Stop an async stream: await aclose() on our chunk iterator, then cancel() the call
+    (grpc.aio) or aclose() it (async generators have no sync close/cancel)."""
+    aclose = getattr(chunks, "aclose", None)
+    if callable(aclose):
+        try:
+            await aclose()
+        except Exception:
+            pass
+    for target in _stream_targets(response):
+        for name in ("cancel", "aclose"):
+            method = getattr(target, name, None)
+            if callable(method):
+                try:
+                    result = method()
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    pass
+                return
+
+def _read_stream(response, answer: AnswerFormat) -> str:
+    """Accumulate a streamed response, returning as soon as `answer` is complete."""
+    text = ""
+    chunks = iter(response)
+    for chunk in chunks:
+        text += _chunk_text(chunk)
+        done = answer.complete(text)
+        if done is not None:
+            _cancel_stream(response, chunks)
+            return done
+    return text
+
+async def _read_stream_async(response, answer: AnswerFormat) -> str:
+    text = ""
+    chunks = response.__aiter__()
+    async for chunk in chunks:
+        text += _chunk_text(chunk)
+        done = answer.complete(text)
+        if done is not None:
+            await _cancel_stream_async(response, chunks)
+            return done
+    return text
+
+def _is_quota_error(error: Exception) -> bool:
+    # By type / HTTP status only: message text can contain "429" in a request id or byte count
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429
+
+def _backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter so parallel workers don't retry in lockstep
+    return random.uniform(0, min(30.0, 2.0 * (2 ** attempt)))
+
+def _estimate_tokens(prompt: str) -> int:
+    return len(prompt) // 4 + IMAGE_TOKENS
+
+def _generate(prompt: str, payload: Any, temperature: float, answer: Optional[AnswerFormat] = None):
+    """generate_content through the rate limiter, retrying quota errors and walking the model pool.
 
+    Returns (response, model that answered). With an `answer` format (and
+    VISION_STREAM) the response is streamed and the answer text is returned
+    as soon as it is complete.
+    """
+    stream = answer is not None and VISION_STREAM
+    if _vision_backend is not None:
+        response = _vision_backend.generate(prompt, payload, temperature, answer=answer, stream=stream)
+        return (_read_stream(response, answer) if stream else response), _current_model()
+    tokens = _estimate_tokens(prompt)
+    waited = 0.0
+    while True:
+        for model in rate_limiter.available_models():
+            for attempt in range(QUOTA_RETRIES + 1):
+                rate_limiter.acquire(model, tokens)
+                try:
+                    response = get_vision_model(model).generate_content(
+                        [prompt, payload],
+                        generation_config=_generation_config(temperature, answer),
+                        stream=stream
+                    )
+                    return (_read_stream(response, answer) if stream else response), model
+                except Exception as e:
+                    if not _is_quota_error(e):
+                        raise
+                    rate_limiter.record_quota_error(model)
+                    if attempt < QUOTA_RETRIES:
+                        time.sleep(_backoff_delay(attempt))
+            rate_limiter.mark_exhausted(model)
+        # Whole pool cooling down: one burst of 429s shouldn't fail the test if a model is about to recover
+        wait = rate_limiter.pool_wait(waited)
+        if wait is None:
+            raise RuntimeError("All models in the pool are out of quota")
+        time.sleep(wait)
+        waited += wait
+
+async def _generate_async(prompt: str, payload: Any, temperature: float, answer: Optional[AnswerFormat] = None):
+    stream = answer is not None and VISION_STREAM
+    if _vision_backend is not None:
+        response = await _vision_backend.generate_async(prompt, payload, temperature, answer=answer, stream=stream)
+        return (await _read_stream_async(response, answer) if stream else response), _current_model()
+    tokens = _estimate_tokens(prompt)
+    waited = 0.0
+    while True:
+        for model in rate_limiter.available_models():
+            for attempt in range(QUOTA_RETRIES + 1):
+                await rate_limiter.acquire_async(model, tokens)
+                try:
+                    response = await get_vision_model(model).generate_content_async(
+                        [prompt, payload],
+                        generation_config=_generation_config(temperature, answer),
+                        stream=stream
+                    )
+                    return (await _read_stream_async(response, answer) if stream else response), model
+                except Exception as e:
+                    if not _is_quota_error(e):
+                        raise
+                    rate_limiter.record_quota_error(model)
+                    if attempt < QUOTA_RETRIES:
+                        await asyncio.sleep(_backoff_delay(attempt))
+            rate_limiter.mark_exhausted(model)
+        wait = rate_limiter.pool_wait(waited)
+        if wait is None:
+            raise RuntimeError("All models in the pool are out of quota")
+        await asyncio.sleep(wait)
+        waited += wait
+
+class VisionCache:
+    """LRU + TTL cache of model answers keyed by (prompt, temperature, preset, image) per model.
+
+    Entries are stored under the model that actually answered, so answers from a
+    fallback model are only reused while that model is the one in use. With
+    `db_path` set, entries are also kept in SQLite so later runs reuse them.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 6 * 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS vision_cache "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM vision_cache WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(prompt: str, temperature: float, image_key: Union[int, str], preset: Optional[str] = None) -> str:
+        """`image_key` is the screenshot's dhash, or an exact content key (see _image_key)."""
+        prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        if isinstance(image_key, int):
+            image_key = f"{image_key:016x}"
+        return f"{prompt_hash}:{temperature:.3f}:{preset or 'raw'}:{image_key}"
+
+    def get(self, key: str, model: str) -> Optional[str]:
+        key = f"{model}:{key}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, response FROM vision_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._entries[key] = entry
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, model: str, response: str):
+        key = f"{model}:{key}"
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO vision_cache (key, response, created) VALUES (?, ?, ?)",
+                    (key, response, now)
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+# VISION_CACHE=0 disables caching; VISION_CACHE_DB=<file> shares answers across runs
+vision_cache: Optional[VisionCache] = None
+if os.getenv("VISION_CACHE", "1") != "0":
+    vision_cache = VisionCache(
+        max_entries=int(os.getenv("VISION_CACHE_SIZE", "512")),
+        ttl=float(os.getenv("VISION_CACHE_TTL", str(6 * 3600))),
+        db_path=os.getenv("VISION_CACHE_DB") or None
+    )
+
+def _exact_image_key(digest: Optional[str], exact_key: str) -> Optional[str]:
+    """Exact screen identity: pixel digest plus the caller's key (e.g. the UI structure hash)."""
+    return f"{digest}:{exact_key}" if digest is not None else None
+
+def _prepare_request(
+    image: Union[str, Image.Image, Any],
+    prompt: str,
+    temperature: float,
+    use_cache: bool,
+    preset: Optional[str] = None,
+    exact_key: Optional[str] = None
+) -> tuple[Any, Optional[str], Optional[str]]:
+    """Load the image, look up the cache, then apply the upload preset.
+
+    Returns (payload, cache_key, cached_answer); payload is the PIL image
+    (preset=None) or an encoded {"mime_type", "data"} blob.
+    """
+    use_cache = use_cache and vision_cache is not None
+    if image_service.enabled and hasattr(image, "pixels"):
+        # Captured frame: hash and encode it on the image worker pool
+        cache_key = None
+        if use_cache:
+            if exact_key is None:
+                image_key = image_service.hash(image)
+            else:
+                image_key = _exact_image_key(image_service.digest(image), exact_key)
+            cache_key = _cache_key(prompt, temperature, preset, image_key)
+        cached = vision_cache.get(cache_key, _current_model()) if cache_key is not None else None
+        if cached is not None or preset is None:
+            return image.to_image(), cache_key, cached
+        return image_service.encode(image, preset)[0], cache_key, None
+    img = load_image(image)
+    if img is None:
+        return None, None, None
+    cache_key = None
+    if use_cache:
+        if exact_key is None:
+            image_key = dhash(img)
+        else:
+            image_key = _exact_image_key(content_digest(img), exact_key)
+        cache_key = _cache_key(prompt, temperature, preset, image_key)
+        cached = vision_cache.get(cache_key, _current_model()) if cache_key is not None else None
+        if cached is not None:
+            return img, cache_key, cached
+    if preset is None:
+        return img, cache_key, None
+    blob, _ = preprocess_image(img, preset)
+    return blob, cache_key, None
+
+def _cache_key(prompt: str, temperature: float, preset: Optional[str], image_key: Union[int, str, None]) -> Optional[str]:
+    if vision_cache is None or image_key is None:
+        return None
+    return VisionCache.make_key(prompt, temperature, image_key, preset)
+
+async def _prepare_request_async(
+    image: Union[str, Image.Image, Any],
+    prompt: str,
+    temperature: float,
+    use_cache: bool,
+    preset: Optional[str] = None,
+    exact_key: Optional[str] = None
+) -> tuple[Any, Optional[str], Optional[str]]:
+    """_prepare_request without blocking the event loop on hashing/encoding a captured frame."""
+    if not (image_service.enabled and hasattr(image, "pixels")):
+        return _prepare_request(image, prompt, temperature, use_cache, preset, exact_key)
+    cache_key = None
+    if use_cache and vision_cache is not None:
+        if exact_key is None:
+            image_key = await image_service.hash_async(image)
+        else:
+            image_key = _exact_image_key(await image_service.digest_async(image), exact_key)
+        cache_key = _cache_key(prompt, temperature, preset, image_key)
+    cached = vision_cache.get(cache_key, _current_model()) if cache_key is not None else None
+    if cached is not None or preset is None:
+        return image.to_image(), cache_key, cached
+    blob, _ = await image_service.encode_async(image, preset)
+    return blob, cache_key, None
+
+def _response_text(response, cache_key: Optional[str], model: str) -> Optional[str]:
+    """Answer text of a response; stored in the cache under the model that produced it."""
+    if isinstance(response, str):
+        # Streamed: already cut at the complete answer
+        text = response.strip()
+        if not text:
+            print("No text in streamed response.")
+            return None
+        if cache_key is not None:
+            vision_cache.put(cache_key, model, text)
+        return text
+
+    if response.prompt_feedback and response.prompt_feedback.block_reason:
+        print(f"Blocked: {response.prompt_feedback.block_reason}")
+        return None
+
+    if response.parts:
+        text = "".join(part.text for part in response.parts if hasattr(part, "text")).strip()
+        if cache_key is not None and text:
+            vision_cache.put(cache_key, model, text)
+        return text
+
+    print("No text in response parts.")
+    return None
+
+@timed("vision")
 def analyze_image_with_prompt(
-    image_path: str,
+    image: Union[str, Image.Image, Any],
     prompt: str,
-    temperature: float = 0.1
+    temperature: float = 0.1,
+    use_cache: bool = True,
+    preset: Optional[str] = None,
+    answer: Optional[AnswerFormat] = None,
+    exact_key: Optional[str] = None,
+    cache_prompt: Optional[str] = None
 ) -> Optional[str]:
-    if not os.path.exists(image_path):
-        print(f"Image not found: {image_path}")
-        return None
+    """Ask the vision model about an image. `preset` (see image_utils.IMAGE_PRESETS)
+    shrinks/crops/re-encodes the upload; None sends the full-resolution image.
+    `answer` caps the output tokens and ends a streamed reply once it is complete.
 
+    Cached answers are matched on the screenshot's perceptual hash, which can't
+    tell apart screens that differ only by typed text. Verdicts pass `exact_key`
+    (the UI structure hash, "" without a dump) to be matched on the exact
+    pixels plus that key instead. `cache_prompt` replaces `prompt` in the cache
+    key when the prompt carries per-step context that shouldn't split entries."""
     try:
-        img = Image.open(image_path)
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
+        key_prompt = prompt if cache_prompt is None else cache_prompt
+        img, cache_key, cached = _prepare_request(image, key_prompt, temperature, use_cache, preset, exact_key)
+        if img is None or cached is not None:
+            return cached
 
-        response = get_vision_model().generate_content(
-            [prompt, img],
-            generation_config=genai.GenerationConfig(temperature=temperature)
-        )
+        response, model = _generate(prompt, img, temperature, answer)
+        return _response_text(response, cache_key, model)
 
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            print(f"Blocked: {response.prompt_feedback.block_reason}")
-            return None
+    except Exception as e:
+        print(f"Gemini error: {e}")
+        return None
 
-        if response.parts:
-            text = "".join(part.text for part in response.parts if hasattr(part, "text"))
-            return text.strip()
+@timed("vision")
+async def analyze_image_with_prompt_async(
+    image: Union[str, Image.Image, Any],
+    prompt: str,
+    temperature: float = 0.1,
+    use_cache: bool = True,
+    preset: Optional[str] = None,
+    answer: Optional[AnswerFormat] = None,
+    exact_key: Optional[str] = None,
+    cache_prompt: Optional[str] = None
+) -> Optional[str]:
+    """asyncio twin of analyze_image_with_prompt using the SDK's async client."""
+    try:
+        key_prompt = prompt if cache_prompt is None else cache_prompt
+        img, cache_key, cached = await _prepare_request_async(
+            image, key_prompt, temperature, use_cache, preset, exact_key
+        )
+        if img is None or cached is not None:
+            return cached
 
-        print("No text in response parts.")
-        return None
+        response, model = await _generate_async(prompt, img, temperature, answer)
+        return _response_text(response, cache_key, model)
 
     except Exception as e:
         print(f"Gemini error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def parse_point(response: Optional[str]) -> Optional[tuple[float, float]]:
+    """Pull {"x": .., "y": ..} out of a model answer (tolerates ```json fences and extra text)."""
+    if not response:
+        return None
+    try:
+        text = response.strip().strip("```json").strip("```").strip()
+        coord = json.loads(text[text.find("{"):text.rfind("}")+1])
+        return float(coord["x"]), float(coord["y"])
+    except Exception:
+        return None
+
+def to_device_point(image: Union[str, Image.Image, Any], point: tuple[float, float], preset: Optional[str]) -> tuple[int, int]:
+    """Map a point the model gave for a preset-processed upload back to device pixels."""
+    if preset is None:
+        return int(point[0]), int(point[1])
+    img = load_image(image)
+    return get_transform(img.size, preset).to_device(*point)
+
+def locate_with_prompt(
+    image: Union[str, Image.Image, Any],
+    prompt: str,
+    preset: Optional[str] = "locate",
+    temperature: float = 0.1
+) -> Optional[tuple[int, int]]:
+    """Ask for a single {x, y} tap target and return it in device coordinates."""
+    point = parse_point(analyze_image_with_prompt(image, prompt, temperature, preset=preset, answer=POINT_ANSWER))
+    if point is None:
+        return None
+    return to_device_point(image, point, preset)
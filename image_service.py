@@ -0,0 +1,322 @@
+# image_service.py
+import os
+import atexit
+import asyncio
+import weakref
+import threading
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+from PIL import Image, ImageChops
+from image_utils import dhash, content_digest, load_image, preprocess_image, ImageTransform
+
+# IMAGE_WORKERS=N hashes, diffs, resizes and encodes captured frames in N worker
+# processes instead of the agent's own (GIL-bound) threads; 0 = in-process
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0"))
+# Frames in flight at once; a frame that finds no free slot is processed in-process
+IMAGE_RING_SLOTS = int(os.getenv("IMAGE_RING_SLOTS", "16"))
+
+
+# ---- image operations (same code in-process and in the workers) ----
+def _hash_image(img: Image.Image, hash_size: int) -> int:
+    return dhash(img, hash_size)
+
+
+def _diff_image(a: Image.Image, b: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    if a.size != b.size:
+        return (0, 0, max(a.width, b.width), max(a.height, b.height))
+    # RGB: getbbox() on an RGBA difference only looks at alpha
+    return ImageChops.difference(a.convert("RGB"), b.convert("RGB")).getbbox()
+
+
+def _resize_image(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    return img.convert("RGB").resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def _encode_image(img: Image.Image, preset: str) -> Tuple[dict, ImageTransform]:
+    return preprocess_image(img.convert("RGB"), preset)
+
+
+# ---- worker side ----
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_slot_size = 0
+
+
+def _worker_attach(name: str, slot_size: int):
+    global _worker_shm, _worker_slot_size
+    try:
+        # Python 3.13+: the parent owns (and unlinks) the block
+        _worker_shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Older Pythons register every attach with this worker's resource tracker,
+        # which would warn about (and unlink) the parent's ring when the worker exits
+        _worker_shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(_worker_shm._name, "shared_memory")
+    _worker_slot_size = slot_size
+
+
+def _slot_image(spec: Tuple[int, int, int, str, int]) -> Image.Image:
+    """RGBA view straight over the shared slot (no copy)."""
+    slot, width, height, raw_mode, size = spec
+    offset = slot * _worker_slot_size
+    return Image.frombuffer("RGBA", (width, height), _worker_shm.buf[offset:offset + size], "raw", raw_mode, 0, 1)
+
+
+def _worker_hash(spec, hash_size: int) -> int:
+    return _hash_image(_slot_image(spec), hash_size)
+
+
+def _worker_digest(spec) -> str:
+    return content_digest(_slot_image(spec))
+
+
+def _worker_diff(spec_a, spec_b):
+    return _diff_image(_slot_image(spec_a), _slot_image(spec_b))
+
+
+def _worker_resize(spec, size):
+    img = _resize_image(_slot_image(spec), size)
+    return img.size, img.tobytes()
+
+
+def _worker_encode(spec, preset: str):
+    return _encode_image(_slot_image(spec), preset)
+
+
+# ---- parent side ----
+class FrameRef:
+    """Lease on one ring slot holding a frame; the slot is reused once every lease is released."""
+
+    def __init__(self, ring: "FrameRing", slot: int, width: int, height: int, raw_mode: str, size: int):
+        self.ring = ring
+        self.spec = (slot, width, height, raw_mode, size)
+
+    def acquire(self):
+        self.ring._acquire(self.spec[0])
+
+    def release(self):
+        self.ring._release(self.spec[0])
+
+
+class FrameRing:
+    """Fixed-size frame slots in one shared-memory block.
+
+    put() copies a frame's pixels in once; worker processes attach to the block
+    by name and decode the slot in place, so only a small (slot, size, mode)
+    tuple crosses the process boundary.
+    """
+
+    def __init__(self, slots: int, slot_size: int):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self._leases = [0] * slots
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def put(self, frame: Any) -> Optional[FrameRef]:
+        """Copy a frame_capture.Frame into a free slot; None when it doesn't fit or the ring is full."""
+        size = len(frame.pixels)
+        if size > self.slot_size:
+            return None
+        with self._lock:
+            for i in range(self.slots):
+                slot = (self._next + i) % self.slots
+                if self._leases[slot] == 0:
+                    self._leases[slot] = 1
+                    self._next = (slot + 1) % self.slots
+                    break
+            else:
+                return None
+        offset = slot * self.slot_size
+        self.shm.buf[offset:offset + size] = frame.pixels
+        return FrameRef(self, slot, frame.width, frame.height, frame.raw_mode, size)
+
+    def _acquire(self, slot: int):
+        with self._lock:
+            self._leases[slot] += 1
+
+    def _release(self, slot: int):
+        with self._lock:
+            self._leases[slot] = max(0, self._leases[slot] - 1)
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ImageService:
+    """Frame hashing, diffing, resizing and encoding on a process pool.
+
+    Each call takes a frame_capture.Frame (shared through the FrameRing once and
+    then reused by every call on it) or any image load_image accepts; with no
+    workers, non-Frame input, or a full ring the work runs in-process instead,
+    with identical results. Every operation has a blocking and an *_async form.
+    """
+
+    def __init__(self, workers: int = IMAGE_WORKERS, slots: int = IMAGE_RING_SLOTS):
+        self.workers = workers
+        self.slots = slots
+        self._ring: Optional[FrameRing] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shared: "weakref.WeakKeyDictionary[Any, FrameRef]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _start(self, slot_size: int):
+        self._ring = FrameRing(self.slots, slot_size)
+        # spawn: forking a process that runs adb reader threads isn't safe
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_attach,
+            initargs=(self._ring.name, slot_size)
+        )
+        print(f"Image service: {self.workers} workers, {self.slots} x {slot_size / 1e6:.1f} MB frame slots")
+
+    def _share(self, image: Any) -> Optional[FrameRef]:
+        """Ring slot holding this Frame (copied in on first use), or None → in-process."""
+        if not self.enabled or not hasattr(image, "pixels"):
+            return None
+        with self._lock:
+            ref = self._shared.get(image)
+            if ref is not None:
+                return ref
+            if self._ring is None:
+                # Slots sized for the first frame (plus headroom for a rotated or larger screen)
+                self._start(len(image.pixels) + len(image.pixels) // 4)
+            ref = self._ring.put(image)
+            if ref is None:
+                return None
+            self._shared[image] = ref
+            # The frame's own lease ends when the frame is garbage collected
+            weakref.finalize(image, ref.release)
+            return ref
+
+    def _submit(self, func: Callable, refs: List[FrameRef], *args) -> Future:
+        for ref in refs:
+            ref.acquire()
+        try:
+            future = self._pool.submit(func, *[ref.spec for ref in refs], *args)
+        except Exception:
+            for ref in refs:
+                ref.release()
+            raise
+        future.add_done_callback(lambda _: [ref.release() for ref in refs])
+        return future
+
+    @staticmethod
+    def _image(image: Any) -> Optional[Image.Image]:
+        if hasattr(image, "pixels"):
+            return image.image
+        if isinstance(image, Image.Image):
+            return image
+        return load_image(image)
+
+    @staticmethod
+    def _done(value: Any) -> Future:
+        future: Future = Future()
+        future.set_result(value)
+        return future
+
+    # ---- operations (each returns a concurrent.futures.Future) ----
+    def submit_hash(self, image: Any, hash_size: int = 8) -> Future:
+        ref = self._share(image)
+        if ref is None:
+            img = self._image(image)
+            return self._done(_hash_image(img, hash_size) if img is not None else None)
+        return self._submit(_worker_hash, [ref], hash_size)
+
+    def submit_digest(self, image: Any) -> Future:
+        ref = self._share(image)
+        if ref is None:
+            img = self._image(image)
+            return self._done(content_digest(img) if img is not None else None)
+        return self._submit(_worker_digest, [ref])
+
+    def submit_diff(self, a: Any, b: Any) -> Future:
+        ref_a, ref_b = self._share(a), self._share(b)
+        if ref_a is None or ref_b is None:
+            return self._done(_diff_image(self._image(a), self._image(b)))
+        return self._submit(_worker_diff, [ref_a, ref_b])
+
+    def submit_resize(self, image: Any, size: Tuple[int, int]) -> Future:
+        ref = self._share(image)
+        if ref is None:
+            return self._done(_resize_image(self._image(image), size))
+        result: Future = Future()
+
+        def unpack(future: Future):
+            try:
+                out_size, data = future.result()
+                result.set_result(Image.frombytes("RGB", out_size, data))
+            except Exception as e:
+                result.set_exception(e)
+        self._submit(_worker_resize, [ref], size).add_done_callback(unpack)
+        return result
+
+    def submit_encode(self, image: Any, preset: str) -> Future:
+        ref = self._share(image)
+        if ref is None:
+            return self._done(_encode_image(self._image(image), preset))
+        return self._submit(_worker_encode, [ref], preset)
+
+    # ---- blocking and asyncio front ends ----
+    def hash(self, image: Any, hash_size: int = 8) -> Optional[int]:
+        """dhash of the image (hash_size² bits); None if it can't be loaded."""
+        return self.submit_hash(image, hash_size).result()
+
+    async def hash_async(self, image: Any, hash_size: int = 8) -> Optional[int]:
+        return await asyncio.wrap_future(self.submit_hash(image, hash_size))
+
+    def digest(self, image: Any) -> Optional[str]:
+        """image_utils.content_digest of the image; None if it can't be loaded."""
+        return self.submit_digest(image).result()
+
+    async def digest_async(self, image: Any) -> Optional[str]:
+        return await asyncio.wrap_future(self.submit_digest(image))
+
+    def diff(self, a: Any, b: Any) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box of the pixels that differ (None = identical)."""
+        return self.submit_diff(a, b).result()
+
+    async def diff_async(self, a: Any, b: Any) -> Optional[Tuple[int, int, int, int]]:
+        return await asyncio.wrap_future(self.submit_diff(a, b))
+
+    def resize(self, image: Any, size: Tuple[int, int]) -> Image.Image:
+        return self.submit_resize(image, size).result()
+
+    async def resize_async(self, image: Any, size: Tuple[int, int]) -> Image.Image:
+        return await asyncio.wrap_future(self.submit_resize(image, size))
+
+    def encode(self, image: Any, preset: str) -> Tuple[dict, ImageTransform]:
+        """image_utils.preprocess_image for an upload preset: ({"mime_type", "data"}, transform)."""
+        return self.submit_encode(image, preset).result()
+
+    async def encode_async(self, image: Any, preset: str) -> Tuple[dict, ImageTransform]:
+        return await asyncio.wrap_future(self.submit_encode(image, preset))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+            self._shared = weakref.WeakKeyDictionary()
+            if self._ring is not None:
+                self._ring.close()
+                self._ring = None
+
+
+image_service = ImageService()
+atexit.register(image_service.close)
@@ -0,0 +1,116 @@
+# image_utils.py
+import io
+import os
+import hashlib
+from typing import Optional, Union, Any
+from PIL import Image
+
+
+def load_image(image: Union[str, Image.Image, Any]) -> Optional[Image.Image]:
+    """Accept a file path, a PIL image or an in-memory frame_capture.Frame; return an RGB image."""
+    if image is None:
+        return None
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            print(f"Image not found: {image}")
+            return None
+        img = Image.open(image)
+    elif hasattr(image, "to_image"):
+        return image.to_image()
+    else:
+        img = image
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    return img
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: 64-bit perceptual fingerprint of a downscaled grayscale image.
+
+    Screens that differ only by a blinking cursor or status-bar clock hash the same.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def content_digest(img: Image.Image, long_edge: int = 320) -> str:
+    """sha1 of the downscaled grayscale pixels: unlike dhash, typed text changes it."""
+    scale = min(1.0, long_edge / max(img.size))
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return hashlib.sha1(img.convert("L").resize(size, Image.BILINEAR).tobytes()).hexdigest()
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# Per-prompt-type upload policy. crop is (left, top, right, bottom) as fractions of the
+# screen so presets work at any resolution; long_edge=None keeps the cropped size.
+IMAGE_PRESETS = {
+    "full": {"long_edge": None, "format": "PNG", "quality": None, "grayscale": False, "crop": None},
+    "classify": {"long_edge": 768, "format": "JPEG", "quality": 70, "grayscale": False, "crop": None},
+    "verify": {"long_edge": 1024, "format": "JPEG", "quality": 80, "grayscale": False, "crop": None},
+    "locate": {"long_edge": 1280, "format": "JPEG", "quality": 85, "grayscale": False, "crop": None},
+    "toolbar": {"long_edge": None, "format": "JPEG", "quality": 85, "grayscale": False, "crop": (0.0, 0.0, 1.0, 0.12)},
+}
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class ImageTransform:
+    """Maps coordinates in the uploaded (cropped/resized) image back to device pixels."""
+
+    def __init__(self, offset_x: int = 0, offset_y: int = 0, scale: float = 1.0):
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.scale = scale
+
+    def to_device(self, x: float, y: float) -> tuple[int, int]:
+        return int(round(self.offset_x + x / self.scale)), int(round(self.offset_y + y / self.scale))
+
+
+def _crop_box(size: tuple[int, int], crop) -> tuple[int, int, int, int]:
+    width, height = size
+    left, top, right, bottom = crop
+    return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+
+def get_transform(size: tuple[int, int], preset: str) -> ImageTransform:
+    """Transform preprocess_image applies for an image of `size`; computable without encoding."""
+    policy = IMAGE_PRESETS[preset]
+    offset_x, offset_y = 0, 0
+    width, height = size
+    if policy["crop"]:
+        left, top, right, bottom = _crop_box(size, policy["crop"])
+        offset_x, offset_y = left, top
+        width, height = right - left, bottom - top
+    scale = 1.0
+    long_edge = policy["long_edge"]
+    if long_edge and max(width, height) > long_edge:
+        scale = long_edge / max(width, height)
+    return ImageTransform(offset_x, offset_y, scale)
+
+
+def preprocess_image(img: Image.Image, preset: str) -> tuple[dict, ImageTransform]:
+    """Crop/resize/re-encode per preset. Returns ({"mime_type", "data"} blob, transform)."""
+    policy = IMAGE_PRESETS[preset]
+    transform = get_transform(img.size, preset)
+    if policy["crop"]:
+        img = img.crop(_crop_box(img.size, policy["crop"]))
+    if transform.scale != 1.0:
+        target = (max(1, round(img.width * transform.scale)), max(1, round(img.height * transform.scale)))
+        img = img.resize(target, Image.BILINEAR, reducing_gap=2.0)
+    if policy["grayscale"]:
+        img = img.convert("L")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    save_kwargs = {"quality": policy["quality"]} if policy["quality"] else {}
+    img.save(buffer, policy["format"], **save_kwargs)
+    return {"mime_type": _MIME_TYPES[policy["format"]], "data": buffer.getvalue()}, transform
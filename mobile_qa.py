@@ -1,12 +1,14 @@
 # mobile_qa.py
 import subprocess
-import time
 import os
 import warnings
 import json
 from typing import List, Dict
 from PIL import Image
 import google.generativeai as genai
+from settle import wait_for_settle
+from screen_change import ScreenChangeDetector, capture_until_changed
+from ui_parser import capture_ui_snapshot
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -91,6 +93,11 @@ def press_key(key: str) -> bool:
     print(f"Press {key} → {'Success' if success else 'Failed'}")
     return success
 
+def capture_frame_and_ui(path: str):
+    """(screenshot path or None, UISnapshot) for the screen-change detector."""
+    screenshot = path if take_screenshot(path) else None
+    return screenshot, capture_ui_snapshot(screenshot)
+
 # ====================
 # GEMINI VISION FUNCTIONS
 # ====================
@@ -201,15 +208,24 @@ def run_autonomous_test(test_id: str, goal: str, max_steps: int = 20) -> Dict:
     success, _ = adb(["shell", "monkey", "-p", OBSIDIAN_PACKAGE, "1"])
     if not success:
         print("Failed to launch Obsidian")
-    time.sleep(10)
+    wait_for_settle(timeout=10, min_wait=1.0, label="Launch")
 
     history = []
     step = 0
+    detector = ScreenChangeDetector()
+    # Frames land here first; only frames that changed are kept as step artifacts
+    pending_path = os.path.join(test_dir, "_pending.png")
 
     while step < max_steps:
         step += 1
         screenshot_path = os.path.join(test_dir, f"step_{step:02d}.png")
-        take_screenshot(screenshot_path)
+        # With the UI structure hash, typed text counts as a change (the frame dHash rarely moves)
+        capture_until_changed(
+            lambda: capture_frame_and_ui(pending_path),
+            detector
+        )
+        if os.path.exists(pending_path):
+            os.replace(pending_path, screenshot_path)
 
         # Verify goal
         verification = verify_goal_completion(goal, screenshot_path)
@@ -249,7 +265,7 @@ def run_autonomous_test(test_id: str, goal: str, max_steps: int = 20) -> Dict:
         history.append(f"{action_str} → {status}")
         print(f"Step {step}: {action_str} → {status}")
 
-        time.sleep(5)  # Give UI time to respond
+        wait_for_settle(timeout=5)  # Give UI time to respond
 
     # Final check
     final_verification = verify_goal_completion(goal, screenshot_path)
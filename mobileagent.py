@@ -1,111 +1,266 @@
 # mobileagent.py
 import os
-import time
 import warnings
-from adb_helper import take_screenshot, device_check, launch_app, dump_ui_hierarchy, _run_adb
-from agents import Planner, Supervisor, Executor
-from gemini_helper import analyze_image_with_prompt
+from typing import Optional
+from adb_helper import device_check, launch_app, _run_adb
+from agents import Planner, Supervisor, Executor, goal_target_screen
+from frame_capture import capture_screenshot, save_artifact, artifact_writer
+from settle import wait_for_settle
+from screen_change import ScreenChangeDetector, capture_until_changed
+from ui_parser import capture_ui_snapshot
+from trace_replay import TraceRecorder, TraceReplayer, load_trace, TRACE_DIR
+from screen_graph import ScreenNavigator, load_graph, GRAPH_PATH
+from fixtures import FIXTURES, USE_FIXTURES, apply_fixture
+from gemini_helper import analyze_image_with_prompt, vision_cache, rate_limiter
+from step_timing import step_timer, span
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 
-def is_obsidian_running() -> bool:
-    success, output = _run_adb(["shell", "pidof", "md.obsidian"])
+TESTS = [
+    ("T1", "Create a new vault named 'InternVault' and open it"),
+    ("T2", "Create a new note titled 'Meeting Notes' with body 'Daily Standup'"),
+    ("T3", "Go to Settings and navigate to the Appearance tab"),
+    ("T4", "Open any note, tap the three-dot menu, scroll down, and confirm 'Print to PDF' option is visible"),
+]
+
+# Test → test whose end state it starts from (the vault T1 creates, the note T2 writes).
+# Without fixtures a test must run after its dependency on the same device.
+TEST_DEPENDS = {
+    "T2": "T1",
+    "T3": "T1",
+    "T4": "T2",
+}
+
+
+def is_obsidian_running(serial: Optional[str] = None) -> bool:
+    success, output = _run_adb(["shell", "pidof", "md.obsidian"], serial)
     return success and output.strip() != ""
 
 
 class MobileQAAgent:
-    def __init__(self):
-        self.planner = Planner()
+    def __init__(
+        self,
+        combined_vision: bool = True,
+        unchanged_retries: int = 3,
+        serial: Optional[str] = None,
+        replay: bool = True,
+        record: bool = True,
+        trace_dir: str = TRACE_DIR,
+        graph_path: Optional[str] = GRAPH_PATH,
+        fixtures: bool = USE_FIXTURES
+    ):
+        # serial: target device (adb -s); None lets adb pick the only attached one
+        self.serial = serial
+        # combined_vision: one plan-and-verify model call per step instead of
+        # separate verify + classify calls (falls back automatically on bad JSON)
+        self.combined_vision = combined_vision
+        # How many backoff re-captures to spend when an action left the screen unchanged
+        self.unchanged_retries = unchanged_retries
+        # replay: run traces/<test>.json at ADB speed until the app diverges;
+        # record: save the executed steps of a passing run as that trace
+        self.replay = replay
+        self.record = record
+        self.trace_dir = trace_dir
+        # Crawled screen graph (screen_graph.py crawl): shortest-path taps to the goal's
+        # target screen without model calls; None disables navigation
+        self.graph = load_graph(graph_path) if graph_path else None
+        # fixtures: reset/seed app state per test (fixtures.FIXTURES) instead of
+        # reusing whatever the previous test left behind
+        self.fixtures = fixtures
+        self.planner = Planner(serial)
         self.supervisor = Supervisor()
-        self.executor = Executor()
+        self.executor = Executor(serial)
 
     def should_relaunch(self) -> bool:
         # Relaunch ONLY if Obsidian is NOT running
-        return not is_obsidian_running()
+        return not is_obsidian_running(self.serial)
+
+    def _capture(self, screenshot_path: str):
+        screenshot = capture_screenshot(screenshot_path, save=False, serial=self.serial)
+        # One dump + one parse per step, shared by Supervisor, Planner and Executor
+        return screenshot, capture_ui_snapshot(screenshot, serial=self.serial)
 
     def run_test(self, test_id: str, test_goal: str, max_steps: int = 20):
         print(f"\nSTARTING TEST {test_id}: {test_goal}")
 
-        if not device_check():
+        if not device_check(self.serial):
             return {"result": "FAIL", "reason": "No emulator/device connected"}
 
+        step_timer.begin_test(test_id)
         artifacts_dir = f"artifacts/{test_id}"
+        if self.serial:
+            artifacts_dir = f"artifacts/{self.serial.replace(':', '_')}/{test_id}"
         os.makedirs(artifacts_dir, exist_ok=True)
 
+        fixture = FIXTURES.get(test_id) if self.fixtures else None
+        setup = None
+        if fixture is not None:
+            with span("fixture"):
+                setup = apply_fixture(fixture, self.serial)
+            if not setup["ok"]:
+                reason = f"Fixture {fixture.name} failed"
+                if setup.get("error"):
+                    reason += f": {setup['error']}"
+                return {"result": "FAIL", "reason": reason, "setup": setup}
         # Decide whether to relaunch based on process state
-        if self.should_relaunch():
+        elif self.should_relaunch():
             print("Obsidian not running → launching...")
-            if not launch_app("md.obsidian"):
+            if not launch_app("md.obsidian", self.serial):
                 return {"result": "FAIL", "reason": "Failed to launch Obsidian"}
-            time.sleep(10)
+            wait_for_settle(timeout=10, min_wait=1.0, label="Launch", serial=self.serial)
         else:
             print("Obsidian already running → no relaunch.")
 
         history = []
         step = 0
+        settle_time = 0.0
+        replayed = 0
+        navigated = 0
+        detector = ScreenChangeDetector()
+        recorder = TraceRecorder(test_id, test_goal) if self.record else None
+        trace = load_trace(test_id, self.trace_dir) if self.replay else None
+        replayer = TraceReplayer(trace) if trace else None
+        if replayer is not None:
+            print(f"Replaying stored trace ({len(trace['steps'])} steps)")
+        target_screen = goal_target_screen(test_goal)
+        navigator = None
+        if replayer is None and self.graph is not None and target_screen is not None:
+            navigator = ScreenNavigator(self.graph, target_screen)
+            print(f"Navigating the screen graph to '{target_screen}'")
 
         while step < max_steps:
+            step_timer.end_step()
             step += 1
+            step_timer.begin_step(test_id, step)
             screenshot_path = f"{artifacts_dir}/step_{step:02d}.png"
-            take_screenshot(screenshot_path)
-            print(f"Step {step}: Screenshot saved → {screenshot_path}")
-
-            dump_ui_hierarchy()
-
-            # 1. Verify goal
-            verification = self.supervisor.verify_state(test_goal, screenshot_path)
-            if verification.get("completed"):
-                result = "PASS" if verification.get("pass") else "FAIL"
-                reason = verification.get("reason", "Goal achieved")
-                print(f"TEST {result}: {reason}")
-                return {
-                    "result": result,
-                    "reason": reason,
-                    "artifacts": artifacts_dir,
-                    "steps_taken": step
-                }
-
-            # 2. Plan
-            action = self.planner.decide_next_action(
-                goal=test_goal,
-                screenshot_path=screenshot_path,
-                history=history
-            )
-
-            if not action or action.strip().lower() == "done":
-                print("Agent stopped (DONE or no action)")
-                break
-
-            print(f"Planned action: {action}")
+            # Unchanged screen after an action → back off and re-capture, not re-plan
+            with span("step.capture"):
+                screenshot, snapshot, _ = capture_until_changed(
+                    lambda: self._capture(screenshot_path),
+                    detector,
+                    retries=self.unchanged_retries
+                )
+            save_artifact(screenshot, screenshot_path)
+            print(f"Step {step}: Screenshot captured → {screenshot_path}")
+            # Annotate the previous action with what it changed on screen
+            diff = self.planner.observe(snapshot)
+            if diff is not None and history:
+                history[-1] += f" | UI: {diff.summary()}"
+            last_change = history[-1] if history else None
+
+            # 0. Replay / graph navigation: screen is known → no model calls this step
+            action = replayer.next_action(snapshot) if replayer is not None else None
+            nav_action = navigator.next_action(snapshot) if navigator is not None else None
+            planned = False
+            if action is not None:
+                replayed += 1
+                screen_label = replayer.current_screen
+                print(f"Replayed action: {action}")
+            elif nav_action is not None:
+                action = nav_action
+                navigated += 1
+                screen_label = navigator.current_screen
+                print(f"Navigator action: {action}")
+            else:
+                # 1. Verify goal (and classify the screen in the same call when combined)
+                assessment = None
+                # A confident XML label means only the verdict needs the model → plain verify
+                if self.combined_vision and self.planner.xml_screen(snapshot) is None:
+                    assessment = self.supervisor.assess_step(test_goal, snapshot=snapshot, last_change=last_change)
+                    if assessment is None:
+                        print("Combined vision call failed → separate verify/classify")
+                verification = assessment or self.supervisor.verify_state(
+                    test_goal, snapshot=snapshot, last_change=last_change
+                )
+                if verification.get("completed"):
+                    result = "PASS" if verification.get("pass") else "FAIL"
+                    reason = verification.get("reason", "Goal achieved")
+                    print(f"TEST {result}: {reason}")
+                    if recorder is not None and result == "PASS" and recorder.steps:
+                        final_screen = assessment["screen"] if assessment else self.planner.xml_screen(snapshot)
+                        recorder.save(self.trace_dir, final_screen=final_screen)
+                    artifact_writer.flush()
+                    step_timer.end_step()
+                    step_timer.save(test_id, artifacts_dir)
+                    return {
+                        "result": result,
+                        "reason": reason,
+                        "artifacts": artifacts_dir,
+                        "steps_taken": step,
+                        "replayed_steps": replayed,
+                        "navigated_steps": navigated,
+                        "settle_time": round(settle_time, 2),
+                        "setup": setup,
+                        "classification": self.planner.classification_stats()
+                    }
+
+                # 2. Plan
+                with span("step.plan"):
+                    action = self.planner.decide_next_action(
+                        goal=test_goal,
+                        history=history,
+                        snapshot=snapshot,
+                        screen_label=assessment["screen"] if assessment else None,
+                        tap_hint=assessment["tap"] if assessment else None
+                    )
+
+                if not action or action.strip().lower() == "done":
+                    print("Agent stopped (DONE or no action)")
+                    break
+
+                screen_label = self.planner.last_screen
+                planned = True
+                print(f"Planned action: {action}")
 
             # 3. Execute
-            success = self.executor.execute(action)
+            with span("step.execute"):
+                success = self.executor.execute(action, snapshot)
+            if planned:
+                self.planner.action_result(success)
+            else:
+                # The planner takes over after replay/navigation: carry over what was already done
+                self.planner.absorb(test_goal, action, screen_label, success)
             status = "success" if success else "failed"
             history.append(f"{action} → {status}")
+            if recorder is not None:
+                recorder.record(action, snapshot, screen_label, success)
             print(f"Executed → {status}")
 
-            time.sleep(6)
+            settle_time += wait_for_settle(timeout=6, serial=self.serial)["elapsed"]
 
+        artifact_writer.flush()
+        step_timer.end_step()
+        step_timer.save(test_id, artifacts_dir)
         return {
             "result": "FAIL",
             "reason": f"Max steps ({max_steps}) reached",
             "artifacts": artifacts_dir,
-            "steps_taken": step
+            "steps_taken": step,
+            "replayed_steps": replayed,
+            "navigated_steps": navigated,
+            "settle_time": round(settle_time, 2),
+            "setup": setup,
+            "classification": self.planner.classification_stats()
         }
 
 
 if __name__ == "__main__":
-    agent = MobileQAAgent()
-
-    TESTS = [
-        ("T1", "Create a new vault named 'InternVault' and open it"),
-        ("T2", "Create a new note titled 'Meeting Notes' with body 'Daily Standup'"),
-        ("T3", "Go to Settings and navigate to the Appearance tab"),
-        ("T4", "Open any note, tap the three-dot menu, scroll down, and confirm 'Print to PDF' option is visible"),
-    ]
-
-    for test_id, goal in TESTS:
-        result = agent.run_test(test_id, goal)
-        print(f"{test_id} → {result['result']} | {result.get('reason', '')}")
-        print(f"   Artifacts: {result['artifacts']}\n")
\ No newline at end of file
+    import sys
+    from scheduler import run_parallel
+
+    # A fresh agent per test on every attached device (or the serials given on the
+    # command line). Without APP_FIXTURES=1, T1 → T2/T3 → T4 run in order on one device.
+    report = run_parallel(TESTS, serials=sys.argv[1:] or None)
+    for result in report["results"]:
+        print(f"{result['test_id']} [{result['device']}] → {result['result']} | {result.get('reason', '')}")
+        if "classification" in result:
+            print(f"   Screens classified from XML: {result['classification']['xml_fraction']:.0%}")
+        if "artifacts" in result:
+            print(f"   Artifacts: {result['artifacts']}\n")
+    print(f"{report['passed']} passed, {report['failed']} failed in {report.get('wall_time', 0)}s")
+
+    if vision_cache is not None:
+        print(f"Vision cache: {vision_cache.stats()}")
+    print(f"Rate limiter: {rate_limiter.stats()}")
+    step_timer.print_summary()
@@ -0,0 +1,145 @@
+# scheduler.py
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from adb_helper import list_devices
+from mobileagent import MobileQAAgent, TESTS, TEST_DEPENDS
+from fixtures import USE_FIXTURES
+from step_timing import step_timer
+
+
+def test_chains(
+    tests: List[Tuple[str, str]],
+    depends: Dict[str, str] = TEST_DEPENDS,
+    fixtures: bool = USE_FIXTURES
+) -> List[List[Tuple[int, str, str]]]:
+    """Group tests into chains of (order, test_id, goal) that must run in order on one device.
+
+    A test joins its dependency's chain (T1 → T2 → T4); with fixtures every test
+    sets up its own state, so each one is a chain of its own.
+    """
+    chains: List[List[Tuple[int, str, str]]] = []
+    chain_of: Dict[str, int] = {}
+    for order, (test_id, goal) in enumerate(tests):
+        dependency = None if fixtures else depends.get(test_id)
+        if dependency in chain_of:
+            index = chain_of[dependency]
+        else:
+            index = len(chains)
+            chains.append([])
+        chains[index].append((order, test_id, goal))
+        chain_of[test_id] = index
+    return chains
+
+
+def dependency_failure(test_id: str, failed: set, depends: Dict[str, str] = TEST_DEPENDS) -> Optional[dict]:
+    """FAIL result for a test whose dependency already failed on this device, else None."""
+    dependency = depends.get(test_id)
+    if dependency in failed:
+        return {"result": "FAIL", "reason": f"Skipped: depends on {dependency}, which failed"}
+    return None
+
+
+def run_parallel(
+    tests: List[Tuple[str, str]],
+    serials: Optional[List[str]] = None,
+    report_path: str = "artifacts/report.json",
+    max_steps: int = 20,
+    fixtures: bool = USE_FIXTURES,
+    run_test: Optional[Callable[[str, str, str, int], dict]] = None
+) -> dict:
+    """Run tests across every attached device: one worker thread per serial pulling from a shared queue.
+
+    The queue holds test_chains(): a test that starts from another test's end
+    state runs after it on the same device (without fixtures). Each test gets a
+    fresh MobileQAAgent bound to the worker's device, so planner state,
+    current_ui_<serial>.xml and artifacts/<serial>/ never mix between devices.
+    `run_test(test_id, goal, serial, max_steps)` replaces that agent run.
+    """
+    if run_test is None:
+        def run_test(test_id: str, goal: str, serial: str, max_steps: int) -> dict:
+            return MobileQAAgent(serial=serial, fixtures=fixtures).run_test(test_id, goal, max_steps=max_steps)
+
+    serials = serials or list_devices()
+    if not serials:
+        print("No devices found for scheduling")
+        return {"devices": [], "results": [], "passed": 0, "failed": len(tests)}
+
+    print(f"Scheduling {len(tests)} tests on {len(serials)} devices: {', '.join(serials)}")
+    chains = test_chains(tests, fixtures=fixtures)
+    if len(chains) < min(len(serials), len(tests)):
+        print(f"Dependent tests share a device: {len(chains)} chain(s) for {len(serials)} devices "
+              f"(APP_FIXTURES=1 lets every test run on its own)")
+    work: queue.Queue = queue.Queue()
+    for chain in chains:
+        work.put(chain)
+
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(serial: str):
+        while True:
+            try:
+                chain = work.get_nowait()
+            except queue.Empty:
+                return
+            failed = set()
+            for order, test_id, goal in chain:
+                start = time.monotonic()
+                result = None if fixtures else dependency_failure(test_id, failed)
+                if result is None:
+                    try:
+                        result = run_test(test_id, goal, serial, max_steps)
+                    except Exception as e:
+                        result = {"result": "FAIL", "reason": f"Worker exception: {e}"}
+                if result.get("result") != "PASS":
+                    failed.add(test_id)
+                result.update({
+                    "test_id": test_id,
+                    "goal": goal,
+                    "device": serial,
+                    "duration": round(time.monotonic() - start, 2),
+                    "order": order
+                })
+                print(f"[{serial}] {test_id} → {result['result']} | {result.get('reason', '')}")
+                with results_lock:
+                    results.append(result)
+
+    wall_start = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(serial,), name=f"qa-{serial}") for serial in serials]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results.sort(key=lambda r: r["order"])
+    for r in results:
+        del r["order"]
+    passed = sum(1 for r in results if r.get("result") == "PASS")
+    report = {
+        "devices": serials,
+        "wall_time": round(time.monotonic() - wall_start, 2),
+        "passed": passed,
+        "failed": len(results) - passed,
+        "results": results,
+        "timing": step_timer.summary()
+    }
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved: {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    # Optional device serials on the command line; default is every attached device
+    report = run_parallel(TESTS, serials=sys.argv[1:] or None)
+    for r in report["results"]:
+        print(f"{r['test_id']} [{r['device']}] → {r['result']} | {r.get('reason', '')}")
+    print(f"{report['passed']} passed, {report['failed']} failed in {report.get('wall_time', 0)}s")
+    step_timer.print_summary()
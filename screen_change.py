@@ -0,0 +1,98 @@
+# screen_change.py
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from image_utils import hamming
+from image_service import image_service
+from step_timing import span
+
+
+class ScreenChangeDetector:
+    """Tells whether the last action visibly moved the UI.
+
+    Compares a downscaled perceptual hash of the frame and, when a UISnapshot
+    is available, its structural hash. Both must match for "unchanged".
+    """
+
+    def __init__(self, max_distance: int = 0):
+        self.max_distance = max_distance
+        self._frame_hash: Optional[int] = None
+        self._ui_hash: Optional[str] = None
+
+    def reset(self):
+        self._frame_hash = None
+        self._ui_hash = None
+
+    def update(self, screenshot: Any = None, snapshot: Any = None) -> bool:
+        """Record the new screen; return True if it differs from the previous one."""
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        frame_hash = image_service.hash(screenshot) if screenshot is not None else None
+        return self._record(frame_hash, snapshot)
+
+    async def update_async(self, screenshot: Any = None, snapshot: Any = None) -> bool:
+        """update() with the frame hashed off the event loop (image worker pool)."""
+        if screenshot is None and snapshot is not None:
+            screenshot = snapshot.screenshot
+        frame_hash = await image_service.hash_async(screenshot) if screenshot is not None else None
+        return self._record(frame_hash, snapshot)
+
+    def _record(self, frame_hash: Optional[int], snapshot: Any) -> bool:
+        ui_hash = snapshot.structure_hash if snapshot is not None and snapshot.nodes is not None else None
+
+        compared = False
+        changed = False
+        if frame_hash is not None and self._frame_hash is not None:
+            compared = True
+            changed = hamming(frame_hash, self._frame_hash) > self.max_distance
+        if ui_hash is not None and self._ui_hash is not None:
+            compared = True
+            changed = changed or ui_hash != self._ui_hash
+
+        self._frame_hash = frame_hash
+        self._ui_hash = ui_hash
+        return changed or not compared
+
+
+def capture_until_changed(
+    capture: Callable[[], Tuple[Any, Any]],
+    detector: ScreenChangeDetector,
+    retries: int = 3,
+    backoff: float = 1.0
+) -> Tuple[Any, Any, bool]:
+    """Capture via `capture()` -> (screenshot, snapshot); while the screen matches
+    the previous step, back off exponentially and re-capture instead of re-planning.
+
+    Returns (screenshot, snapshot, changed).
+    """
+    for attempt in range(retries + 1):
+        screenshot, snapshot = capture()
+        if detector.update(screenshot, snapshot):
+            return screenshot, snapshot, True
+        if attempt < retries:
+            delay = backoff * (2 ** attempt)
+            print(f"Screen unchanged → retry {attempt + 1}/{retries} in {delay:.1f}s")
+            with span("backoff"):
+                time.sleep(delay)
+    print("Screen still unchanged after retries → re-planning")
+    return screenshot, snapshot, False
+
+
+async def capture_until_changed_async(
+    capture: Callable[[], Awaitable[Tuple[Any, Any]]],
+    detector: ScreenChangeDetector,
+    retries: int = 3,
+    backoff: float = 1.0
+) -> Tuple[Any, Any, bool]:
+    """asyncio capture_until_changed: backoff sleeps don't block other devices' loops."""
+    for attempt in range(retries + 1):
+        screenshot, snapshot = await capture()
+        if await detector.update_async(screenshot, snapshot):
+            return screenshot, snapshot, True
+        if attempt < retries:
+            delay = backoff * (2 ** attempt)
+            print(f"Screen unchanged → retry {attempt + 1}/{retries} in {delay:.1f}s")
+            with span("backoff"):
+                await asyncio.sleep(delay)
+    print("Screen still unchanged after retries → re-planning")
+    return screenshot, snapshot, False
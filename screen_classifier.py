@@ -0,0 +1,38 @@
+# screen_classifier.py
+import os
+from typing import Tuple
+from ui_parser import UISnapshot
+
+# Below this confidence the Planner still asks the vision model
+CLASSIFIER_THRESHOLD = float(os.getenv("XML_CLASSIFIER_THRESHOLD", "0.8"))
+
+# (label, confidence, all_of, none_of): every all_of marker must appear in the
+# snapshot's lowercase text index (text, content-desc, resource-id, hint or package)
+# and no none_of marker may. First rule with the highest confidence wins.
+SCREEN_RULES = [
+    ("editor", 0.95, ["untitled"], []),
+    ("new_tab", 0.95, ["create new note"], []),
+    ("appearance", 0.9, ["accent color"], []),
+    ("appearance", 0.85, ["base color scheme"], []),
+    ("settings", 0.9, ["files & links", "appearance"], ["accent color"]),
+    ("config", 0.95, ["configure your new vault", "vault name"], []),
+    ("config", 0.85, ["vault name", "create a vault"], []),
+    ("welcome", 0.85, ["create a vault", "open folder as vault"], ["vault name"]),
+    ("sync", 0.85, ["obsidian sync"], ["vault name"]),
+    ("folder_select", 0.85, ["com.android.documentsui", "use this folder"], []),
+    ("permission", 0.85, ["permissioncontroller"], []),
+    ("permission", 0.8, ["allow access", "all files"], []),
+]
+
+
+def classify_snapshot(snapshot: UISnapshot) -> Tuple[str, float]:
+    """Label an Obsidian screen from its UI hierarchy alone. Returns (label, confidence)."""
+    if snapshot is None or snapshot.nodes is None:
+        return "unknown", 0.0
+    best_label, best_confidence = "unknown", 0.0
+    for label, confidence, all_of, none_of in SCREEN_RULES:
+        if confidence <= best_confidence:
+            continue
+        if all(snapshot.contains_text(m) for m in all_of) and not any(snapshot.contains_text(m) for m in none_of):
+            best_label, best_confidence = label, confidence
+    return best_label, best_confidence
@@ -0,0 +1,368 @@
+# screen_graph.py
+import os
+import sys
+import json
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from adb_helper import tap, press_back, launch_app
+from settle import wait_for_settle
+from ui_parser import capture_ui_snapshot, element_key, key_similarity, UISnapshot
+from screen_classifier import classify_snapshot
+from trace_replay import resolve_target
+
+# Where `python screen_graph.py crawl` saves the graph and the agents load it from
+GRAPH_PATH = os.getenv("SCREEN_GRAPH", "screen_graph.json")
+# Minimum clickable-set similarity for a snapshot to count as a known screen
+SCREEN_MATCH_THRESHOLD = float(os.getenv("SCREEN_MATCH_THRESHOLD", "0.8"))
+CRAWL_MAX_ACTIONS = int(os.getenv("CRAWL_MAX_ACTIONS", "60"))
+# Elements whose text contains one of these are never tapped while crawling
+CRAWL_SKIP = [s.strip().lower() for s in os.getenv(
+    "CRAWL_SKIP", "delete,remove,uninstall,sign out,log out,reset"
+).split(",") if s.strip()]
+APP_PACKAGE = "md.obsidian"
+# Edge key for the system back button
+BACK = "back"
+
+
+class ScreenGraph:
+    """Screens of one app keyed by UI fingerprint, with the element taps that move between them.
+
+    screens: {id: {"label", "element_keys", "tried", "visits"}}, id = first-seen fingerprint
+    edges:   [{"from", "to", "key", "center", "text"}], key = element_key of the tapped element
+             (or "back"); "to" is None when the tap left the app
+    """
+
+    def __init__(self, package: str = APP_PACKAGE, threshold: float = SCREEN_MATCH_THRESHOLD):
+        self.package = package
+        self.threshold = threshold
+        self.root: Optional[str] = None
+        self.screens: Dict[str, Dict] = {}
+        self.edges: List[Dict] = []
+
+    # ---- screens ----
+    def match(self, snapshot: UISnapshot) -> Optional[str]:
+        """Id of the known screen this snapshot shows (exact fingerprint first, then most similar)."""
+        if snapshot.nodes is None:
+            return None
+        fingerprint = snapshot.fingerprint
+        if fingerprint in self.screens:
+            return fingerprint
+        keys = snapshot.element_keys()
+        best_id, best = None, self.threshold
+        for screen_id, screen in self.screens.items():
+            similarity = key_similarity(keys, screen["element_keys"])
+            if similarity >= best:
+                best_id, best = screen_id, similarity
+        return best_id
+
+    def add_screen(self, snapshot: UISnapshot) -> str:
+        screen_id = self.match(snapshot)
+        if screen_id is None:
+            screen_id = snapshot.fingerprint
+            label, confidence = classify_snapshot(snapshot)
+            self.screens[screen_id] = {
+                "label": label,
+                "confidence": confidence,
+                "element_keys": sorted(set(snapshot.element_keys())),
+                "tried": [],
+                "visits": 0
+            }
+            if self.root is None:
+                self.root = screen_id
+        self.screens[screen_id]["visits"] += 1
+        return screen_id
+
+    def label(self, screen_id: Optional[str]) -> Optional[str]:
+        return self.screens[screen_id]["label"] if screen_id in self.screens else None
+
+    def untried(self, screen_id: str) -> List[str]:
+        screen = self.screens[screen_id]
+        tried = set(screen["tried"])
+        return [key for key in screen["element_keys"] if key not in tried and not _skipped(key)]
+
+    # ---- edges ----
+    def add_edge(self, source: str, key: str, center: Tuple[int, int], target: Optional[str], text: str = ""):
+        if key not in self.screens[source]["tried"]:
+            self.screens[source]["tried"].append(key)
+        for edge in self.edges:
+            if edge["from"] == source and edge["key"] == key:
+                edge.update({"to": target, "center": list(center)})
+                return
+        self.edges.append({"from": source, "to": target, "key": key, "center": list(center), "text": text})
+
+    def _is_target(self, screen_id: str, target: str) -> bool:
+        return screen_id == target or self.label(screen_id) == target
+
+    def shortest_path(self, source: str, target: str) -> Optional[List[Dict]]:
+        """Fewest taps from `source` to a screen with id or label `target`; [] when already there."""
+        if self._is_target(source, target):
+            return []
+        outgoing: Dict[str, List[Dict]] = {}
+        for edge in self.edges:
+            if edge["to"] is not None and edge["to"] != edge["from"]:
+                outgoing.setdefault(edge["from"], []).append(edge)
+        previous: Dict[str, Dict] = {}
+        queue = deque([source])
+        seen = {source}
+        while queue:
+            current = queue.popleft()
+            for edge in outgoing.get(current, []):
+                nxt = edge["to"]
+                if nxt in seen:
+                    continue
+                seen.add(nxt)
+                previous[nxt] = edge
+                if self._is_target(nxt, target):
+                    path = []
+                    while nxt != source:
+                        path.append(previous[nxt])
+                        nxt = previous[nxt]["from"]
+                    return path[::-1]
+                queue.append(nxt)
+        return None
+
+    def nearest_frontier(self, source: str) -> Optional[List[Dict]]:
+        """Shortest path to the closest screen that still has untried elements."""
+        best = None
+        for screen_id in self.screens:
+            if not self.untried(screen_id):
+                continue
+            path = self.shortest_path(source, screen_id)
+            if path is not None and (best is None or len(path) < len(best)):
+                best = path
+        return best
+
+    # ---- persistence ----
+    def to_dict(self) -> Dict:
+        return {
+            "package": self.package,
+            "root": self.root,
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "screens": self.screens,
+            "edges": self.edges
+        }
+
+    def save(self, path: str = GRAPH_PATH) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"Screen graph saved: {path} ({len(self.screens)} screens, {len(self.edges)} edges)")
+        return path
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScreenGraph":
+        graph = cls(data.get("package", APP_PACKAGE))
+        graph.root = data.get("root")
+        graph.screens = data.get("screens", {})
+        graph.edges = data.get("edges", [])
+        return graph
+
+
+def load_graph(path: str = GRAPH_PATH) -> Optional[ScreenGraph]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return ScreenGraph.from_dict(json.load(f))
+    except Exception as e:
+        print(f"Screen graph load failed ({path}): {e}")
+        return None
+
+
+def _skipped(key: str) -> bool:
+    return key != BACK and any(word in key.split("|", 1)[-1] for word in CRAWL_SKIP)
+
+
+def _edge_point(edge: Dict, snapshot: UISnapshot) -> Tuple[int, int]:
+    for element in snapshot.elements:
+        if element_key(element) == edge["key"]:
+            return element["center"]
+    return tuple(edge["center"])
+
+
+class ScreenCrawler:
+    """Explores an app from its launcher activity, tapping every clickable element once.
+
+    After each tap the new screen is fingerprinted and an edge recorded; exhausted
+    screens are left by walking the graph to the nearest screen with untried
+    elements, by back, or by relaunching the app.
+    """
+
+    def __init__(self, serial: Optional[str] = None, graph: Optional[ScreenGraph] = None,
+                 max_actions: int = CRAWL_MAX_ACTIONS):
+        self.serial = serial
+        self.graph = graph or ScreenGraph()
+        self.max_actions = max_actions
+        self.actions = 0
+
+    def _observe(self) -> Tuple[UISnapshot, Optional[str]]:
+        wait_for_settle(timeout=6, serial=self.serial)
+        snapshot = capture_ui_snapshot(serial=self.serial)
+        if snapshot.nodes is None or self.graph.package not in snapshot.packages:
+            return snapshot, None
+        return snapshot, self.graph.add_screen(snapshot)
+
+    def _relaunch(self) -> Tuple[UISnapshot, Optional[str]]:
+        launch_app(self.graph.package, self.serial)
+        return self._observe()
+
+    def _back(self, source: str) -> Tuple[UISnapshot, Optional[str]]:
+        press_back(self.serial)
+        self.actions += 1
+        snapshot, current = self._observe()
+        if current is not None and current != source:
+            self.graph.add_edge(source, BACK, (0, 0), current)
+        return snapshot, current
+
+    def _follow(self, path: List[Dict], snapshot: UISnapshot, current: str) -> Tuple[UISnapshot, Optional[str]]:
+        for edge in path:
+            if edge["key"] == BACK:
+                press_back(self.serial)
+            else:
+                tap(*_edge_point(edge, snapshot), self.serial)
+            self.actions += 1
+            snapshot, current = self._observe()
+            if current != edge["to"]:
+                print(f"Crawl: expected {edge['to']}, got {current} → re-planning")
+                break
+        return snapshot, current
+
+    def crawl(self) -> ScreenGraph:
+        snapshot, current = self._relaunch()
+        while self.actions < self.max_actions:
+            if current is None:
+                # Outside the app (or no dump): back out once, else relaunch
+                snapshot, current = self._back_out()
+                if current is None:
+                    break
+                continue
+            untried = self.graph.untried(current)
+            if not untried:
+                path = self.graph.nearest_frontier(current)
+                if path is None:
+                    if not any(self.graph.untried(s) for s in self.graph.screens):
+                        break
+                    # Untried screens not reachable by known taps: back, else restart from the launcher
+                    snapshot, current = self._back(current)
+                    if current is None or self.graph.nearest_frontier(current) is None:
+                        snapshot, current = self._relaunch()
+                        if current is None or self.graph.nearest_frontier(current) is None:
+                            break
+                    continue
+                snapshot, current = self._follow(path, snapshot, current)
+                continue
+            key = untried[0]
+            element = next((e for e in snapshot.elements if element_key(e) == key), None)
+            if element is None:
+                # Element from the stored key set isn't on this instance of the screen
+                self.graph.screens[current]["tried"].append(key)
+                continue
+            print(f"Crawl {self.actions + 1}/{self.max_actions}: {self.graph.label(current)} → tap {element['text'] or key}")
+            tap(*element["center"], self.serial)
+            self.actions += 1
+            source = current
+            snapshot, current = self._observe()
+            self.graph.add_edge(source, key, element["center"], current, element["text"])
+        print(f"Crawl finished: {len(self.graph.screens)} screens, {len(self.graph.edges)} edges, {self.actions} actions")
+        return self.graph
+
+    def _back_out(self) -> Tuple[UISnapshot, Optional[str]]:
+        press_back(self.serial)
+        self.actions += 1
+        snapshot, current = self._observe()
+        if current is None:
+            snapshot, current = self._relaunch()
+        return snapshot, current
+
+
+class ScreenNavigator:
+    """Walks the shortest known path to a target screen, one tap per step, from UI XML only.
+
+    next_action() re-locates the current screen every step and returns None once
+    the target is reached, the screen is unknown, or a tap didn't move the app,
+    so the caller can hand control to the planner.
+    """
+
+    def __init__(self, graph: ScreenGraph, target: str, max_hops: int = 12):
+        self.graph = graph
+        self.target = target
+        self.max_hops = max_hops
+        self.hops = 0
+        self.finished = False
+        self.reached = False
+        self.current_screen: Optional[str] = None
+        self._last_screen: Optional[str] = None
+
+    def next_edge(self, snapshot: UISnapshot) -> Optional[Dict]:
+        if self.finished:
+            return None
+        current = self.graph.match(snapshot)
+        self.current_screen = self.graph.label(current)
+        path = self.graph.shortest_path(current, self.target) if current is not None else None
+        if not path or self.hops >= self.max_hops or (self.hops and current == self._last_screen):
+            if current is None:
+                print("Navigator: unknown screen → planner")
+            elif path == []:
+                self.reached = True
+                print(f"Navigator: reached {self.target} in {self.hops} taps")
+            else:
+                print(f"Navigator: no route to {self.target} from {self.current_screen} → planner")
+            self.finished = True
+            return None
+        self._last_screen = current
+        self.hops += 1
+        return path[0]
+
+    def next_action(self, snapshot: UISnapshot) -> Optional[str]:
+        """Executor action for the next hop (None = hand over to the planner)."""
+        edge = self.next_edge(snapshot)
+        if edge is None:
+            return None
+        if edge["key"] == BACK:
+            return "back"
+        return resolve_target(edge, snapshot)
+
+
+def navigate_to(target: str, serial: Optional[str] = None, graph: Optional[ScreenGraph] = None) -> bool:
+    """Drive the device to `target` (screen label or id) with graph taps only."""
+    graph = graph or load_graph()
+    if graph is None:
+        print(f"No screen graph at {GRAPH_PATH}; run `python screen_graph.py crawl` first")
+        return False
+    navigator = ScreenNavigator(graph, target)
+    while True:
+        snapshot = capture_ui_snapshot(serial=serial)
+        edge = navigator.next_edge(snapshot)
+        if edge is None:
+            return navigator.reached
+        if edge["key"] == BACK:
+            press_back(serial)
+        else:
+            tap(*_edge_point(edge, snapshot), serial)
+        wait_for_settle(timeout=6, serial=serial)
+
+
+if __name__ == "__main__":
+    # python screen_graph.py crawl [serial] | show | path <from> <to> | goto <target> [serial]
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if command == "crawl":
+        ScreenCrawler(sys.argv[2] if len(sys.argv) > 2 else None).crawl().save()
+    elif command in ("show", "path"):
+        graph = load_graph()
+        if graph is None:
+            print(f"No screen graph at {GRAPH_PATH}")
+            sys.exit(1)
+        if command == "show":
+            for screen_id, screen in graph.screens.items():
+                print(f"{screen_id} {screen['label']:<14} {len(screen['element_keys'])} elements, {screen['visits']} visits")
+            for edge in graph.edges:
+                print(f"  {edge['from']} --{edge['text'] or edge['key']}--> {edge['to']}")
+        else:
+            path = graph.shortest_path(sys.argv[2], sys.argv[3])
+            print(" → ".join(e["text"] or e["key"] for e in path) if path is not None else "No path")
+    elif command == "goto":
+        ok = navigate_to(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        sys.exit(0 if ok else 1)
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
@@ -0,0 +1,112 @@
+# settle.py
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+from adb_helper import get_focused_window
+from frame_capture import capture_frame
+from image_service import image_service
+from step_timing import timed
+
+# Upper bound (seconds) when callers don't pass one; stable_polls consecutive identical polls = settled
+SETTLE_TIMEOUT = float(os.getenv("SETTLE_TIMEOUT", "6"))
+SETTLE_INTERVAL = float(os.getenv("SETTLE_INTERVAL", "0.25"))
+# Polls compare a dhash of SETTLE_HASH_SIZE² bits for equality. At 8 (64 bits) about half
+# of small changes in recorded frames (a spinner appearing, a list row filling in) hashed
+# the same, so settle could call a screen idle mid-transition; 16 catches most of
+# them. Still coarse: a spinner rotating in place usually hashes the same, and a blinking
+# text cursor flips it about a third of the time (as it did at 8).
+SETTLE_HASH_SIZE = int(os.getenv("SETTLE_HASH_SIZE", "16"))
+
+
+def frame_signature(frame: Any) -> Optional[int]:
+    return image_service.hash(frame, hash_size=SETTLE_HASH_SIZE) if frame is not None else None
+
+
+async def frame_signature_async(frame: Any) -> Optional[int]:
+    return await image_service.hash_async(frame, hash_size=SETTLE_HASH_SIZE) if frame is not None else None
+
+
+def _poll_signature(serial: Optional[str] = None) -> tuple:
+    return frame_signature(capture_frame(serial)), get_focused_window(serial)
+
+
+class _SettleTracker:
+    """Shared bookkeeping for the sync and asyncio settle loops."""
+
+    def __init__(self, timeout: float, interval: float, stable_polls: int, label: str):
+        self.timeout = timeout
+        self.interval = interval
+        self.stable_polls = stable_polls
+        self.label = label
+        self.start = time.monotonic()
+        self.last = None
+        self.unchanged = 0
+        self.polls = 0
+
+    def observe(self, signature: tuple) -> tuple[Optional[dict], float]:
+        """Feed one poll. Returns (result, delay): sleep `delay`, then stop if result is set."""
+        self.polls += 1
+        elapsed = time.monotonic() - self.start
+        if signature[0] is None and signature[1] is None:
+            # Nothing to observe (capture failing) → behave like the old fixed sleep
+            remaining = max(0.0, self.timeout - elapsed)
+            print(f"{self.label} settle: no signals, sleeping {remaining:.2f}s")
+            return {"stable": False, "elapsed": self.timeout, "polls": self.polls}, remaining
+        if signature == self.last:
+            self.unchanged += 1
+            if self.unchanged >= self.stable_polls:
+                print(f"{self.label} settled in {elapsed:.2f}s ({self.polls} polls)")
+                return {"stable": True, "elapsed": elapsed, "polls": self.polls}, 0.0
+        else:
+            self.unchanged = 0
+        self.last = signature
+        if elapsed >= self.timeout:
+            print(f"{self.label} not settled after {elapsed:.2f}s ({self.polls} polls)")
+            return {"stable": False, "elapsed": elapsed, "polls": self.polls}, 0.0
+        return None, min(self.interval, self.timeout - elapsed)
+
+
+@timed("settle")
+def wait_for_settle(
+    timeout: Optional[float] = None,
+    interval: float = SETTLE_INTERVAL,
+    stable_polls: int = 2,
+    min_wait: float = 0.0,
+    label: str = "UI",
+    serial: Optional[str] = None
+) -> dict:
+    """Poll framebuffer hash + window focus until they stop changing, instead of a fixed sleep.
+
+    Returns {"stable": bool, "elapsed": seconds, "polls": n}.
+    """
+    tracker = _SettleTracker(SETTLE_TIMEOUT if timeout is None else timeout, interval, stable_polls, label)
+    if min_wait > 0:
+        time.sleep(min_wait)
+    while True:
+        result, delay = tracker.observe(_poll_signature(serial))
+        if delay > 0:
+            time.sleep(delay)
+        if result is not None:
+            return result
+
+
+@timed("settle")
+async def wait_for_settle_async(
+    poll: Callable[[], Awaitable[tuple]],
+    timeout: Optional[float] = None,
+    interval: float = SETTLE_INTERVAL,
+    stable_polls: int = 2,
+    min_wait: float = 0.0,
+    label: str = "UI"
+) -> dict:
+    """asyncio wait_for_settle; `poll()` returns the same (frame hash, focus) signature."""
+    tracker = _SettleTracker(SETTLE_TIMEOUT if timeout is None else timeout, interval, stable_polls, label)
+    if min_wait > 0:
+        await asyncio.sleep(min_wait)
+    while True:
+        result, delay = tracker.observe(await poll())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if result is not None:
+            return result
@@ -0,0 +1,197 @@
+# step_timing.py
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Set STEP_TIMING=0 to turn every span into a no-op
+TIMING_ENABLED = os.getenv("STEP_TIMING", "1") != "0"
+
+# (test_id, step) the current thread/task is working on; asyncio.to_thread copies it
+_current_step: contextvars.ContextVar = contextvars.ContextVar("current_step", default=None)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class StepTimer:
+    """Collects timed spans per test step.
+
+    Spans are tagged with the (test_id, step) set by begin_step, so parallel
+    devices (threads or asyncio tasks) don't mix. save() writes a test's
+    per-step JSON lines and a Chrome trace (chrome://tracing, Perfetto) and
+    frees its spans; per-stage durations are kept for summary().
+    """
+
+    def __init__(self, enabled: bool = TIMING_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._spans: List[Dict[str, Any]] = []
+        self._steps: List[Dict[str, Any]] = []
+        self._durations: Dict[str, List[float]] = {}
+
+    # ---- recording ----
+    def begin_test(self, test_id: str):
+        """Attribute following spans (launch, etc.) to the test but no step."""
+        _current_step.set((test_id, None))
+
+    def begin_step(self, test_id: str, step: int):
+        _current_step.set((test_id, step))
+
+    def end_step(self) -> Optional[Dict[str, Any]]:
+        """Close the current step; returns its record {test_id, step, stages: {name: seconds}}."""
+        current = _current_step.get()
+        if current is None or current[1] is None or not self.enabled:
+            return None
+        test_id, step = current
+        _current_step.set((test_id, None))
+        stages: Dict[str, float] = {}
+        calls: Dict[str, int] = {}
+        with self._lock:
+            spans = [s for s in self._spans if s["test_id"] == test_id and s["step"] == step]
+        for s in spans:
+            stages[s["name"]] = stages.get(s["name"], 0.0) + s["dur"]
+            calls[s["name"]] = calls.get(s["name"], 0) + 1
+        record = {
+            "test_id": test_id,
+            "step": step,
+            "wall": round(max((s["start"] + s["dur"] for s in spans), default=0.0)
+                          - min((s["start"] for s in spans), default=0.0), 4),
+            "stages": {name: round(value, 4) for name, value in sorted(stages.items())},
+            "calls": dict(sorted(calls.items()))
+        }
+        with self._lock:
+            self._steps.append(record)
+        return record
+
+    def _record(self, name: str, start: float, duration: float, args: Dict[str, Any]):
+        current = _current_step.get()
+        with self._lock:
+            self._durations.setdefault(name, []).append(duration)
+            if current is None:
+                # Outside any test: counted in summary() only
+                return
+            test_id, step = current
+            self._spans.append({
+                "name": name,
+                "start": start - self._origin,
+                "dur": duration,
+                "tid": threading.get_ident(),
+                "test_id": test_id,
+                "step": step,
+                "args": args
+            })
+
+    @contextmanager
+    def span(self, name: str, **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter() - start, args)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator: time every call of a sync or async function as span `name`."""
+        def decorator(func: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*a, **kw):
+                    with self.span(name):
+                        return await func(*a, **kw)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*a, **kw):
+                with self.span(name):
+                    return func(*a, **kw)
+            return wrapper
+        return decorator
+
+    # ---- output ----
+    def save(self, test_id: str, out_dir: str) -> Optional[str]:
+        """Write <out_dir>/timings.jsonl and <out_dir>/trace.json for one test, then drop its spans."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            spans = [s for s in self._spans if s["test_id"] == test_id]
+            steps = [r for r in self._steps if r["test_id"] == test_id]
+            self._spans = [s for s in self._spans if s["test_id"] != test_id]
+            self._steps = [r for r in self._steps if r["test_id"] != test_id]
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "timings.jsonl"), "w", encoding="utf-8") as f:
+            for record in steps:
+                f.write(json.dumps(record) + "\n")
+        trace_path = os.path.join(out_dir, "trace.json")
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(spans), f)
+        return trace_path
+
+    @staticmethod
+    def chrome_trace(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Trace Event Format: complete ("X") events in microseconds, one track per thread."""
+        pid = os.getpid()
+        events = []
+        for s in spans:
+            args = dict(s["args"])
+            if s["step"] is not None:
+                args.update({"test_id": s["test_id"], "step": s["step"]})
+            events.append({
+                "name": s["name"],
+                "cat": s["name"].split(".")[0],
+                "ph": "X",
+                "ts": round(s["start"] * 1e6, 1),
+                "dur": round(s["dur"] * 1e6, 1),
+                "pid": pid,
+                "tid": s["tid"],
+                "args": args
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def reset(self):
+        """Forget every span, step record and stage duration (e.g. between benchmark phases)."""
+        with self._lock:
+            self._spans.clear()
+            self._steps.clear()
+            self._durations.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count, total, p50 and p95 (seconds) over everything recorded so far."""
+        with self._lock:
+            durations = {name: list(values) for name, values in self._durations.items()}
+        return {
+            name: {
+                "count": len(values),
+                "total": round(sum(values), 3),
+                "p50": round(_percentile(values, 50), 4),
+                "p95": round(_percentile(values, 95), 4)
+            }
+            for name, values in sorted(durations.items(), key=lambda item: -sum(item[1]))
+        }
+
+    def print_summary(self):
+        stats = self.summary()
+        if not stats:
+            return
+        print(f"{'stage':<24}{'count':>7}{'total s':>10}{'p50 s':>9}{'p95 s':>9}")
+        for name, s in stats.items():
+            print(f"{name:<24}{s['count']:>7}{s['total']:>10.2f}{s['p50']:>9.3f}{s['p95']:>9.3f}")
+
+
+step_timer = StepTimer()
+span = step_timer.span
+timed = step_timer.timed
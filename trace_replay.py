@@ -0,0 +1,130 @@
+# trace_replay.py
+import os
+import json
+import time
+from typing import Dict, List, Optional
+from ui_parser import UISnapshot, element_key, key_similarity
+
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+# Minimum clickable-set similarity for a replay step to count as "same screen"
+REPLAY_MATCH_THRESHOLD = float(os.getenv("REPLAY_MATCH_THRESHOLD", "0.6"))
+
+
+def trace_path(test_id: str, trace_dir: str = TRACE_DIR) -> str:
+    return os.path.join(trace_dir, f"{test_id}.json")
+
+
+def load_trace(test_id: str, trace_dir: str = TRACE_DIR) -> Optional[Dict]:
+    path = trace_path(test_id, trace_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Trace load failed ({path}): {e}")
+        return None
+
+
+def _tap_index_target(action: str, snapshot: UISnapshot) -> Optional[Dict]:
+    if not action.startswith("tap_index|"):
+        return None
+    try:
+        index = int(action.split("|")[1])
+    except ValueError:
+        return None
+    if index == -1:
+        index = len(snapshot.elements) - 1
+    if 0 <= index < len(snapshot.elements):
+        element = snapshot.elements[index]
+        return {"key": element_key(element), "center": list(element["center"])}
+    return None
+
+
+def resolve_target(target: Dict, snapshot: UISnapshot) -> str:
+    """Action for a recorded {"key", "center"} target: the element with the same identity
+    (indices shift when lists change), else the recorded point."""
+    for i, element in enumerate(snapshot.elements):
+        if element_key(element) == target["key"]:
+            return f"tap_index|{i}"
+    x, y = target["center"]
+    return f"tap_xy|{x}|{y}"
+
+
+class TraceRecorder:
+    """Collects (screen fingerprint, action, screen label) per executed step of one test."""
+
+    def __init__(self, test_id: str, goal: str):
+        self.test_id = test_id
+        self.goal = goal
+        self.steps: List[Dict] = []
+
+    def record(self, action: str, snapshot: UISnapshot, screen_label: Optional[str], success: bool):
+        if self.steps:
+            # Screen we landed on is the result of the previous action
+            self.steps[-1]["result_screen"] = screen_label
+        self.steps.append({
+            "action": action,
+            "screen": screen_label,
+            "fingerprint": snapshot.fingerprint,
+            "element_keys": sorted(set(snapshot.element_keys())),
+            "target": _tap_index_target(action, snapshot),
+            "success": success,
+            "result_screen": None
+        })
+
+    def save(self, trace_dir: str = TRACE_DIR, final_screen: Optional[str] = None) -> str:
+        if self.steps and final_screen is not None:
+            self.steps[-1]["result_screen"] = final_screen
+        os.makedirs(trace_dir, exist_ok=True)
+        path = trace_path(self.test_id, trace_dir)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "test_id": self.test_id,
+                "goal": self.goal,
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "steps": self.steps
+            }, f, indent=2)
+        print(f"Trace saved: {path} ({len(self.steps)} steps)")
+        return path
+
+
+class TraceReplayer:
+    """Walks a stored trace, checking each screen against the recorded fingerprint with XML only.
+
+    next_action() returns None once the app diverges (or the trace ends) so the
+    caller can hand control back to the LLM planner.
+    """
+
+    def __init__(self, trace: Dict, threshold: float = REPLAY_MATCH_THRESHOLD):
+        self.trace = trace
+        self.threshold = threshold
+        self.position = 0
+        self.diverged = False
+
+    @property
+    def finished(self) -> bool:
+        return self.diverged or self.position >= len(self.trace.get("steps", []))
+
+    @property
+    def current_screen(self) -> Optional[str]:
+        if self.position == 0 or self.position > len(self.trace.get("steps", [])):
+            return None
+        return self.trace["steps"][self.position - 1].get("screen")
+
+    def next_action(self, snapshot: UISnapshot) -> Optional[str]:
+        if self.finished:
+            return None
+        step = self.trace["steps"][self.position]
+        if snapshot.fingerprint != step["fingerprint"]:
+            similarity = key_similarity(snapshot.element_keys(), step["element_keys"])
+            if similarity < self.threshold:
+                print(f"Replay diverged at step {self.position + 1} (similarity {similarity:.2f})")
+                self.diverged = True
+                return None
+        action = step["action"]
+        target = step.get("target")
+        if target is not None:
+            action = resolve_target(target, snapshot)
+        self.position += 1
+        return action
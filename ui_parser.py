@@ -1,38 +1,562 @@
 # ui_parser.py
 import xml.etree.ElementTree as ET
+import io
 import os
-from typing import List, Dict
+import re
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Union, BinaryIO
+import time
+from adb_helper import dump_ui_hierarchy, dump_ui_hierarchy_bytes, stream_ui_hierarchy
+from step_timing import timed
 
-def get_clickable_elements(xml_path: str = "current_ui.xml") -> List[Dict]:
-    """Parse UI XML and return list of clickable elements with text and center coordinates."""
-    if not os.path.exists(xml_path):
+# How capture_ui_snapshot gets the dump:
+#   tty    → `exec-out uiautomator dump /dev/tty`, parsed in memory (one adb call)
+#   stream → dump to /sdcard, parse `exec-out cat` stdout
+#   pull   → dump to /sdcard, adb pull to current_ui_<serial>.xml, parse the file
+UI_DUMP_MODES = ("tty", "stream", "pull")
+UI_DUMP_MODE = os.getenv("UI_DUMP_MODE", "tty")
+# Keep a current_ui_<serial>.xml copy of in-memory dumps for debugging
+UI_DUMP_SAVE = os.getenv("UI_DUMP_SAVE", "0") == "1"
+# Consecutive non-transient /dev/tty dump failures before a device goes to dump-and-pull for good
+UI_DUMP_TTY_FAILURES = int(os.getenv("UI_DUMP_TTY_FAILURES", "3"))
+# uiautomator errors that mean "busy right now" (animations, window change), not "no /dev/tty support"
+_TTY_TRANSIENT_ERRORS = (b"could not get idle state", b"null root node")
+_tty_failures: Dict[Optional[str], int] = {}
+# Serials that gave up on `uiautomator dump /dev/tty`; they go straight to dump-and-pull
+_tty_unsupported: set = set()
+
+
+def tty_dump_supported(serial: Optional[str] = None) -> bool:
+    return serial not in _tty_unsupported
+
+
+def mark_tty_unsupported(serial: Optional[str] = None):
+    if serial not in _tty_unsupported:
+        _tty_unsupported.add(serial)
+        print(f"UI dump to /dev/tty unsupported on {serial or 'device'} → dump-and-pull from now on")
+
+
+def note_tty_dump(serial: Optional[str], success: bool, output: bytes = b""):
+    """Record one /dev/tty dump attempt for `serial`.
+
+    A success resets the failure count. Transient uiautomator errors only
+    cost that one call; any other failure counts, and UI_DUMP_TTY_FAILURES
+    in a row mark the device unsupported.
+    """
+    if success:
+        _tty_failures.pop(serial, None)
+        return
+    lowered = output.lower()
+    if any(err in lowered for err in _TTY_TRANSIENT_ERRORS):
+        return
+    _tty_failures[serial] = _tty_failures.get(serial, 0) + 1
+    if _tty_failures[serial] >= UI_DUMP_TTY_FAILURES:
+        mark_tty_unsupported(serial)
+
+# Side of one spatial-index cell in device pixels
+GRID_CELL = 200
+
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+# A dump to parse: local file path, raw XML bytes, or a readable binary stream (adb stdout)
+UISource = Union[str, bytes, BinaryIO]
+
+
+def _parse_bounds(bounds: str) -> Optional[Tuple[int, int, int, int]]:
+    match = _BOUNDS_RE.match(bounds)
+    if match is None:
+        return None
+    x1, y1, x2, y2 = map(int, match.groups())
+    return x1, y1, x2, y2
+
+
+def iter_ui_nodes(source: UISource) -> Iterator[Dict[str, str]]:
+    """Stream a uiautomator dump, yielding each <node>'s attributes in document order.
+
+    Built on ET.iterparse: attributes are yielded as soon as the start tag is
+    read, and finished nodes are cleared and detached from their parent so a
+    large dump never sits in memory as a full tree.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        # uiautomator may print a status line after the XML; parse only the document
+        end = source.rfind(b"</hierarchy>")
+        source = io.BytesIO(source[:end + len(b"</hierarchy>")] if end >= 0 else source)
+    stack: List[ET.Element] = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "node":
+                yield dict(elem.attrib)
+            continue
+        stack.pop()
+        elem.clear()
+        if stack:
+            # Finished children are always the parent's first child by now
+            stack[-1].remove(elem)
+
+
+def parse_ui_nodes(source: UISource) -> Optional[List[Dict[str, str]]]:
+    """All node attribute dicts of one dump, or None when it is missing or malformed."""
+    if isinstance(source, str) and not os.path.exists(source):
+        print(f"UI XML not found: {source}")
+        return None
+    try:
+        return list(iter_ui_nodes(source))
+    except Exception as e:
+        print(f"XML parse error: {e}")
+        return None
+
+
+def _clickable_elements(nodes: Iterable[Dict[str, str]]) -> List[Dict]:
+    elements = []
+    for node in nodes:
+        if node.get('clickable') == 'true' or node.get('long-clickable') == 'true':
+            bounds = _parse_bounds(node.get('bounds') or "")
+            text = node.get('text') or node.get('content-desc') or ""
+            resource_id = node.get('resource-id') or ""
+            if bounds:
+                x1, y1, x2, y2 = bounds
+                center_x = (x1 + x2) // 2
+                center_y = (y1 + y2) // 2
+                elements.append({
+                    "index": len(elements),
+                    "text": text.strip(),
+                    "resource_id": resource_id,
+                    "center": (center_x, center_y),
+                    "bounds": (x1, y1, x2, y2)
+                })
+    return elements
+
+@timed("ui.parse")
+def get_clickable_elements(xml_path: UISource = "current_ui.xml") -> List[Dict]:
+    """Parse UI XML (path, bytes or stream) and return clickable elements with text and center coordinates."""
+    if isinstance(xml_path, str) and not os.path.exists(xml_path):
         print(f"UI XML not found: {xml_path}")
         return []
 
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        elements = []
-        for node in root.iter('node'):
-            if node.get('clickable') == 'true' or node.get('long-clickable') == 'true':
-                bounds = node.get('bounds')
-                text = node.get('text') or node.get('content-desc') or ""
-                resource_id = node.get('resource-id') or ""
-                if bounds:
-                    coords = bounds.replace('[', '').replace(']', ',').split(',')
-                    x1, y1, x2, y2 = map(int, coords[:4])
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    elements.append({
-                        "index": len(elements),
-                        "text": text.strip(),
-                        "resource_id": resource_id,
-                        "center": (center_x, center_y),
-                        "bounds": (x1, y1, x2, y2)
-                    })
+        # Streamed: only the clickable elements are ever kept
+        elements = _clickable_elements(iter_ui_nodes(xml_path))
         print(f"Found {len(elements)} clickable elements")
         return elements
     except Exception as e:
         print(f"XML parse error: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+class UINode:
+    """One node of the UI dump, clickable or not.
+
+    clickable_index is the node's position in UISnapshot.elements (what
+    tap_index refers to), or -1 for nodes the clickable filter drops.
+    """
+    __slots__ = ("index", "text", "content_desc", "resource_id", "class_name",
+                 "package", "bounds", "center", "clickable", "clickable_index")
+
+    def __init__(self, index: int, node: Dict[str, str], bounds: Tuple[int, int, int, int], clickable_index: int):
+        self.index = index
+        self.text = (node.get('text') or "").strip()
+        self.content_desc = (node.get('content-desc') or "").strip()
+        self.resource_id = node.get('resource-id') or ""
+        self.class_name = node.get('class') or ""
+        self.package = node.get('package') or ""
+        self.bounds = bounds
+        self.center = ((bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2)
+        self.clickable = clickable_index >= 0
+        self.clickable_index = clickable_index
+
+    @property
+    def width(self) -> int:
+        return self.bounds[2] - self.bounds[0]
+
+    @property
+    def height(self) -> int:
+        return self.bounds[3] - self.bounds[1]
+
+    def __repr__(self) -> str:
+        return f"UINode({self.index}, {self.text or self.content_desc or self.resource_id!r}, {self.bounds})"
+
+
+class ElementStore:
+    """Every node of one UI dump with lookups by text, resource-id and position.
+
+    Text and content-desc are indexed lowercased (exact match is a dict hit,
+    substring match scans distinct strings only), and bounds/centers go into a
+    GRID_CELL-sized grid so region and nearest-point queries only touch nearby
+    nodes. Results are always in document order, matching tap_index order.
+    """
+
+    def __init__(self, nodes: Optional[List[Dict[str, str]]], cell: int = GRID_CELL):
+        self.cell = cell
+        self.nodes: List[UINode] = []
+        self._by_text: Dict[str, List[int]] = {}
+        self._by_resource_id: Dict[str, List[int]] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._center_cells: Dict[Tuple[int, int], List[int]] = {}
+        if nodes is None:
+            return
+        clickable_count = 0
+        for node in nodes:
+            bounds = _parse_bounds(node.get('bounds') or "")
+            if bounds is None:
+                continue
+            clickable_index = -1
+            if node.get('clickable') == 'true' or node.get('long-clickable') == 'true':
+                clickable_index = clickable_count
+                clickable_count += 1
+            self._add(UINode(len(self.nodes), node, bounds, clickable_index))
+
+    def _add(self, item: UINode):
+        i = item.index
+        self.nodes.append(item)
+        for value in {item.text.lower(), item.content_desc.lower()}:
+            if value:
+                self._by_text.setdefault(value, []).append(i)
+        if item.resource_id:
+            self._by_resource_id.setdefault(item.resource_id, []).append(i)
+        x1, y1, x2, y2 = item.bounds
+        for cx in range(max(x1, 0) // self.cell, max(x2 - 1, 0) // self.cell + 1):
+            for cy in range(max(y1, 0) // self.cell, max(y2 - 1, 0) // self.cell + 1):
+                self._cells.setdefault((cx, cy), []).append(i)
+        self._center_cells.setdefault(self._cell_of(*item.center), []).append(i)
+
+    def _cell_of(self, x: int, y: int) -> Tuple[int, int]:
+        return max(x, 0) // self.cell, max(y, 0) // self.cell
+
+    def _select(self, indices, clickable_only: bool) -> List[UINode]:
+        nodes = [self.nodes[i] for i in sorted(indices)]
+        return [n for n in nodes if n.clickable] if clickable_only else nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def clickable(self) -> List[UINode]:
+        return [n for n in self.nodes if n.clickable]
+
+    def find_text(self, needle: str, exact: bool = False, clickable_only: bool = False) -> List[UINode]:
+        """Nodes whose text or content-desc equals (exact) or contains `needle`, case-insensitive."""
+        needle = needle.lower().strip()
+        if exact:
+            return self._select(self._by_text.get(needle, []), clickable_only)
+        found = set()
+        for value, indices in self._by_text.items():
+            if needle in value:
+                found.update(indices)
+        return self._select(found, clickable_only)
+
+    def find_resource_id(self, resource_id: str, clickable_only: bool = False) -> List[UINode]:
+        """Nodes with this full resource-id, or ending in ":id/<resource_id>" for a bare id."""
+        indices = self._by_resource_id.get(resource_id)
+        if indices is None:
+            suffix = f":id/{resource_id}"
+            indices = [i for rid, ids in self._by_resource_id.items() if rid.endswith(suffix) for i in ids]
+        return self._select(indices, clickable_only)
+
+    def find_in_region(
+        self,
+        x1: int,
+        y1: int,
+        x2: int,
+        y2: int,
+        contained: bool = False,
+        clickable_only: bool = False
+    ) -> List[UINode]:
+        """Nodes overlapping the rectangle, or lying fully inside it when `contained`."""
+        candidates = set()
+        cx1, cy1 = self._cell_of(x1, y1)
+        cx2, cy2 = self._cell_of(max(x2 - 1, x1), max(y2 - 1, y1))
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                candidates.update(self._cells.get((cx, cy), ()))
+        found = []
+        for i in candidates:
+            nx1, ny1, nx2, ny2 = self.nodes[i].bounds
+            if contained:
+                hit = nx1 >= x1 and ny1 >= y1 and nx2 <= x2 and ny2 <= y2
+            else:
+                hit = nx1 < x2 and nx2 > x1 and ny1 < y2 and ny2 > y1
+            if hit:
+                found.append(i)
+        return self._select(found, clickable_only)
+
+    def nearest_to(self, x: int, y: int, clickable_only: bool = True) -> Optional[UINode]:
+        """Node whose center is closest to (x, y), searching grid rings outward."""
+        if not self.nodes:
+            return None
+        px, py = self._cell_of(x, y)
+        max_ring = max(max(k[0] for k in self._center_cells), max(k[1] for k in self._center_cells),
+                       px, py) + 1
+        best, best_dist = None, None
+        for ring in range(max_ring + 1):
+            # Anything in this ring is at least (ring - 1) cells away
+            if best_dist is not None and ((ring - 1) * self.cell) ** 2 > best_dist:
+                break
+            for cx in range(px - ring, px + ring + 1):
+                for cy in range(py - ring, py + ring + 1):
+                    if max(abs(cx - px), abs(cy - py)) != ring:
+                        continue
+                    for i in self._center_cells.get((cx, cy), ()):
+                        node = self.nodes[i]
+                        if clickable_only and not node.clickable:
+                            continue
+                        dist = (node.center[0] - x) ** 2 + (node.center[1] - y) ** 2
+                        if best_dist is None or dist < best_dist or (dist == best_dist and i < best.index):
+                            best, best_dist = node, dist
+        return best
+
+
+class UISnapshot:
+    """One step's view of the screen: a single UI dump parsed once, plus the screenshot.
+
+    Planner, Supervisor and Executor all read from the same snapshot, so a
+    tap_index resolves against exactly the elements the planner saw.
+    `nodes` holds every node's attributes in document order (None = no dump).
+    """
+
+    def __init__(self, nodes: Optional[List[Dict[str, str]]], screenshot: Any = None):
+        self.nodes = nodes
+        self.screenshot = screenshot
+        self.elements = _clickable_elements(nodes) if nodes is not None else []
+        texts = []
+        self.packages = set()
+        if nodes is not None:
+            for node in nodes:
+                for attr in ('text', 'content-desc', 'resource-id', 'hint'):
+                    value = node.get(attr)
+                    if value:
+                        texts.append(value)
+                if node.get('package'):
+                    self.packages.add(node.get('package'))
+        # Lowercase text index for cheap "is X on screen" checks
+        self.text_index = "\n".join(texts + sorted(self.packages)).lower()
+        self._structure_hash: Optional[str] = None
+        self._store: Optional[ElementStore] = None
+
+    @property
+    def store(self) -> ElementStore:
+        """Indexed view of every node (built on first use)."""
+        if self._store is None:
+            self._store = ElementStore(self.nodes)
+        return self._store
+
+    @property
+    def structure_hash(self) -> str:
+        """Hash of every node's identity, text, bounds and state; equal hashes mean the UI didn't move."""
+        if self._structure_hash is None:
+            digest = hashlib.sha1()
+            if self.nodes is not None:
+                for node in self.nodes:
+                    for attr in ('class', 'resource-id', 'text', 'content-desc', 'bounds',
+                                 'checked', 'selected', 'focused', 'enabled'):
+                        digest.update((node.get(attr) or "").encode("utf-8"))
+                        digest.update(b"\x1f")
+                    digest.update(b"\x1e")
+            self._structure_hash = digest.hexdigest()
+        return self._structure_hash
+
+    def contains_text(self, needle: str) -> bool:
+        return needle.lower() in self.text_index
+
+    def element_keys(self) -> List[str]:
+        """Stable "resource-id|text" key per clickable element (bounds ignored)."""
+        return [element_key(e) for e in self.elements]
+
+    @property
+    def fingerprint(self) -> str:
+        """Short screen identity: hash of the sorted clickable element keys."""
+        return hashlib.sha1("\n".join(sorted(set(self.element_keys()))).encode("utf-8")).hexdigest()[:16]
+
+
+def element_key(element: Dict) -> str:
+    return f"{element.get('resource_id', '')}|{(element.get('text') or '').lower()}"
+
+
+def key_similarity(a: List[str], b: List[str]) -> float:
+    """Jaccard similarity of two element-key lists (1.0 = same clickable set)."""
+    set_a, set_b = set(a), set(b)
+    if not set_a and not set_b:
+        return 1.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+
+def _node_label(node: UINode) -> str:
+    return node.text or node.content_desc or node.resource_id.split("/")[-1] or node.class_name.split(".")[-1]
+
+
+class UIDiff:
+    """What changed between two snapshots: added, removed and moved nodes.
+
+    Only nodes that carry an identity (text, content-desc, resource-id) or are
+    clickable take part; anonymous layout containers would just add noise.
+    `moved` holds (before, after) node pairs with the same identity but new bounds.
+    """
+
+    def __init__(self, added: List[UINode], removed: List[UINode], moved: List[Tuple[UINode, UINode]], unchanged: int):
+        self.added = added
+        self.removed = removed
+        self.moved = moved
+        self.unchanged = unchanged
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.moved)
+
+    def summary(self, limit: int = 4) -> str:
+        """Compact one-line delta for history entries and prompts."""
+        if not self.changed:
+            return "no change"
+
+        def labels(nodes: List[UINode]) -> str:
+            names = [_node_label(n) for n in nodes[:limit]]
+            more = ", …" if len(nodes) > limit else ""
+            return ", ".join(repr(n) for n in names) + more
+
+        parts = []
+        if self.added:
+            parts.append(f"+{len(self.added)} ({labels(self.added)})")
+        if self.removed:
+            parts.append(f"-{len(self.removed)} ({labels(self.removed)})")
+        if self.moved:
+            parts.append(f"~{len(self.moved)} moved ({labels([after for _, after in self.moved])})")
+        return " ".join(parts)
+
+
+def _diff_identity(node: UINode) -> str:
+    return f"{node.class_name}|{node.resource_id}|{node.text}|{node.content_desc}"
+
+
+def _diff_exact_key(node: UINode) -> str:
+    return f"{_diff_identity(node)}|{node.bounds}"
+
+
+def _diff_groups(store: ElementStore, key) -> Dict[str, List[UINode]]:
+    groups: Dict[str, List[UINode]] = {}
+    for node in store.nodes:
+        if node.clickable or node.text or node.content_desc or node.resource_id:
+            groups.setdefault(key(node), []).append(node)
+    return groups
+
+
+def diff_snapshots(before: Optional[UISnapshot], after: UISnapshot) -> UIDiff:
+    """Tree diff in O(n): nodes are matched by identity + bounds first, then by identity alone (moved)."""
+    if before is None or before.nodes is None or after.nodes is None:
+        return UIDiff([], [], [], 0)
+    old_groups = _diff_groups(before.store, _diff_exact_key)
+    new_groups = _diff_groups(after.store, _diff_exact_key)
+    unchanged = 0
+    old_left: Dict[str, List[UINode]] = {}
+    new_left: List[UINode] = []
+    for key, new_nodes in new_groups.items():
+        old_nodes = old_groups.pop(key, [])
+        paired = min(len(old_nodes), len(new_nodes))
+        unchanged += paired
+        new_left.extend(new_nodes[paired:])
+        for node in old_nodes[paired:]:
+            old_left.setdefault(_diff_identity(node), []).append(node)
+    for old_nodes in old_groups.values():
+        for node in old_nodes:
+            old_left.setdefault(_diff_identity(node), []).append(node)
+    for nodes in old_left.values():
+        nodes.sort(key=lambda n: n.index)
+
+    added, moved = [], []
+    for node in sorted(new_left, key=lambda n: n.index):
+        candidates = old_left.get(_diff_identity(node))
+        if candidates:
+            moved.append((candidates.pop(0), node))
+        else:
+            added.append(node)
+    removed = sorted((n for nodes in old_left.values() for n in nodes), key=lambda n: n.index)
+    return UIDiff(added, removed, moved, unchanged)
+
+
+@timed("ui.parse")
+def load_ui_snapshot(xml_path: UISource = "current_ui.xml", screenshot: Any = None) -> UISnapshot:
+    """Parse a dump from a file path, bytes or a binary stream into a UISnapshot."""
+    snapshot = UISnapshot(parse_ui_nodes(xml_path), screenshot)
+    print(f"Found {len(snapshot.elements)} clickable elements")
+    return snapshot
+
+
+def ui_xml_path(serial: Optional[str] = None) -> str:
+    """Local dump file; one per device so parallel workers don't overwrite each other."""
+    if not serial:
+        return "current_ui.xml"
+    return f"current_ui_{serial.replace(':', '_')}.xml"
+
+
+def save_ui_xml(data: bytes, xml_path: str):
+    try:
+        with open(xml_path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        print(f"UI XML save failed ({xml_path}): {e}")
+
+
+def capture_ui_snapshot(
+    screenshot: Any = None,
+    xml_path: Optional[str] = None,
+    serial: Optional[str] = None,
+    mode: Optional[str] = None,
+    save: Optional[bool] = None
+) -> UISnapshot:
+    """Dump the UI hierarchy once and parse it into a UISnapshot.
+
+    `mode` is one of UI_DUMP_MODES (default UI_DUMP_MODE). In-memory modes
+    write `xml_path` (default current_ui_<serial>.xml) only when `save` /
+    UI_DUMP_SAVE is set; a failed /dev/tty dump falls back to dump-and-pull
+    for that call, and a device that keeps failing (see note_tty_dump) skips
+    the /dev/tty attempt from then on.
+    """
+    mode = mode or UI_DUMP_MODE
+    save = UI_DUMP_SAVE if save is None else save
+    if mode == "tty" and not tty_dump_supported(serial):
+        mode = "pull"
+    if mode == "tty":
+        success, data = dump_ui_hierarchy_bytes(serial)
+        note_tty_dump(serial, success, data)
+        if success:
+            if save:
+                save_ui_xml(data, xml_path or ui_xml_path(serial))
+            return load_ui_snapshot(data, screenshot)
+        print("Falling back to dump-and-pull")
+        mode = "pull"
+    if mode == "stream":
+        proc = stream_ui_hierarchy(serial=serial)
+        if proc is None:
+            return UISnapshot(None, screenshot)
+        try:
+            snapshot = load_ui_snapshot(proc.stdout, screenshot)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        return snapshot
+    path = dump_ui_hierarchy(local_path=xml_path or ui_xml_path(serial), serial=serial)
+    if path is None:
+        return UISnapshot(None, screenshot)
+    return load_ui_snapshot(path, screenshot)
+
+
+def time_ui_capture(serial: Optional[str] = None, runs: int = 5) -> Dict[str, float]:
+    """Mean seconds per capture_ui_snapshot call for each dump mode on a live device."""
+    timings = {}
+    for mode in UI_DUMP_MODES:
+        start = time.perf_counter()
+        for _ in range(runs):
+            capture_ui_snapshot(serial=serial, mode=mode)
+        timings[mode] = round((time.perf_counter() - start) / runs, 3)
+    return timings
+
+
+if __name__ == "__main__":
+    import sys
+    # Timing comparison of the dump paths: python ui_parser.py [serial] [runs]
+    results = time_ui_capture(
+        serial=sys.argv[1] if len(sys.argv) > 1 else None,
+        runs=int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    )
+    baseline = results["pull"]
+    for mode, seconds in results.items():
+        print(f"{mode:>6}: {seconds:.3f}s/capture ({baseline / seconds if seconds else 0:.1f}x vs pull)")
@@ -0,0 +1,175 @@
+# vision_stub.py
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+# Scripted answers: JSON list of {"match": "<substring of the prompt>", "answer": "<text>"}
+# (first match wins; an "answers" list instead of "answer" is cycled through per call)
+STUB_VISION_SCRIPT = os.getenv("STUB_VISION_SCRIPT")
+STUB_VISION_LATENCY = float(os.getenv("STUB_VISION_LATENCY", "0.05"))
+# Simulated decode time per output token. With an answer format the stub "generates" up to
+# its max_output_tokens, like a model that keeps talking after the answer
+STUB_VISION_TOKEN_LATENCY = float(os.getenv("STUB_VISION_TOKEN_LATENCY", "0.002"))
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 4
+
+# Used when no script rule matches: keeps the agent loops moving without ever passing
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"match": '"screen"', "answer": '{"screen": "config", "completed": false, "pass": false, '
+                                    '"reason": "stub", "tap": null}'},
+    {"match": '"completed"', "answer": '{"completed": false, "pass": false, "reason": "stub"}'},
+    {"match": '"x"', "answer": '{"x": 640, "y": 1200}'},
+    {"match": "", "answer": "config"},
+]
+
+
+class _Part:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Feedback:
+    block_reason = None
+
+
+class StubResponse:
+    """Just enough of a generate_content response for gemini_helper._response_text."""
+
+    def __init__(self, text: str):
+        self.parts = [_Part(text)]
+        self.prompt_feedback = _Feedback()
+        self.text = text
+
+
+class _StubChunk:
+    def __init__(self, text: str):
+        self.parts = [_Part(text)]
+
+
+class StubStream:
+    """generate_content(stream=True) stand-in: the answer, then whitespace up to the token cap,
+    one chunk per STREAM_CHUNK_TOKENS tokens. close()/aclose() before the end counts as a cancel."""
+
+    def __init__(self, backend: "StubVisionBackend", text: str, tokens: int):
+        self.backend = backend
+        step = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+        text = text.ljust(tokens * CHARS_PER_TOKEN)
+        self._chunks = [text[i:i + step] for i in range(0, len(text), step)]
+        self._position = 0
+        self._closed = False
+
+    def _next_chunk(self) -> Optional[_StubChunk]:
+        if self._closed or self._position >= len(self._chunks):
+            return None
+        chunk = self._chunks[self._position]
+        self._position += 1
+        self.backend._count("tokens_streamed", max(1, len(chunk) // CHARS_PER_TOKEN))
+        return _StubChunk(chunk)
+
+    def _close(self):
+        if not self._closed and self._position < len(self._chunks):
+            self.backend._count("streams_cancelled")
+        self._closed = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> _StubChunk:
+        time.sleep(STREAM_CHUNK_TOKENS * STUB_VISION_TOKEN_LATENCY)
+        chunk = self._next_chunk()
+        if chunk is None:
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        self._close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> _StubChunk:
+        await asyncio.sleep(STREAM_CHUNK_TOKENS * STUB_VISION_TOKEN_LATENCY)
+        chunk = self._next_chunk()
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        self._close()
+
+
+class StubVisionBackend:
+    """Offline vision backend: scripted answers after a fixed simulated latency.
+
+    Install with gemini_helper.set_vision_backend(), or VISION_BACKEND=stub.
+    """
+
+    model_name = "stub"
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, latency: float = STUB_VISION_LATENCY):
+        self.rules = list(rules or []) + DEFAULT_RULES
+        self.latency = latency
+        self.calls = 0
+        self.tokens_streamed = 0
+        self.streams_cancelled = 0
+        self._counters: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "StubVisionBackend":
+        rules = None
+        if STUB_VISION_SCRIPT:
+            with open(STUB_VISION_SCRIPT, "r", encoding="utf-8") as f:
+                rules = json.load(f)
+        return cls(rules)
+
+    def answer(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            for i, rule in enumerate(self.rules):
+                if rule.get("match", "") in prompt:
+                    if "answers" in rule:
+                        n = self._counters.get(i, 0)
+                        self._counters[i] = n + 1
+                        return rule["answers"][n % len(rule["answers"])]
+                    return rule["answer"]
+        return ""
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    @staticmethod
+    def _output_tokens(text: str, answer: Any) -> int:
+        """Tokens the simulated model emits: up to the answer format's cap, else just the text."""
+        needed = -(-len(text) // CHARS_PER_TOKEN)
+        return max(needed, answer.max_output_tokens) if answer is not None else needed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "tokens_streamed": self.tokens_streamed,
+                    "streams_cancelled": self.streams_cancelled}
+
+    def generate(self, prompt: str, payload: Any, temperature: float,
+                 answer: Any = None, stream: bool = False) -> Union[StubResponse, StubStream]:
+        """`answer` is gemini_helper.AnswerFormat (sets the output length); `stream` returns a StubStream."""
+        time.sleep(self.latency)
+        text = self.answer(prompt)
+        tokens = self._output_tokens(text, answer)
+        if stream:
+            return StubStream(self, text, tokens)
+        time.sleep(tokens * STUB_VISION_TOKEN_LATENCY)
+        return StubResponse(text)
+
+    async def generate_async(self, prompt: str, payload: Any, temperature: float,
+                             answer: Any = None, stream: bool = False) -> Union[StubResponse, StubStream]:
+        await asyncio.sleep(self.latency)
+        text = self.answer(prompt)
+        tokens = self._output_tokens(text, answer)
+        if stream:
+            return StubStream(self, text, tokens)
+        await asyncio.sleep(tokens * STUB_VISION_TOKEN_LATENCY)
+        return StubResponse(text)